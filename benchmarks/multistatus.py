@@ -0,0 +1,97 @@
+# Refactoring, Django 1.11 compatibility, cleanups, bugfixes (c) 2018 Christian Kreuzberger <ckreuzberger@anexia-it.com>
+# All rights reserved.
+#
+# Portions (c) 2014, Alexander Klimenko <alex@erix.ru>
+# All rights reserved.
+#
+# Copyright (c) 2011, SmartFile <btimby@smartfile.com>
+# All rights reserved.
+#
+# This file is part of DjangoDav.
+#
+# DjangoDav is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DjangoDav is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with DjangoDav.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Compares encoding PROPFIND multistatus bodies with lxml elements (get_property_tag_list and etree.tostring, as
+DavView does with xml_fast_multistatus = False) and with djangodav.multistatus.MultiStatusWriter
+(reading the properties through djangodav.properties.PropertyRegistry).
+
+    python benchmarks/multistatus.py [entries ...]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lxml import etree
+
+from djangodav.multistatus import MultiStatusWriter
+from djangodav.properties import PropertyRegistry
+from djangodav.utils import D, get_property_tag_list
+
+
+class Resource(object):
+    ALL_PROPS = ['getcontentlength', 'creationdate', 'getlastmodified', 'resourcetype', 'displayname']
+
+    def __init__(self, i):
+        self.is_collection = i % 10 == 0
+        self.displayname = 'file & name %d.txt' % i
+        self.href = '/dav/some/collection/file%%20%d.txt' % i
+        self.getcontentlength = i * 17
+        self.creationdate = '1983-12-24T06:00:00Z'
+        self.getlastmodified = 'Wed, 24 Dec 2014 06:00:00 +0000'
+
+
+def encode_lxml(resources):
+    return etree.tostring(D.multistatus(*(
+        D.response(
+            D.href(res.href),
+            D.propstat(
+                D.prop(*get_property_tag_list(res, *res.ALL_PROPS)),
+                D.status('HTTP/1.1 200 OK'),
+            ),
+        )
+        for res in resources
+    )), xml_declaration=True, pretty_print=False, encoding='utf-8')
+
+
+def encode_writer(resources):
+    writer = MultiStatusWriter('utf-8')
+    return writer.document(
+        writer.prop_response(res.href, props) for res, props in PropertyRegistry().iter_properties(resources)
+    )
+
+
+def best_of(func, resources, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(resources)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(counts):
+    for count in counts:
+        resources = [Resource(i) for i in range(count)]
+        assert encode_lxml(resources) == encode_writer(resources)
+        lxml_time = best_of(encode_lxml, resources)
+        writer_time = best_of(encode_writer, resources)
+        print('%7d entries: lxml %.3fs, writer %.3fs, %.1fx faster' % (
+            count, lxml_time, writer_time, lxml_time / writer_time
+        ))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [10000, 100000])
@@ -0,0 +1,131 @@
+# Refactoring, Django 1.11 compatibility, cleanups, bugfixes (c) 2018 Christian Kreuzberger <ckreuzberger@anexia-it.com>
+# All rights reserved.
+#
+# Portions (c) 2014, Alexander Klimenko <alex@erix.ru>
+# All rights reserved.
+#
+# Copyright (c) 2011, SmartFile <btimby@smartfile.com>
+# All rights reserved.
+#
+# This file is part of DjangoDav.
+#
+# DjangoDav is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DjangoDav is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with DjangoDav.  If not, see <http://www.gnu.org/licenses/>.
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections
+
+
+# maximum number of threads running blocking (file system) calls for async views and resources
+DJANGODAV_ASYNC_WORKERS = getattr(settings, 'DJANGODAV_ASYNC_WORKERS', 32)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the bounded thread pool shared by all async views and resources"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=DJANGODAV_ASYNC_WORKERS,
+                                               thread_name_prefix='djangodav')
+    return _executor
+
+
+def run_job(func, *args, **kwargs):
+    """
+    Run a job of the executor. Django does not manage the database connections of the executor threads, so they
+    are closed if unusable or obsolete (CONN_MAX_AGE, CONN_HEALTH_CHECKS) before and after each job, like Django
+    does at the start and end of a request.
+    """
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_in_executor(func, *args, **kwargs):
+    """Run a blocking function in the executor and await its result"""
+    return await asyncio.get_running_loop().run_in_executor(get_executor(), partial(run_job, func, *args, **kwargs))
+
+
+class AsyncIterator(object):
+    """Turns a blocking iterator (e.g. the chunks of a file) into an async iterator, each step runs in the
+    executor. close() is passed on to the iterator."""
+    _done = object()
+
+    def __init__(self, iterator):
+        self.iterator = iter(iterator)
+        self.close = getattr(iterator, 'close', lambda: None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        chunk = await run_in_executor(next, self.iterator, self._done)
+        if chunk is self._done:
+            raise StopAsyncIteration
+        return chunk
+
+
+class AsyncFileIterator(AsyncIterator):
+    """Reads a file in chunks as an async iterator, the file is closed once it is exhausted"""
+
+    def __init__(self, file, chunk_size=64 * 1024):
+        self.file = file
+        super(AsyncFileIterator, self).__init__(iter(partial(file.read, chunk_size), b''))
+        self.close = file.close
+
+    async def __anext__(self):
+        try:
+            return await super(AsyncFileIterator, self).__anext__()
+        except StopAsyncIteration:
+            await run_in_executor(self.file.close)
+            raise
+
+
+class AsyncDavResourceMixIn(object):
+    """
+    Async variants of the blocking methods of a resource, running them in the executor. Mix into a resource class,
+    e.g. ``class MyResource(AsyncDavResourceMixIn, DummyFSDAVResource)``.
+    """
+    read_chunk_size = 64 * 1024
+
+    async def aexists(self):
+        return await run_in_executor(lambda: self.exists)
+
+    async def aget_children(self):
+        return await run_in_executor(lambda: list(self.get_children()))
+
+    async def aget_descendants(self, *args, **kwargs):
+        return await run_in_executor(lambda: list(self.get_descendants(*args, **kwargs)))
+
+    async def aread(self):
+        """Return the content as an async iterator of chunks"""
+        content = await run_in_executor(self.read)
+        if hasattr(content, 'read'):
+            return AsyncFileIterator(content, self.read_chunk_size)
+        return AsyncIterator(content)
+
+    async def awrite(self, *args, **kwargs):
+        return await run_in_executor(self.write, *args, **kwargs)
+
+    async def adelete(self):
+        return await run_in_executor(self.delete)
@@ -0,0 +1,86 @@
+# Refactoring, Django 1.11 compatibility, cleanups, bugfixes (c) 2018 Christian Kreuzberger <ckreuzberger@anexia-it.com>
+# All rights reserved.
+#
+# Portions (c) 2014, Alexander Klimenko <alex@erix.ru>
+# All rights reserved.
+#
+# Copyright (c) 2011, SmartFile <btimby@smartfile.com>
+# All rights reserved.
+#
+# This file is part of DjangoDav.
+#
+# DjangoDav is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DjangoDav is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with DjangoDav.  If not, see <http://www.gnu.org/licenses/>.
+from urllib.parse import quote, unquote
+
+
+class InvalidSyncToken(Exception):
+    """The sync token is unknown or older than the changes kept in the journal."""
+
+
+class BaseChangeJournal(object):
+    """
+    Append-only journal of the changes of resources, used for the sync-collection REPORT (RFC 6578). Every change is
+    recorded with an increasing sequence number, the sync token of a collection is the latest sequence number, so the
+    changes since a token are found without looking at the tree.
+    """
+    MODIFIED = 'modified'
+    DELETED = 'deleted'
+
+    token_prefix = 'http://djangodav/ns/sync/'
+
+    def record(self, resources, change, collection=None):
+        """Records the change (MODIFIED or DELETED) of each of the resources, collection overrides whether they are
+        collections (e.g. for resources that were deleted already)."""
+        raise NotImplementedError()
+
+    def get_sequence(self):
+        """Returns the latest sequence number, 0 if nothing was recorded yet."""
+        raise NotImplementedError()
+
+    def get_changes(self, resource, sequence, infinite=False, limit=None):
+        """
+        Returns the changes of the members of the collection resource (of all resources within it, if infinite) after
+        sequence, as a list of (path, change, is_collection, sequence) tuples ordered by sequence, with the latest
+        change of each path only. With limit, at most limit paths are returned.
+        :raises InvalidSyncToken: if changes after sequence are no longer in the journal
+        """
+        raise NotImplementedError()
+
+    def get_token(self, sequence, after=None):
+        """Returns the sync token of sequence. after is the path of the last member reported by an initial sync that
+        was truncated by a limit ('' if none was), the listing continues after it with the token."""
+        token = '%s%d' % (self.token_prefix, sequence)
+        if after is not None:
+            token += '?after=' + quote(after, safe='')
+        return token
+
+    def split_token(self, token):
+        """Returns the sequence number of a sync token and the path an initial sync continues after (None if the
+        initial sync was complete)
+        :raises InvalidSyncToken: if token was not issued by this journal"""
+        if not token.startswith(self.token_prefix):
+            raise InvalidSyncToken(token)
+        sequence, separator, after = token[len(self.token_prefix):].partition('?after=')
+        try:
+            sequence = int(sequence)
+        except ValueError:
+            raise InvalidSyncToken(token)
+        if sequence < 0 or sequence > self.get_sequence():
+            raise InvalidSyncToken(token)
+        return sequence, unquote(after) if separator else None
+
+    def parse_token(self, token):
+        """Returns the sequence number of a sync token
+        :raises InvalidSyncToken: if token was not issued by this journal"""
+        return self.split_token(token)[0]
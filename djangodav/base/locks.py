@@ -39,6 +39,21 @@ class BaseLock(object):
         """Releases the lock referenced by the given lock id."""
         raise NotImplementedError()
 
+    def refresh(self, token, timeout):
+        """Extends the active lock covering the resource referenced by the given token to expire timeout seconds
+        from now. Returns the lock (with token, scope, type, depth, owner and timeout attributes), or None if there
+        is no such lock."""
+        raise NotImplementedError()
+
+    def has_token(self, token):
+        """Returns True if the given token identifies an active lock covering the resource."""
+        raise NotImplementedError()
+
+    def can_write(self, tokens, recursive=False):
+        """Returns True if the resource (and with recursive all resources within it) may be modified by a request
+        submitting the given lock tokens."""
+        raise NotImplementedError()
+
     def del_locks(self):
         """Releases all locks for the given resource."""
         raise NotImplementedError()
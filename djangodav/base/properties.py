@@ -0,0 +1,51 @@
+# Refactoring, Django 1.11 compatibility, cleanups, bugfixes (c) 2018 Christian Kreuzberger <ckreuzberger@anexia-it.com>
+# All rights reserved.
+#
+# Portions (c) 2014, Alexander Klimenko <alex@erix.ru>
+# All rights reserved.
+#
+# Copyright (c) 2011, SmartFile <btimby@smartfile.com>
+# All rights reserved.
+#
+# This file is part of DjangoDav.
+#
+# DjangoDav is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DjangoDav is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with DjangoDav.  If not, see <http://www.gnu.org/licenses/>.
+
+
+class BaseDeadPropertyStore(object):
+    """
+    Stores dead properties (properties set by clients with PROPPATCH) of resources. Properties are identified by
+    their name in Clark notation ("{namespace}name"), their value is the serialized XML element.
+    """
+
+    def get_many(self, resources):
+        """Returns a dict mapping names to values of the dead properties for each of the given resources."""
+        raise NotImplementedError()
+
+    def update(self, resource, set_props, remove_props):
+        """Sets the properties of the dict set_props and removes the names remove_props of the resource, either all or
+        none of them."""
+        raise NotImplementedError()
+
+    def copy(self, resource, destination):
+        """Copies the properties of the resource (and of all resources within it) to destination."""
+        raise NotImplementedError()
+
+    def move(self, resource, destination):
+        """Moves the properties of the resource (and of all resources within it) to destination."""
+        raise NotImplementedError()
+
+    def delete(self, resource):
+        """Deletes the properties of the resource and of all resources within it."""
+        raise NotImplementedError()
@@ -21,6 +21,7 @@
 #
 # You should have received a copy of the GNU Affero General Public License
 # along with DjangoDav.  If not, see <http://www.gnu.org/licenses/>.
+import os
 from hashlib import md5
 from mimetypes import guess_type
 
@@ -113,7 +114,7 @@ class BaseDavResource(object):
         if self.is_collection:
             if not destination.exists or not destination.is_collection:
                 destination.create_collection()
-            self.copy_collection(destination, depth)
+            return self.copy_collection(destination, depth)
         else:
             if destination.is_object:
                 destination.delete()
@@ -139,7 +140,7 @@ class BaseDavResource(object):
         if self.is_collection:
             if not destination.exists or not destination.is_collection:
                 destination.create_collection()
-            self.move_collection(destination)
+            return self.move_collection(destination)
         else:
             if destination.is_object:
                 destination.delete()
@@ -165,6 +166,39 @@ class BaseDavResource(object):
     def read(self):
         raise NotImplementedError()
 
+    def get_listing_token(self):
+        """Return a value that changes whenever members are added to or removed from the collection (see
+        djangodav.cache)."""
+        raise NotImplementedError()
+
+    def get_listing_state(self, child):
+        """Return the picklable data the properties of the child are computed from."""
+        raise NotImplementedError()
+
+    def restore_listing_child(self, name, state):
+        """Return the child resource called name, seeded with the state of get_listing_state."""
+        raise NotImplementedError()
+
+    def invalidate_listing(self):
+        """Called by the view after the resource (and with it the listing of its parent) was modified, to drop
+        cached listings (see djangodav.cache)."""
+        pass
+
+    def get_storage_path(self):
+        """Return the absolute file system path of the content of an object, used to let the web server send
+        the file (see djangodav.offload), or None if the content is not stored in a file. Defaults to the name of
+        the file returned by read() (e.g. the FieldFile of a FileField), a relative name is relative to root."""
+        try:
+            content = self.read()
+        except NotImplementedError:
+            return None
+        name = getattr(content, 'name', None)
+        if not getattr(content, 'closed', True):
+            content.close()
+        if not name or not isinstance(name, str):
+            return None
+        return os.path.join(getattr(self, 'root', None) or '/', name)
+
     @property
     def is_collection(self):
         raise NotImplementedError()
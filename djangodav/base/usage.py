@@ -0,0 +1,163 @@
+# Refactoring, Django 1.11 compatibility, cleanups, bugfixes (c) 2018 Christian Kreuzberger <ckreuzberger@anexia-it.com>
+# All rights reserved.
+#
+# Portions (c) 2014, Alexander Klimenko <alex@erix.ru>
+# All rights reserved.
+#
+# Copyright (c) 2011, SmartFile <btimby@smartfile.com>
+# All rights reserved.
+#
+# This file is part of DjangoDav.
+#
+# DjangoDav is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DjangoDav is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with DjangoDav.  If not, see <http://www.gnu.org/licenses/>.
+
+
+class BaseUsageStore(object):
+    """
+    Keeps the number of bytes and files (objects) within every collection, so quota-used-bytes and
+    quota-available-bytes (RFC 4331) are looked up instead of computed by walking the tree. The view updates the
+    counters incrementally on PUT, DELETE, COPY and MOVE, adding the difference to the counters of all ancestors of
+    the modified resource.
+
+    Counters are kept by the path of the collection ("/" for the root, "/a/b"), collections without counters are
+    empty. Quotas can be set on any collection, the quota of the root defaults to the quota attribute. Trees that
+    existed (or were modified outside of djangodav) before the counters were kept are counted with rebuild.
+    """
+    # quota of the root collection in bytes, None for no limit
+    quota = None
+
+    def __init__(self, quota=None):
+        if quota is not None:
+            self.quota = quota
+
+    def get_counters(self, paths):
+        """Returns a dict mapping the given paths to (bytes, files, quota) tuples of the collections with counters."""
+        raise NotImplementedError()
+
+    def add_counters(self, paths, nbytes, files):
+        """Adds nbytes and files to the counters of the collections paths, creating missing counters."""
+        raise NotImplementedError()
+
+    def reset_counters(self, path, counters):
+        """Replaces the counters of the collection path and of all collections within it (keeping their quotas),
+        counters is a dict mapping paths to (bytes, files) tuples, collections not in it are empty."""
+        raise NotImplementedError()
+
+    def set_quota(self, resource, quota):
+        """Sets the quota in bytes of a collection, None for no limit."""
+        raise NotImplementedError()
+
+    def copy_counters(self, path, destination_path):
+        """Copies the counters of the collection path and of all collections within it to destination_path."""
+        raise NotImplementedError()
+
+    def move_counters(self, path, destination_path):
+        """Moves the counters of the collection path and of all collections within it to destination_path."""
+        raise NotImplementedError()
+
+    def delete_counters(self, path):
+        """Deletes the counters of the collection path and of all collections within it."""
+        raise NotImplementedError()
+
+    def get_path(self, resource):
+        return "/" + "/".join(resource.path)
+
+    def get_ancestor_paths(self, resource):
+        return ["/" + "/".join(resource.path[:i]) for i in range(len(resource.path))]
+
+    def get_usage(self, resource):
+        """Returns the number of bytes and files of the resource (the sum of all objects within a collection)."""
+        if not resource.is_collection:
+            return resource.getcontentlength, 1
+        counters = self.get_counters([self.get_path(resource)]).get(self.get_path(resource))
+        return counters[:2] if counters else (0, 0)
+
+    def get_used_bytes(self, resources):
+        """Returns the bytes used within each of the given collections, with one lookup."""
+        counters = self.get_counters([self.get_path(resource) for resource in resources])
+        return [counters.get(self.get_path(resource), (0, 0, None))[0] for resource in resources]
+
+    def get_available_bytes(self, resources, ignored_paths=()):
+        """Returns the bytes that may still be stored within each of the given collections, the least quota left on
+        the collection and its ancestors (except those in ignored_paths), or None if there is no quota. All counters
+        are read with one lookup."""
+        paths = [
+            [path for path in self.get_ancestor_paths(resource) + [self.get_path(resource)] if path not in ignored_paths]
+            for resource in resources
+        ]
+        counters = self.get_counters(set(path for resource_paths in paths for path in resource_paths))
+        available = []
+        for resource_paths in paths:
+            left = None
+            for path in resource_paths:
+                nbytes, files, quota = counters.get(path, (0, 0, None))
+                if quota is None and path == '/':
+                    quota = self.quota
+                if quota is not None:
+                    left = max(quota - nbytes, 0) if left is None else min(left, max(quota - nbytes, 0))
+            available.append(left)
+        return available
+
+    def can_store(self, resource, nbytes, source=None):
+        """Returns whether nbytes more can be stored in the resource without exceeding a quota of its ancestors. When
+        the bytes are moved from source, quotas of collections containing both are not checked, their usage stays."""
+        if nbytes <= 0:
+            return True
+        ignored_paths = set(self.get_ancestor_paths(source)) if source is not None else ()
+        available = self.get_available_bytes([resource.get_parent()], ignored_paths)[0]
+        return available is None or nbytes <= available
+
+    def add(self, resource, nbytes, files):
+        """Accounts nbytes and files added to (or, if negative, removed from) the resource in its ancestors."""
+        if nbytes or files:
+            self.add_counters(self.get_ancestor_paths(resource), nbytes, files)
+
+    def deleted(self, resource, usage, collection):
+        """Accounts the deletion of the resource, usage is its (bytes, files) and collection whether it was a
+        collection before it was deleted."""
+        self.add(resource, -usage[0], -usage[1])
+        if collection:
+            self.delete_counters(self.get_path(resource))
+
+    def copied(self, resource, destination, usage, collection):
+        """Accounts the copy of the resource to destination, usage is the (bytes, files) of the resource."""
+        if collection:
+            self.copy_counters(self.get_path(resource), self.get_path(destination))
+        self.add(destination, *usage)
+
+    def moved(self, resource, destination, usage, collection):
+        """Accounts the move of the resource to destination, usage is the (bytes, files) of the resource."""
+        self.add(resource, -usage[0], -usage[1])
+        if collection:
+            self.move_counters(self.get_path(resource), self.get_path(destination))
+        self.add(destination, *usage)
+
+    def rebuild(self, resource):
+        """Counts the bytes and files of all collections within the resource (of its parent, if it is an object) by
+        walking the tree, and corrects the counters of its ancestors."""
+        if not resource.is_collection:
+            resource = resource.get_parent()
+        counters = {}
+        for descendant in resource.get_descendants(depth=-1):
+            if descendant.is_collection:
+                counters.setdefault(self.get_path(descendant), [0, 0])
+                continue
+            for path in self.get_ancestor_paths(descendant)[len(resource.path):]:
+                counter = counters.setdefault(path, [0, 0])
+                counter[0] += descendant.getcontentlength
+                counter[1] += 1
+        nbytes, files = self.get_usage(resource)
+        total = counters.get(self.get_path(resource), (0, 0))
+        self.reset_counters(self.get_path(resource), dict((path, tuple(counter)) for path, counter in counters.items()))
+        self.add(resource, total[0] - nbytes, total[1] - files)
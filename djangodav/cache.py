@@ -0,0 +1,151 @@
+# Refactoring, Django 1.11 compatibility, cleanups, bugfixes (c) 2018 Christian Kreuzberger <ckreuzberger@anexia-it.com>
+# All rights reserved.
+#
+# Portions (c) 2014, Alexander Klimenko <alex@erix.ru>
+# All rights reserved.
+#
+# Copyright (c) 2011, SmartFile <btimby@smartfile.com>
+# All rights reserved.
+#
+# This file is part of DjangoDav.
+#
+# DjangoDav is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DjangoDav is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with DjangoDav.  If not, see <http://www.gnu.org/licenses/>.
+import pickle
+import time
+from hashlib import md5
+
+from djangodav.utils import LRUCache
+
+
+class BaseListingCache(object):
+    """Stores collection listings, see ListingCacheMixIn. Values are (token, children) tuples."""
+
+    def get(self, key):
+        raise NotImplementedError()
+
+    def set(self, key, value):
+        raise NotImplementedError()
+
+    def delete(self, key):
+        raise NotImplementedError()
+
+
+class LocalListingCache(BaseListingCache):
+    """
+    In-process LRU of listings, bounded by the number of listings and by the (pickled) size of all listings.
+    Invalidations only reach the current process, so listings expire after timeout seconds: other workers see a file
+    rewritten in place (which leaves the directory unchanged) after that delay at the latest. Use DjangoListingCache
+    to share invalidations between several workers.
+    """
+
+    def __init__(self, maxsize=10000, maxbytes=64 * 1024 * 1024, timeout=5):
+        self.cache = LRUCache(maxsize)
+        self.maxbytes = maxbytes
+        self.timeout = timeout
+        self.sizes = {}
+        self.size = 0
+
+    def get(self, key):
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires is not None and expires < time.time():
+            self.delete(key)
+            return None
+        return value
+
+    def set(self, key, value):
+        size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        if size > self.maxbytes:
+            return
+        with self.cache.lock:
+            self.size += size - self.sizes.pop(key, 0)
+            self.sizes[key] = size
+            self.cache.data[key] = (time.time() + self.timeout if self.timeout else None, value)
+            self.cache.data.move_to_end(key)
+            while len(self.cache.data) > self.cache.maxsize or self.size > self.maxbytes:
+                old_key, _ = self.cache.data.popitem(last=False)
+                self.size -= self.sizes.pop(old_key)
+
+    def delete(self, key):
+        with self.cache.lock:
+            if self.cache.data.pop(key, None) is not None:
+                self.size -= self.sizes.pop(key)
+
+
+class DjangoListingCache(BaseListingCache):
+    """Stores listings in a Django cache (e.g. memcached or redis), so invalidations reach all workers"""
+
+    def __init__(self, alias='default', timeout=300):
+        self.alias = alias
+        self.timeout = timeout
+
+    @property
+    def cache(self):
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value):
+        self.cache.set(key, value, self.timeout)
+
+    def delete(self, key):
+        self.cache.delete(key)
+
+
+class ListingCacheMixIn(object):
+    """
+    Caches the children of collections (with the data their properties are computed from), so repeated PROPFIND
+    Depth: 1 requests neither list nor stat the collection's children again. A listing is valid as long as the token
+    of the collection (e.g. its inode and modification time) is unchanged, and is invalidated by the view when a
+    member is written, created, deleted, copied or moved.
+
+    Resources implement get_listing_token, get_listing_state and restore_listing_child (see BaseDavResource);
+    modifications done outside of djangodav that do not change the token of the collection (e.g. a file rewritten
+    in place) are only seen when the listing expires.
+    """
+    listing_cache = None
+
+    def get_listing_cache_key(self, path=None):
+        path = self.path if path is None else path
+        namespace = '%s:%s' % (getattr(self, 'root', ''), '/'.join(path))
+        return 'djangodav:listing:%s' % md5(namespace.encode('utf-8')).hexdigest()
+
+    def get_children(self):
+        if self.listing_cache is None or not self.is_collection:
+            for child in super(ListingCacheMixIn, self).get_children():
+                yield child
+            return
+        key = self.get_listing_cache_key()
+        token = self.get_listing_token()
+        cached = self.listing_cache.get(key)
+        if cached is not None and cached[0] == token:
+            for name, state in cached[1]:
+                yield self.restore_listing_child(name, state)
+            return
+        children = list(super(ListingCacheMixIn, self).get_children())
+        self.listing_cache.set(key, (token, [(child.path[-1], self.get_listing_state(child)) for child in children]))
+        for child in children:
+            yield child
+
+    def invalidate_listing(self):
+        if self.listing_cache is None:
+            return
+        self.listing_cache.delete(self.get_listing_cache_key())
+        if self.path:
+            self.listing_cache.delete(self.get_listing_cache_key(self.path[:-1]))
+        super(ListingCacheMixIn, self).invalidate_listing()
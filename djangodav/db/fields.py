@@ -0,0 +1,37 @@
+# Refactoring, Django 1.11 compatibility, cleanups, bugfixes (c) 2018 Christian Kreuzberger <ckreuzberger@anexia-it.com>
+# All rights reserved.
+#
+# Portions (c) 2014, Alexander Klimenko <alex@erix.ru>
+# All rights reserved.
+#
+# Copyright (c) 2011, SmartFile <btimby@smartfile.com>
+# All rights reserved.
+#
+# This file is part of DjangoDav.
+#
+# DjangoDav is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DjangoDav is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with DjangoDav.  If not, see <http://www.gnu.org/licenses/>.
+from django.db import models
+
+
+class MaterializedPathField(models.CharField):
+    """Stores the full path of a collection or object (e.g. "/a/b/c") in an indexed column, so that
+    djangodav.db.resources.MaterializedPathDBDavMixIn can resolve paths with a single equality query.
+
+    At most 768 characters by default: an index on the column must not exceed 3072 bytes on MySQL (utf8mb4 takes
+    4 bytes per character)."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('max_length', 768)
+        kwargs.setdefault('db_index', True)
+        super(MaterializedPathField, self).__init__(*args, **kwargs)
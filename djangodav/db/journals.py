@@ -0,0 +1,96 @@
+# Refactoring, Django 1.11 compatibility, cleanups, bugfixes (c) 2018 Christian Kreuzberger <ckreuzberger@anexia-it.com>
+# All rights reserved.
+#
+# Portions (c) 2014, Alexander Klimenko <alex@erix.ru>
+# All rights reserved.
+#
+# Copyright (c) 2011, SmartFile <btimby@smartfile.com>
+# All rights reserved.
+#
+# This file is part of DjangoDav.
+#
+# DjangoDav is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DjangoDav is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with DjangoDav.  If not, see <http://www.gnu.org/licenses/>.
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils.timezone import now
+
+from djangodav.base.journals import BaseChangeJournal, InvalidSyncToken
+from djangodav.models import DavChange, DavChangeLock
+
+
+class DBChangeJournal(BaseChangeJournal):
+    """
+    Change journal kept in the database (djangodav.models.DavChange), the id of an entry is its sequence number.
+
+    Changes since a token are read with one query on the primary key, restricted to the indexed parent path (or path
+    prefix for infinite depth), so an incremental sync costs time proportional to the number of changes. Entries
+    older than max_age are removed by prune, tokens issued before are rejected.
+
+    Changes are recorded while holding a row lock (djangodav.models.DavChangeLock) until the transaction commits, so
+    entries become visible in the order of their ids and a token never passes over a change committed later.
+    """
+    model = DavChange
+    lock_model = DavChangeLock
+    lock_name = 'changes'
+    using = None
+    max_age = timedelta(days=30)
+    bulk_batch_size = 500
+
+    def get_queryset(self):
+        return self.model.objects.using(self.using)
+
+    def get_resource_path(self, resource):
+        return "/" + "/".join(resource.path)
+
+    def record(self, resources, change, collection=None):
+        with transaction.atomic(using=self.using):
+            self.lock()
+            self.get_queryset().bulk_create([
+                self.model(path=self.get_resource_path(resource), parent="/" + "/".join(resource.path[:-1]),
+                           change=change, collection=resource.is_collection if collection is None else collection)
+                for resource in resources
+            ], batch_size=self.bulk_batch_size)
+
+    def lock(self):
+        """Locks the row of lock_name until the transaction commits, after the other transactions recording changes"""
+        self.lock_model.objects.using(self.using).select_for_update().get_or_create(name=self.lock_name)
+
+    def get_sequence(self):
+        return self.get_queryset().aggregate(sequence=Max('id'))['sequence'] or 0
+
+    def get_changes(self, resource, sequence, infinite=False, limit=None):
+        oldest = self.get_queryset().aggregate(oldest=Min('id'))['oldest']
+        if oldest is not None and sequence < oldest - 1:
+            raise InvalidSyncToken(sequence)
+        path = self.get_resource_path(resource)
+        entries = self.get_queryset().filter(id__gt=sequence)
+        if infinite:
+            entries = entries.filter(path__startswith=path.rstrip("/") + "/")
+        else:
+            entries = entries.filter(parent=path)
+        changes = {}
+        for entry_id, entry_path, change, collection in entries.order_by('id').values_list(
+                'id', 'path', 'change', 'collection').iterator():
+            if limit is not None and entry_path not in changes and len(changes) >= limit:
+                break
+            changes.pop(entry_path, None)
+            changes[entry_path] = (entry_path, change, collection, entry_id)
+        return sorted(changes.values(), key=lambda change: change[3])
+
+    def prune(self):
+        """Removes the entries older than max_age, keeping the latest one."""
+        latest = self.get_sequence()
+        self.get_queryset().filter(created__lt=now() - self.max_age, id__lt=latest).delete()
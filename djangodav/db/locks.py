@@ -0,0 +1,116 @@
+# Refactoring, Django 1.11 compatibility, cleanups, bugfixes (c) 2018 Christian Kreuzberger <ckreuzberger@anexia-it.com>
+# All rights reserved.
+#
+# Portions (c) 2014, Alexander Klimenko <alex@erix.ru>
+# All rights reserved.
+#
+# Copyright (c) 2011, SmartFile <btimby@smartfile.com>
+# All rights reserved.
+#
+# This file is part of DjangoDav.
+#
+# DjangoDav is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DjangoDav is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with DjangoDav.  If not, see <http://www.gnu.org/licenses/>.
+from datetime import timedelta
+from uuid import uuid4
+
+from django.db.models import Q
+from django.utils.timezone import now
+
+from djangodav.base.locks import BaseLock
+from djangodav.models import DavLock
+from djangodav.utils import strip_lock_token
+
+
+class DBLock(BaseLock):
+    """
+    Lock manager storing locks in the database (djangodav.models.DavLock)
+
+    Locks are looked up by the path of the resource: locks on the resource itself and depth infinity locks on
+    its ancestors are found with one indexed query, locks within a collection with one prefix query. Expired locks
+    are ignored on read and deleted lazily when new locks are acquired.
+
+    Conflicting locks are detected by inserting the new lock first and then looking for other conflicting locks,
+    backing off if there are any. As the row is committed before the lookup, two processes racing for the same
+    resource can not both get their lock. This relies on autocommit, so LOCK requests must not run in a transaction
+    (e.g. with ATOMIC_REQUESTS).
+    """
+    model = DavLock
+
+    def __init__(self, resource):
+        super(DBLock, self).__init__(resource)
+        self.path = "/" + "/".join(resource.path)
+
+    def get_ancestor_paths(self):
+        return ["/" + "/".join(self.resource.path[:i]) for i in range(len(self.resource.path))]
+
+    def get_covering_lookup(self):
+        """Lookup for locks on the resource and depth infinity locks on its ancestors"""
+        return Q(path=self.path) | Q(path__in=self.get_ancestor_paths(), depth=DavLock.DEPTH_INFINITY)
+
+    def get_descendant_lookup(self):
+        """Lookup for locks within the resource"""
+        return Q(path__startswith=self.path.rstrip("/") + "/")
+
+    def get_active_locks(self):
+        return self.model.objects.filter(expires__gt=now())
+
+    def get(self):
+        return list(self.get_active_locks().filter(self.get_covering_lookup()).order_by('created'))
+
+    def acquire(self, lockscope, locktype, depth, timeout, owner):
+        lookup = self.get_covering_lookup()
+        if depth == DavLock.DEPTH_INFINITY:
+            lookup |= self.get_descendant_lookup()
+        self.model.objects.filter(lookup, expires__lte=now()).delete()
+        lock = self.model.objects.create(
+            token=str(uuid4()), path=self.path, depth=depth, scope=lockscope, type=locktype, owner=owner,
+            timeout=timeout, expires=now() + timedelta(seconds=timeout)
+        )
+        conflicts = self.get_active_locks().filter(lookup).exclude(pk=lock.pk)
+        if lockscope != 'exclusive':
+            conflicts = conflicts.filter(scope='exclusive')
+        if conflicts.exists():
+            lock.delete()
+            return None
+        return lock.token
+
+    def release(self, token):
+        return self.model.objects.filter(self.get_covering_lookup(), token=strip_lock_token(token)).delete()[0] > 0
+
+    def refresh(self, token, timeout):
+        lock = self.get_active_locks().filter(self.get_covering_lookup(), token=strip_lock_token(token)).first()
+        if lock is None:
+            return None
+        lock.timeout, lock.expires = timeout, now() + timedelta(seconds=timeout)
+        lock.save(update_fields=['timeout', 'expires'])
+        return lock
+
+    def has_token(self, token):
+        return self.get_active_locks().filter(self.get_covering_lookup(), token=strip_lock_token(token)).exists()
+
+    def can_write(self, tokens, recursive=False):
+        tokens = set(strip_lock_token(token) for token in tokens)
+        lookup = self.get_covering_lookup()
+        if recursive:
+            lookup |= self.get_descendant_lookup()
+        locks = list(self.get_active_locks().filter(lookup).values_list('token', 'path', 'scope'))
+        # a shared lock is satisfied by the token of any shared lock on the same path
+        submitted_paths = set(path for token, path, scope in locks if token in tokens)
+        return all(
+            token in tokens or (scope != 'exclusive' and path in submitted_paths)
+            for token, path, scope in locks
+        )
+
+    def del_locks(self):
+        self.model.objects.filter(Q(path=self.path) | self.get_descendant_lookup()).delete()
@@ -0,0 +1,102 @@
+# Refactoring, Django 1.11 compatibility, cleanups, bugfixes (c) 2018 Christian Kreuzberger <ckreuzberger@anexia-it.com>
+# All rights reserved.
+#
+# Portions (c) 2014, Alexander Klimenko <alex@erix.ru>
+# All rights reserved.
+#
+# Copyright (c) 2011, SmartFile <btimby@smartfile.com>
+# All rights reserved.
+#
+# This file is part of DjangoDav.
+#
+# DjangoDav is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DjangoDav is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with DjangoDav.  If not, see <http://www.gnu.org/licenses/>.
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from djangodav.base.properties import BaseDeadPropertyStore
+from djangodav.models import DavProperty
+from djangodav.utils import parse_clark_name
+
+
+class DBDeadPropertyStore(BaseDeadPropertyStore):
+    """
+    Dead property store keeping properties in the database (djangodav.models.DavProperty)
+
+    Properties are looked up by the path of the resource, the properties of a whole batch of resources (e.g. the
+    children of a collection) are loaded with one query. Updates are done in a transaction.
+    """
+    model = DavProperty
+    using = None
+    bulk_batch_size = 500
+
+    def get_resource_path(self, resource):
+        return "/" + "/".join(resource.path)
+
+    def get_tree_lookup(self, path):
+        return Q(path=path) | Q(path__startswith=path.rstrip("/") + "/")
+
+    def get_many(self, resources):
+        paths = [self.get_resource_path(resource) for resource in resources]
+        props = dict((path, {}) for path in paths)
+        for path, namespace, name, value in self.model.objects.using(self.using).filter(path__in=paths).values_list(
+                'path', 'namespace', 'name', 'value'):
+            props[path]['{%s}%s' % (namespace, name)] = value
+        return [props[path] for path in paths]
+
+    def update(self, resource, set_props, remove_props):
+        try:
+            self.update_once(resource, set_props, remove_props)
+        except IntegrityError:
+            # a concurrent update inserted one of the properties meanwhile, replace it
+            self.update_once(resource, set_props, remove_props)
+
+    def update_once(self, resource, set_props, remove_props):
+        path = self.get_resource_path(resource)
+        names = [parse_clark_name(name) for name in list(set_props) + list(remove_props)]
+        with transaction.atomic(using=self.using):
+            if names:
+                lookup = Q()
+                for namespace, name in names:
+                    lookup |= Q(namespace=namespace, name=name)
+                self.model.objects.using(self.using).filter(lookup, path=path).delete()
+            self.model.objects.using(self.using).bulk_create([
+                self.model(path=path, namespace=namespace, name=name, key=self.model.make_key(path, namespace, name),
+                           value=value)
+                for (namespace, name), value in ((parse_clark_name(name), value) for name, value in set_props.items())
+            ])
+
+    def copy(self, resource, destination):
+        path, destination_path = self.get_resource_path(resource), self.get_resource_path(destination)
+        with transaction.atomic(using=self.using):
+            self.model.objects.using(self.using).bulk_create([
+                self.copy_property(prop, destination_path + prop.path[len(path):])
+                for prop in self.model.objects.using(self.using).filter(self.get_tree_lookup(path)).iterator()
+            ], batch_size=self.bulk_batch_size)
+
+    def copy_property(self, prop, path):
+        return self.model(path=path, namespace=prop.namespace, name=prop.name,
+                          key=self.model.make_key(path, prop.namespace, prop.name), value=prop.value)
+
+    def move(self, resource, destination):
+        path, destination_path = self.get_resource_path(resource), self.get_resource_path(destination)
+        # the keys are hashes of the paths, so they are updated one by one (in batches)
+        with transaction.atomic(using=self.using):
+            props = list(self.model.objects.using(self.using).filter(self.get_tree_lookup(path)))
+            for prop in props:
+                prop.path = destination_path + prop.path[len(path):]
+                prop.key = self.model.make_key(prop.path, prop.namespace, prop.name)
+            self.model.objects.using(self.using).bulk_update(props, ['path', 'key'], batch_size=self.bulk_batch_size)
+
+    def delete(self, resource):
+        self.model.objects.using(self.using).filter(self.get_tree_lookup(self.get_resource_path(resource))).delete()
@@ -23,7 +23,9 @@
 # along with DjangoDav.  If not, see <http://www.gnu.org/licenses/>.
 from operator import and_
 from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Q, Value
+from django.db.models.functions import Concat, Substr
 from django.utils.functional import cached_property
 from django.utils.timezone import now
 from djangodav.base.resources import BaseDavResource
@@ -50,6 +52,14 @@ class BaseDBDavResource(BaseDavResource):
     def obj(self):
         raise NotImplementedError
 
+    @property
+    def collection_model_qs(self):
+        return self.collection_model.objects.all()
+
+    @property
+    def object_model_qs(self):
+        return self.object_model.objects.all()
+
     @property
     def getcontentlength(self):
         return getattr(self.obj, self.size_attribute)
@@ -102,6 +112,35 @@ class BaseDBDavResource(BaseDavResource):
                     obj=child    # Sending ready object to reduce db requests
                 )
 
+    def get_descendants(self, depth=1, include_self=True):
+        """Return an iterator of all descendants of this resource. If the lookup supports it (see get_subtree),
+        the whole subtree is loaded in a constant number of queries instead of querying each collection."""
+        tree = self.get_subtree(depth) if depth not in (0, 1) and self.is_collection else None
+        if tree is None:
+            for desc in super(BaseDBDavResource, self).get_descendants(depth=depth, include_self=include_self):
+                yield desc
+            return
+        for desc in self.walk_subtree(tree, depth, include_self):
+            yield desc
+
+    def walk_subtree(self, tree, depth, include_self=True):
+        """Yield the descendants of this resource from a tree returned by get_subtree, in the same order as
+        BaseDavResource.get_descendants does."""
+        if include_self:
+            yield self
+        if depth != 0:
+            for child in tree.get(tuple(self.path), ()):
+                for desc in child.walk_subtree(tree, depth - 1):
+                    yield desc
+
+    def get_subtree(self, depth=-1):
+        """Load the descendants of this collection at once.
+        :param depth: maximum depth, -1 is infinity
+        :return: a dict mapping the path (as tuple of its parts) of each collection to the list of its children
+                 (resources with their model object already set), or None if the lookup does not support it
+        """
+        return None
+
     def read(self):
         raise NotImplementedError
 
@@ -109,10 +148,45 @@ class BaseDBDavResource(BaseDavResource):
     def write(self, content, temp_file=None):
         raise NotImplementedError
 
+    # maximum number of primary keys passed to a single IN lookup
+    bulk_batch_size = 500
+
+    def get_collection_levels(self):
+        """Return the primary keys of this collection and all its descendant collections, as one list per tree
+        level (starting with [self.obj.pk]). Needs one query per level."""
+        levels = []
+        pks = [self.obj.pk]
+        while pks:
+            levels.append(pks)
+            pks = [
+                pk for batch in self.batches(pks)
+                for pk in self.collection_model_qs.filter(**self.get_model_lookup_kwargs(
+                    **{"%s__in" % self.collection_attribute: batch}
+                )).values_list('pk', flat=True)
+            ]
+        return levels
+
+    def batches(self, items):
+        for i in range(0, len(items), self.bulk_batch_size):
+            yield items[i:i + self.bulk_batch_size]
+
     def delete(self):
+        """Delete the resource. Collections are deleted set based: all objects of the subtree are deleted with one
+        statement per batch of collections, then the collections level by level starting with the deepest, all in
+        one transaction."""
         if not self.obj:
             return
-        self.obj.delete()
+        with transaction.atomic():
+            if self.is_collection:
+                levels = self.get_collection_levels()
+                for batch in self.batches([pk for level in levels for pk in level]):
+                    self.object_model_qs.filter(**{"%s__in" % self.collection_attribute: batch}).delete()
+                for level in reversed(levels[1:]):
+                    for batch in self.batches(level):
+                        self.collection_model_qs.filter(pk__in=batch).delete()
+            self.obj.delete()
+        self.__dict__['obj'] = None
+        self.__dict__.pop('exists', None)
 
 
 class NameLookupDBDavMixIn(object):
@@ -135,7 +209,7 @@ class NameLookupDBDavMixIn(object):
         :param name: the name of the new collection
         :return:
         """
-        self.collection_model.objects.create(
+        return self.collection_model.objects.create(
             **{self.collection_attribute: parent, 'name': name}
         )
 
@@ -149,7 +223,8 @@ class NameLookupDBDavMixIn(object):
         # get the parent object (ToDo: Why is this cloned?)
         parent = self.clone("/".join(self.path[:-1])).obj
 
-        self.create_collection_in_db(parent, name)
+        self.__dict__['obj'] = self.create_collection_in_db(parent, name)
+        self.__dict__.pop('exists', None)
 
     @cached_property
     def obj(self):
@@ -207,6 +282,67 @@ class NameLookupDBDavMixIn(object):
 
         self.obj.save(force_insert=True)
 
+    def copy_collection(self, destination, depth=-1):
+        """
+        Copy the content of this collection into the (new) destination collection
+
+        Instead of copying each child on its own, the subtree is copied level by level with one query and one
+        bulk_create per model and level (and batch of collections), in one transaction
+        :param destination: destination collection, already created by copy
+        :param depth: -1 is infinity
+        :return:
+        """
+        with transaction.atomic():
+            sources = {self.obj.pk: destination.obj}
+            while sources and depth != 0:
+                copies = {}
+                for batch in self.batches(list(sources)):
+                    lookup = {"%s__in" % self.collection_attribute: batch}
+                    self.object_model.objects.bulk_create([
+                        self.copy_model_instance(obj, sources[getattr(obj, self.collection_attribute + '_id')])
+                        for obj in self.object_model_qs.filter(**self.get_model_lookup_kwargs(**lookup))
+                    ])
+                    collections = list(self.collection_model_qs.filter(**self.get_model_lookup_kwargs(**lookup)))
+                    originals = [collection.pk for collection in collections]
+                    created = self.collection_model.objects.bulk_create([
+                        self.copy_model_instance(collection, sources[getattr(collection, self.collection_attribute + '_id')])
+                        for collection in collections
+                    ])
+                    if any(collection.pk is None for collection in created):
+                        # the database backend does not return primary keys of bulk inserts, fetch them
+                        by_name = dict(
+                            ((getattr(collection, self.collection_attribute + '_id'),
+                              getattr(collection, self.name_attribute)), collection)
+                            for collection in self.collection_model_qs.filter(**{
+                                "%s__in" % self.collection_attribute: [sources[pk].pk for pk in batch]
+                            })
+                        )
+                        created = [
+                            by_name[(getattr(collection, self.collection_attribute).pk,
+                                     getattr(collection, self.name_attribute))]
+                            for collection in created
+                        ]
+                    copies.update(zip(originals, created))
+                sources = copies
+                depth -= 1
+
+    def copy_model_instance(self, obj, parent):
+        """Turn a model instance into an unsaved copy within the given parent collection"""
+        obj.pk = None
+        setattr(obj, self.collection_attribute, parent)
+        setattr(obj, self.created_attribute, now())
+        setattr(obj, self.modified_attribute, now())
+        return obj
+
+    def move(self, destination):
+        """Move a collection to a new location by reparenting (and renaming) its row, a single UPDATE whatever
+        the size of the collection. Moving into an existing collection is merged child by child."""
+        if self.is_collection and not self.is_root and not destination.exists:
+            with transaction.atomic():
+                self.move_object(destination)
+            return
+        super(NameLookupDBDavMixIn, self).move(destination)
+
     def move_object(self, destination):
         """
         Move an object to a destination
@@ -221,3 +357,83 @@ class NameLookupDBDavMixIn(object):
         setattr(self.obj, self.collection_attribute, collection)
         setattr(self.obj, self.modified_attribute, now())
         self.obj.save(update_fields=[self.name_attribute, self.collection_attribute, self.modified_attribute])
+
+
+class MaterializedPathDBDavMixIn(NameLookupDBDavMixIn):
+    """Object lookup by an indexed materialized path (see djangodav.db.fields.MaterializedPathField), so that
+    resolving a path is a single equality query whatever its depth.
+
+    Both models need a path field named path_attribute. It is kept in sync by create_collection, copy_object and
+    move_object, write implementations have to set it on new objects, e.g. using get_path_kwargs."""
+
+    path_attribute = 'dav_path'
+
+    def get_materialized_path(self, path=None):
+        """Return the materialized path ("/a/b/c") of this resource, or of the given list of path parts"""
+        return "/" + "/".join(self.path if path is None else path)
+
+    def get_path_kwargs(self, path=None):
+        return {self.path_attribute: self.get_materialized_path(path)}
+
+    def get_model_by_path(self, model_attr, path):
+        if not path:
+            return None
+
+        qs = getattr(self, "%s_model_qs" % model_attr).filter(**self.get_model_lookup_kwargs())
+        try:
+            return qs.filter(**self.get_path_kwargs(path))[0]
+        except IndexError:
+            raise qs.model.DoesNotExist()
+
+    def create_collection_in_db(self, parent, name):
+        kwargs = {self.collection_attribute: parent, self.name_attribute: name}
+        kwargs.update(self.get_path_kwargs())
+        return self.collection_model.objects.create(**kwargs)
+
+    def copy_model_instance(self, obj, parent):
+        obj = super(MaterializedPathDBDavMixIn, self).copy_model_instance(obj, parent)
+        setattr(obj, self.path_attribute, "%s/%s" % (
+            getattr(parent, self.path_attribute), getattr(obj, self.name_attribute)
+        ))
+        return obj
+
+    def copy_object(self, destination):
+        setattr(self.obj, self.path_attribute, destination.get_materialized_path())
+        super(MaterializedPathDBDavMixIn, self).copy_object(destination)
+
+    def move_object(self, destination):
+        name = destination.path[-1]
+        collection = self.clone(destination.get_parent_path()).obj
+        old_prefix = self.get_materialized_path() + "/"
+        new_prefix = destination.get_materialized_path() + "/"
+        setattr(self.obj, self.name_attribute, name)
+        setattr(self.obj, self.collection_attribute, collection)
+        setattr(self.obj, self.modified_attribute, now())
+        setattr(self.obj, self.path_attribute, destination.get_materialized_path())
+        self.obj.save(update_fields=[
+            self.name_attribute, self.collection_attribute, self.modified_attribute, self.path_attribute
+        ])
+        if self.is_collection:
+            # rewrite the path prefix of the whole subtree, one UPDATE per model
+            for qs in [self.collection_model_qs, self.object_model_qs]:
+                qs.filter(**self.get_model_lookup_kwargs(
+                    **{"%s__startswith" % self.path_attribute: old_prefix}
+                )).update(**{self.path_attribute: Concat(
+                    Value(new_prefix), Substr(self.path_attribute, len(old_prefix) + 1)
+                )})
+
+    def get_subtree(self, depth=-1):
+        """Load all descendant collections and objects with one query per model, using the materialized path
+        prefix of this collection."""
+        tree = {}
+        prefix = self.get_materialized_path() + "/" if self.path else "/"
+        for qs in [self.collection_model_qs, self.object_model_qs]:
+            qs = qs.filter(**self.get_model_lookup_kwargs()).filter(
+                **{"%s__startswith" % self.path_attribute: prefix}
+            )
+            for obj in qs.order_by(self.path_attribute):
+                path = getattr(obj, self.path_attribute).strip("/").split("/")
+                if depth > 0 and len(path) - len(self.path) > depth:
+                    continue
+                tree.setdefault(tuple(path[:-1]), []).append(self.clone("/".join(path), obj=obj))
+        return tree
@@ -0,0 +1,477 @@
+# Refactoring, Django 1.11 compatibility, cleanups, bugfixes (c) 2018 Christian Kreuzberger <ckreuzberger@anexia-it.com>
+# All rights reserved.
+#
+# Portions (c) 2014, Alexander Klimenko <alex@erix.ru>
+# All rights reserved.
+#
+# Copyright (c) 2011, SmartFile <btimby@smartfile.com>
+# All rights reserved.
+#
+# This file is part of DjangoDav.
+#
+# DjangoDav is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DjangoDav is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with DjangoDav.  If not, see <http://www.gnu.org/licenses/>.
+from datetime import timedelta
+
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models.query import QuerySet
+from django.test import TestCase
+from django.utils.timezone import now
+from djangodav.base.journals import InvalidSyncToken
+from djangodav.db.fields import MaterializedPathField
+from djangodav.db.journals import DBChangeJournal
+from djangodav.db.locks import DBLock
+from djangodav.db.properties import DBDeadPropertyStore
+from djangodav.db.usage import DBUsageStore
+from djangodav.db.resources import BaseDBDavResource, MaterializedPathDBDavMixIn
+from djangodav.models import DavChange, DavChangeLock, DavLock, DavProperty, DavUsage
+from mock import Mock, PropertyMock, patch
+
+
+class TestMaterializedPathDBDavResource(TestCase):
+    class DBDavResource(MaterializedPathDBDavMixIn, BaseDBDavResource):
+        collection_model = Mock()
+        object_model = Mock()
+
+    def setUp(self):
+        self.DBDavResource.collection_model.reset_mock()
+        self.DBDavResource.object_model.reset_mock()
+
+    def test_get_materialized_path(self):
+        self.assertEqual(self.DBDavResource('/a/b/c/').get_materialized_path(), '/a/b/c')
+        self.assertEqual(self.DBDavResource('/a/b/c').get_materialized_path(['d', 'e']), '/d/e')
+
+    def test_obj_lookup(self):
+        qs = self.DBDavResource.collection_model.objects.all.return_value.filter.return_value
+        qs.filter.return_value = ['collection']
+        resource = self.DBDavResource('/a/b/c/d/')
+        self.assertEqual(resource.obj, 'collection')
+        # a single equality lookup, whatever the depth of the path
+        qs.filter.assert_called_once_with(dav_path='/a/b/c/d')
+
+    def test_obj_lookup_missing(self):
+        qs = self.DBDavResource.object_model.objects.all.return_value.filter.return_value
+        qs.filter.return_value = []
+        qs.model.DoesNotExist = LookupError
+        with self.assertRaises(LookupError):
+            self.DBDavResource('/a').get_model_by_path('object', ['a'])
+
+    def test_create_collection(self):
+        parent = Mock()
+        resource = self.DBDavResource('/a/b/')
+        resource.clone = Mock(return_value=Mock(obj=parent))
+        resource.create_collection()
+        self.DBDavResource.collection_model.objects.create.assert_called_with(parent=parent, name='b', dav_path='/a/b')
+
+    def test_move_object(self):
+        obj = Mock()
+        parent = Mock()
+        resource = self.DBDavResource('/a/b', obj=obj)
+        resource.clone = Mock(return_value=Mock(obj=parent))
+        with patch.object(self.DBDavResource, 'is_collection', new_callable=PropertyMock, return_value=False):
+            resource.move_object(self.DBDavResource('/c/d'))
+        self.assertEqual(obj.dav_path, '/c/d')
+        self.assertEqual(obj.name, 'd')
+        self.assertEqual(obj.parent, parent)
+        obj.save.assert_called_with(update_fields=['name', 'parent', 'modified', 'dav_path'])
+
+
+class Collection(object):
+    objects = Mock()
+
+    def __init__(self, dav_path):
+        self.dav_path = dav_path
+        self.name = dav_path.rsplit('/', 1)[-1]
+
+
+class Object(object):
+    objects = Mock()
+
+    def __init__(self, dav_path):
+        self.dav_path = dav_path
+        self.name = dav_path.rsplit('/', 1)[-1]
+
+
+class TestMaterializedPathSubtree(TestCase):
+    class DBDavResource(MaterializedPathDBDavMixIn, BaseDBDavResource):
+        collection_model = Collection
+        object_model = Object
+
+    def setUp(self):
+        Collection.objects = Mock()
+        Object.objects = Mock()
+        self.collection_qs = Collection.objects.all.return_value.filter.return_value.filter.return_value
+        self.collection_qs.order_by.return_value = [
+            Collection('/a/b'), Collection('/a/b/c'), Collection('/a/d'),
+        ]
+        self.object_qs = Object.objects.all.return_value.filter.return_value.filter.return_value
+        self.object_qs.order_by.return_value = [
+            Object('/a/b/c/file3'), Object('/a/b/file2'), Object('/a/file1'),
+        ]
+        self.resource = self.DBDavResource('/a/', obj=Collection('/a'))
+
+    def test_get_descendants_infinity(self):
+        descendants = list(self.resource.get_descendants(depth=-1))
+        self.assertEqual([d.get_path() for d in descendants], [
+            '/a/', '/a/b/', '/a/b/c/', '/a/b/c/file3', '/a/b/file2', '/a/d/', '/a/file1',
+        ])
+        # one query per model for the whole subtree
+        Collection.objects.all.return_value.filter.return_value.filter.assert_called_once_with(
+            dav_path__startswith='/a/')
+        Object.objects.all.return_value.filter.return_value.filter.assert_called_once_with(
+            dav_path__startswith='/a/')
+        self.assertEqual(descendants[3].obj.dav_path, '/a/b/c/file3')
+
+    def test_get_descendants_depth(self):
+        descendants = list(self.resource.get_descendants(depth=2, include_self=False))
+        self.assertEqual([d.get_path() for d in descendants], [
+            '/a/b/', '/a/b/c/', '/a/b/file2', '/a/d/', '/a/file1',
+        ])
+
+
+class DavCollectionModel(models.Model):
+    name = models.CharField(max_length=255)
+    parent = models.ForeignKey('self', blank=True, null=True, on_delete=models.CASCADE)
+    created = models.DateTimeField(default=now)
+    modified = models.DateTimeField(default=now)
+    dav_path = MaterializedPathField()
+    size = 0
+
+    class Meta:
+        app_label = 'djangodav'
+        unique_together = (('parent', 'name'),)
+
+
+class DavObjectModel(models.Model):
+    name = models.CharField(max_length=255)
+    parent = models.ForeignKey(DavCollectionModel, blank=True, null=True, on_delete=models.CASCADE)
+    created = models.DateTimeField(default=now)
+    modified = models.DateTimeField(default=now)
+    dav_path = MaterializedPathField()
+    size = models.IntegerField(default=0)
+
+    class Meta:
+        app_label = 'djangodav'
+        unique_together = (('parent', 'name'),)
+
+
+class DBDavResource(MaterializedPathDBDavMixIn, BaseDBDavResource):
+    collection_model = DavCollectionModel
+    object_model = DavObjectModel
+
+
+class TestDBCollectionOperations(TestCase):
+    models = [DavCollectionModel, DavObjectModel]
+
+    @classmethod
+    def setUpClass(cls):
+        # test only models, create their tables unless the test database already has them
+        tables = connection.introspection.table_names()
+        with connection.schema_editor() as editor:
+            for model in cls.models:
+                if model._meta.db_table not in tables:
+                    editor.create_model(model)
+        super(TestDBCollectionOperations, cls).setUpClass()
+
+    def setUp(self):
+        # /src/ holds: a, sub/, sub/b, sub/deeper/, sub/deeper/c
+        self.src = DavCollectionModel.objects.create(name='src', dav_path='/src')
+        self.sub = DavCollectionModel.objects.create(name='sub', parent=self.src, dav_path='/src/sub')
+        self.deeper = DavCollectionModel.objects.create(name='deeper', parent=self.sub, dav_path='/src/sub/deeper')
+        DavObjectModel.objects.create(name='a', parent=self.src, dav_path='/src/a', size=1)
+        DavObjectModel.objects.create(name='b', parent=self.sub, dav_path='/src/sub/b', size=2)
+        DavObjectModel.objects.create(name='c', parent=self.deeper, dav_path='/src/sub/deeper/c', size=3)
+
+    def paths(self):
+        return sorted(
+            [c.get_path() for c in DBDavResource('/').get_descendants(depth=-1, include_self=False)]
+        )
+
+    def test_move_collection(self):
+        src = DBDavResource('/src/')
+        dst = DBDavResource('/dst/')
+        self.assertFalse(dst.exists)
+        with self.assertNumQueries(6):
+            # savepoint, parent lookup, the collection UPDATE and one subtree path UPDATE per model, release
+            src.move(dst)
+        self.assertEqual(self.paths(), [
+            '/dst/', '/dst/a', '/dst/sub/', '/dst/sub/b', '/dst/sub/deeper/', '/dst/sub/deeper/c',
+        ])
+        self.assertEqual(DavCollectionModel.objects.get(pk=self.deeper.pk).dav_path, '/dst/sub/deeper')
+        self.assertEqual(DBDavResource('/dst/sub/deeper/c').obj.size, 3)
+
+    def test_move_collection_into_collection(self):
+        DavCollectionModel.objects.create(name='other', dav_path='/other')
+        DBDavResource('/src/sub/').move(DBDavResource('/other/moved/'))
+        self.assertEqual(self.paths(), [
+            '/other/', '/other/moved/', '/other/moved/b', '/other/moved/deeper/', '/other/moved/deeper/c',
+            '/src/', '/src/a',
+        ])
+
+    def test_copy_collection(self):
+        DBDavResource('/src/').copy(DBDavResource('/dst/'))
+        self.assertEqual(self.paths(), [
+            '/dst/', '/dst/a', '/dst/sub/', '/dst/sub/b', '/dst/sub/deeper/', '/dst/sub/deeper/c',
+            '/src/', '/src/a', '/src/sub/', '/src/sub/b', '/src/sub/deeper/', '/src/sub/deeper/c',
+        ])
+        copied = DBDavResource('/dst/sub/deeper/c').obj
+        self.assertEqual(copied.size, 3)
+        self.assertNotEqual(copied.parent_id, self.deeper.pk)
+        self.assertEqual(DavObjectModel.objects.count(), 6)
+
+    def test_copy_collection_depth(self):
+        DBDavResource('/src/').copy(DBDavResource('/dst/'), depth=1)
+        self.assertEqual([p for p in self.paths() if p.startswith('/dst/')], ['/dst/', '/dst/a', '/dst/sub/'])
+
+    def test_delete_collection(self):
+        resource = DBDavResource('/src/sub/')
+        resource.delete()
+        self.assertFalse(resource.exists)
+        self.assertEqual(self.paths(), ['/src/', '/src/a'])
+        self.assertEqual(DavObjectModel.objects.count(), 1)
+
+
+class TestDBLock(TestCase):
+    def lock(self, path, scope='exclusive', depth=-1, timeout=600):
+        return DBLock(DBDavResource(path)).acquire(scope, 'write', depth, timeout, 'owner')
+
+    def test_acquire(self):
+        token = self.lock('/a/b')
+        self.assertTrue(token)
+        lock = DavLock.objects.get(token=token)
+        self.assertEqual(lock.path, '/a/b')
+        self.assertEqual(lock.depth, -1)
+        self.assertEqual(lock.owner, 'owner')
+        self.assertEqual([l.token for l in DBLock(DBDavResource('/a/b/c')).get()], [token])
+        self.assertEqual(DBLock(DBDavResource('/a')).get(), [])
+
+    def test_refresh(self):
+        token = self.lock('/a/b', timeout=10)
+        DavLock.objects.filter(token=token).update(expires=now() + timedelta(seconds=1))
+        lock = DBLock(DBDavResource('/a/b/c')).refresh('opaquelocktoken:%s' % token, 600)
+        self.assertEqual((lock.token, lock.timeout, lock.owner), (token, 600, 'owner'))
+        self.assertGreater(DavLock.objects.get(token=token).expires, now() + timedelta(seconds=500))
+        self.assertIsNone(DBLock(DBDavResource('/other')).refresh(token, 600))
+        DavLock.objects.filter(token=token).update(expires=now())
+        self.assertIsNone(DBLock(DBDavResource('/a/b')).refresh(token, 600))
+
+    def test_acquire_conflicts(self):
+        self.assertTrue(self.lock('/a/b'))
+        self.assertIsNone(self.lock('/a/b'))
+        # depth infinity lock on an ancestor, and on a locked descendant
+        self.assertIsNone(self.lock('/a/b/c', depth=0))
+        self.assertIsNone(self.lock('/a'))
+        self.assertTrue(self.lock('/a', depth=0))
+        self.assertTrue(self.lock('/a/c'))
+        self.assertEqual(DavLock.objects.count(), 3)
+
+    def test_acquire_shared(self):
+        self.assertTrue(self.lock('/a', scope='shared'))
+        self.assertTrue(self.lock('/a', scope='shared'))
+        self.assertIsNone(self.lock('/a'))
+        self.assertIsNone(self.lock('/a/b'))
+
+    def test_expired(self):
+        token = self.lock('/a')
+        DavLock.objects.filter(token=token).update(expires=now())
+        self.assertFalse(DBLock(DBDavResource('/a')).has_token(token))
+        self.assertTrue(self.lock('/a'))
+        self.assertFalse(DavLock.objects.filter(token=token).exists())
+
+    def test_has_token(self):
+        token = self.lock('/a', depth=0)
+        self.assertTrue(DBLock(DBDavResource('/a')).has_token('opaquelocktoken:%s' % token))
+        self.assertFalse(DBLock(DBDavResource('/a/b')).has_token(token))
+        self.assertFalse(DBLock(DBDavResource('/a')).has_token('unknown'))
+
+    def test_release(self):
+        token = self.lock('/a')
+        self.assertFalse(DBLock(DBDavResource('/b')).release(token))
+        self.assertTrue(DBLock(DBDavResource('/a/b')).release('<opaquelocktoken:%s>' % token))
+        self.assertFalse(DavLock.objects.exists())
+
+    def test_can_write(self):
+        token = self.lock('/a/b')
+        self.assertTrue(DBLock(DBDavResource('/a')).can_write([]))
+        self.assertFalse(DBLock(DBDavResource('/a')).can_write([], recursive=True))
+        self.assertTrue(DBLock(DBDavResource('/a')).can_write([token], recursive=True))
+        self.assertFalse(DBLock(DBDavResource('/a/b/c')).can_write(['other']))
+        self.assertTrue(DBLock(DBDavResource('/a/b/c')).can_write(['opaquelocktoken:%s' % token]))
+
+    def test_can_write_shared(self):
+        token = self.lock('/a', scope='shared')
+        self.lock('/a', scope='shared')
+        self.assertFalse(DBLock(DBDavResource('/a')).can_write([]))
+        self.assertTrue(DBLock(DBDavResource('/a')).can_write([token]))
+
+    def test_del_locks(self):
+        self.lock('/a/b', depth=0)
+        self.lock('/a/b/c')
+        self.lock('/a/bc')
+        DBLock(DBDavResource('/a/b')).del_locks()
+        self.assertEqual(list(DavLock.objects.values_list('path', flat=True)), ['/a/bc'])
+
+
+class TestDBDeadPropertyStore(TestCase):
+    def setUp(self):
+        self.store = DBDeadPropertyStore()
+        self.store.update(DBDavResource('/a'), {'{urn:x}p': '<p xmlns="urn:x">a</p>'}, [])
+        self.store.update(DBDavResource('/a/b'), {'{urn:x}p': '<p xmlns="urn:x">b</p>', '{}q': '<q/>'}, [])
+        self.store.update(DBDavResource('/ab'), {'{urn:x}p': '<p xmlns="urn:x">ab</p>'}, [])
+
+    def get(self, *paths):
+        return self.store.get_many([DBDavResource(path) for path in paths])
+
+    def test_get_many(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get('/a', '/a/b', '/c'), [
+                {'{urn:x}p': '<p xmlns="urn:x">a</p>'},
+                {'{urn:x}p': '<p xmlns="urn:x">b</p>', '{}q': '<q/>'},
+                {},
+            ])
+
+    def test_update(self):
+        self.store.update(DBDavResource('/a/b'), {'{urn:x}p': '<p xmlns="urn:x">new</p>'}, ['{}q', '{}missing'])
+        self.assertEqual(self.get('/a/b'), [{'{urn:x}p': '<p xmlns="urn:x">new</p>'}])
+
+    def test_update_atomic(self):
+        with patch.object(QuerySet, 'bulk_create', side_effect=ValueError):
+            self.assertRaises(ValueError, self.store.update, DBDavResource('/a/b'), {'{}r': '<r/>'}, ['{}q'])
+        self.assertEqual(self.get('/a/b'), [{'{urn:x}p': '<p xmlns="urn:x">b</p>', '{}q': '<q/>'}])
+
+    def test_unique(self):
+        with transaction.atomic():
+            self.assertRaises(IntegrityError, DavProperty.objects.create, path='/a', namespace='urn:x', name='p',
+                              value='<p xmlns="urn:x">duplicate</p>')
+        bulk_create, calls = QuerySet.bulk_create, []
+
+        def concurrent_bulk_create(queryset, objs, *args, **kwargs):
+            if not calls:
+                calls.append(objs)
+                # stored by another request after this one deleted it
+                DavProperty.objects.create(path='/a', namespace='urn:x', name='p', value='<p xmlns="urn:x">other</p>')
+            return bulk_create(queryset, objs, *args, **kwargs)
+        with patch.object(QuerySet, 'bulk_create', concurrent_bulk_create):
+            self.store.update(DBDavResource('/a'), {'{urn:x}p': '<p xmlns="urn:x">new</p>'}, [])
+        self.assertEqual(self.get('/a'), [{'{urn:x}p': '<p xmlns="urn:x">new</p>'}])
+
+    def test_copy(self):
+        self.store.copy(DBDavResource('/a'), DBDavResource('/c'))
+        self.assertEqual(self.get('/c', '/c/b'), self.get('/a', '/a/b'))
+        self.assertEqual(self.get('/cb'), [{}])
+        self.assertKeys()
+
+    def test_move(self):
+        self.store.move(DBDavResource('/a'), DBDavResource('/c/d'))
+        self.assertEqual(self.get('/a', '/a/b'), [{}, {}])
+        self.assertEqual(self.get('/c/d', '/c/d/b', '/ab')[1], {'{urn:x}p': '<p xmlns="urn:x">b</p>', '{}q': '<q/>'})
+        self.assertEqual(self.get('/ab'), [{'{urn:x}p': '<p xmlns="urn:x">ab</p>'}])
+        self.assertKeys()
+
+    def assertKeys(self):
+        for prop in DavProperty.objects.all():
+            self.assertEqual(prop.key, DavProperty.make_key(prop.path, prop.namespace, prop.name))
+
+    def test_delete(self):
+        self.store.delete(DBDavResource('/a'))
+        self.assertEqual(self.get('/a', '/a/b'), [{}, {}])
+        self.assertEqual(DavProperty.objects.count(), 1)
+
+
+class TestDBUsageStore(TestCase):
+    def setUp(self):
+        self.store = DBUsageStore(quota=100)
+        self.store.add(DBDavResource('/a/b/c'), 30, 1)
+        self.store.add(DBDavResource('/a/d'), 10, 1)
+
+    def test_add(self):
+        self.assertEqual(self.store.get_counters(['/', '/a', '/a/b', '/a/d']), {
+            '/': (40, 2, None), '/a': (40, 2, None), '/a/b': (30, 1, None)
+        })
+
+    def test_available_bytes(self):
+        self.store.set_quota(DBDavResource('/a/b'), 35)
+        collections = [DBDavResource('/'), DBDavResource('/a/b'), DBDavResource('/a/x')]
+        with self.assertNumQueries(1):
+            self.assertEqual(self.store.get_available_bytes(collections), [60, 5, 60])
+        self.assertEqual(self.store.get_used_bytes(collections), [40, 30, 0])
+        self.assertTrue(self.store.can_store(DBDavResource('/a/b/e'), 5))
+        self.assertFalse(self.store.can_store(DBDavResource('/a/b/e'), 6))
+        self.assertTrue(self.store.can_store(DBDavResource('/a/b/e'), -10))
+
+    def test_copy_move_delete(self):
+        self.store.copy_counters('/a', '/x')
+        self.assertEqual(self.store.get_counters(['/x', '/x/b']), {'/x': (40, 2, None), '/x/b': (30, 1, None)})
+        self.store.move_counters('/x', '/y/z')
+        self.assertEqual(self.store.get_counters(['/x', '/x/b', '/y/z', '/y/z/b']), {
+            '/y/z': (40, 2, None), '/y/z/b': (30, 1, None)
+        })
+        self.store.delete_counters('/y')
+        self.assertEqual(DavUsage.objects.count(), 3)
+
+    def test_reset_counters(self):
+        self.store.reset_counters('/a', {'/a': (5, 1), '/a/e': (5, 1)})
+        self.assertEqual(self.store.get_counters(['/a', '/a/b', '/a/e']), {
+            '/a': (5, 1, None), '/a/b': (0, 0, None), '/a/e': (5, 1, None)
+        })
+
+
+class TestDBChangeJournal(TestCase):
+    def setUp(self):
+        self.journal = DBChangeJournal()
+        self.start = self.journal.get_sequence()
+        self.journal.record([DBDavResource('/a/b')], DBChangeJournal.MODIFIED, False)
+        self.journal.record([DBDavResource('/a/c'), DBDavResource('/a/c/d')], DBChangeJournal.MODIFIED, False)
+        self.journal.record([DBDavResource('/a/b')], DBChangeJournal.DELETED, True)
+        self.journal.record([DBDavResource('/ab')], DBChangeJournal.MODIFIED, False)
+
+    def changes(self, sequence, **kwargs):
+        return [change[:3] for change in self.journal.get_changes(DBDavResource('/a'), sequence, **kwargs)]
+
+    def test_get_changes(self):
+        with self.assertNumQueries(2):
+            self.assertEqual(self.changes(self.start), [('/a/c', 'modified', False), ('/a/b', 'deleted', True)])
+        self.assertEqual(self.changes(self.start, infinite=True), [
+            ('/a/c', 'modified', False), ('/a/c/d', 'modified', False), ('/a/b', 'deleted', True)
+        ])
+        self.assertEqual(self.changes(self.start + 2), [('/a/b', 'deleted', True)])
+        self.assertEqual(self.changes(self.journal.get_sequence()), [])
+
+    def test_get_changes_limit(self):
+        self.assertEqual(self.changes(self.start, infinite=True, limit=2), [
+            ('/a/b', 'modified', False), ('/a/c', 'modified', False)
+        ])
+
+    def test_tokens(self):
+        token = self.journal.get_token(self.start + 1)
+        self.assertEqual(self.journal.parse_token(token), self.start + 1)
+        self.assertEqual(self.journal.split_token(token), (self.start + 1, None))
+        token = self.journal.get_token(self.start + 1, '/a/b c?')
+        self.assertEqual(self.journal.split_token(token), (self.start + 1, '/a/b c?'))
+        self.assertEqual(self.journal.split_token(self.journal.get_token(self.start, '')), (self.start, ''))
+        for invalid in ('other', self.journal.token_prefix + 'x', self.journal.get_token(self.journal.get_sequence() + 1)):
+            self.assertRaises(InvalidSyncToken, self.journal.parse_token, invalid)
+
+    def test_record_locked(self):
+        # the lock row is created by the first record and locked by the following ones
+        self.assertEqual(list(DavChangeLock.objects.values_list('name', flat=True)), [self.journal.lock_name])
+        with self.assertNumQueries(4):
+            self.journal.record([DBDavResource('/a/e')], DBChangeJournal.MODIFIED, False)
+        self.assertEqual(DavChangeLock.objects.count(), 1)
+
+    def test_prune(self):
+        DavChange.objects.update(created=now() - self.journal.max_age * 2)
+        self.journal.prune()
+        self.assertEqual(DavChange.objects.count(), 1)
+        self.assertRaises(InvalidSyncToken, self.journal.get_changes, DBDavResource('/a'), self.start)
+        self.assertEqual(self.changes(self.journal.get_sequence() - 1), [])
@@ -0,0 +1,92 @@
+# Refactoring, Django 1.11 compatibility, cleanups, bugfixes (c) 2018 Christian Kreuzberger <ckreuzberger@anexia-it.com>
+# All rights reserved.
+#
+# Portions (c) 2014, Alexander Klimenko <alex@erix.ru>
+# All rights reserved.
+#
+# Copyright (c) 2011, SmartFile <btimby@smartfile.com>
+# All rights reserved.
+#
+# This file is part of DjangoDav.
+#
+# DjangoDav is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DjangoDav is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with DjangoDav.  If not, see <http://www.gnu.org/licenses/>.
+from django.db import transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Concat, Substr
+
+from djangodav.base.usage import BaseUsageStore
+from djangodav.models import DavUsage
+
+
+class DBUsageStore(BaseUsageStore):
+    """
+    Usage store keeping the counters of collections in the database (djangodav.models.DavUsage)
+
+    Counters are looked up by path with one ``IN`` query, also for the ancestors of a whole batch of collections.
+    Updating a resource updates the counters of all its ancestors with a single ``UPDATE``.
+    """
+    model = DavUsage
+    using = None
+    bulk_batch_size = 500
+
+    def get_queryset(self):
+        return self.model.objects.using(self.using)
+
+    def get_tree_lookup(self, path):
+        return Q(path=path) | Q(path__startswith=path.rstrip("/") + "/")
+
+    def get_counters(self, paths):
+        return dict(
+            (path, (nbytes, files, quota))
+            for path, nbytes, files, quota in self.get_queryset().filter(path__in=list(paths)).values_list(
+                'path', 'bytes', 'files', 'quota')
+        )
+
+    def add_counters(self, paths, nbytes, files):
+        with transaction.atomic(using=self.using):
+            self.get_queryset().bulk_create([self.model(path=path) for path in paths], ignore_conflicts=True)
+            self.get_queryset().filter(path__in=paths).update(bytes=F('bytes') + nbytes, files=F('files') + files)
+
+    def reset_counters(self, path, counters):
+        with transaction.atomic(using=self.using):
+            self.get_queryset().filter(self.get_tree_lookup(path)).update(bytes=0, files=0)
+            existing = dict((usage.path, usage) for usage in self.get_queryset().filter(path__in=list(counters)))
+            for usage in existing.values():
+                usage.bytes, usage.files = counters[usage.path]
+            self.get_queryset().bulk_update(list(existing.values()), ['bytes', 'files'], batch_size=self.bulk_batch_size)
+            self.get_queryset().bulk_create([
+                self.model(path=usage_path, bytes=nbytes, files=files)
+                for usage_path, (nbytes, files) in counters.items() if usage_path not in existing
+            ], batch_size=self.bulk_batch_size)
+
+    def set_quota(self, resource, quota):
+        self.get_queryset().update_or_create(path=self.get_path(resource), defaults={'quota': quota})
+
+    def copy_counters(self, path, destination_path):
+        with transaction.atomic(using=self.using):
+            self.delete_counters(destination_path)
+            self.get_queryset().bulk_create([
+                self.model(path=destination_path + usage.path[len(path):], bytes=usage.bytes, files=usage.files)
+                for usage in self.get_queryset().filter(self.get_tree_lookup(path)).iterator()
+            ], batch_size=self.bulk_batch_size)
+
+    def move_counters(self, path, destination_path):
+        with transaction.atomic(using=self.using):
+            self.delete_counters(destination_path)
+            self.get_queryset().filter(self.get_tree_lookup(path)).update(
+                path=Concat(Value(destination_path), Substr('path', len(path) + 1))
+            )
+
+    def delete_counters(self, path):
+        self.get_queryset().filter(self.get_tree_lookup(path)).delete()
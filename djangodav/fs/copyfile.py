@@ -0,0 +1,131 @@
+# Refactoring, Django 1.11 compatibility, cleanups, bugfixes (c) 2018 Christian Kreuzberger <ckreuzberger@anexia-it.com>
+# All rights reserved.
+#
+# Portions (c) 2014, Alexander Klimenko <alex@erix.ru>
+# All rights reserved.
+#
+# Copyright (c) 2011, SmartFile <btimby@smartfile.com>
+# All rights reserved.
+#
+# This file is part of DjangoDav.
+#
+# DjangoDav is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DjangoDav is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with DjangoDav.  If not, see <http://www.gnu.org/licenses/>.
+import errno
+import logging
+import os
+import shutil
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+# ioctl sharing the data blocks of two files (reflink) on Btrfs, XFS and other copy on write file systems
+FICLONE = 0x40049409
+
+# errors meaning a strategy is not supported for the given files, so the next one is tried
+UNSUPPORTED_ERRNOS = set(getattr(errno, name) for name in (
+    'EXDEV', 'ENOSYS', 'EINVAL', 'EOPNOTSUPP', 'ENOTSUP', 'ENOTTY', 'EBADF', 'EPERM', 'ETXTBSY'
+) if hasattr(errno, name))
+
+
+def reflink(fsrc, fdst, size):
+    if fcntl is None:
+        return False
+    try:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    except OSError as e:
+        if e.errno in UNSUPPORTED_ERRNOS:
+            return False
+        raise
+    return True
+
+
+def copy_range(copy_func, fsrc, fdst, size):
+    """Copy with os.copy_file_range or os.sendfile, both copy within the kernel"""
+    offset = 0
+    while offset < size:
+        try:
+            copied = copy_func(fsrc.fileno(), fdst.fileno(), offset, size - offset)
+        except OSError as e:
+            if offset == 0 and e.errno in UNSUPPORTED_ERRNOS:
+                return False
+            raise
+        if copied == 0:
+            break
+        offset += copied
+    return offset > 0 or size == 0
+
+
+def kernel_copy_file_range(src_fd, dst_fd, offset, count):
+    return os.copy_file_range(src_fd, dst_fd, count, offset, offset)
+
+
+def kernel_sendfile(src_fd, dst_fd, offset, count):
+    os.lseek(dst_fd, offset, os.SEEK_SET)
+    return os.sendfile(dst_fd, src_fd, offset, count)
+
+
+def copy_file_obj(fsrc, fdst, buffer_size=1024 * 1024):
+    """
+    Copy the content of the open file fsrc into the empty file fdst, see copy_file
+    :return: the strategy used
+    """
+    size = os.fstat(fsrc.fileno()).st_size
+    if reflink(fsrc, fdst, size):
+        strategy = 'reflink'
+    elif hasattr(os, 'copy_file_range') and copy_range(kernel_copy_file_range, fsrc, fdst, size):
+        strategy = 'copy_file_range'
+    elif hasattr(os, 'sendfile') and copy_range(kernel_sendfile, fsrc, fdst, size):
+        strategy = 'sendfile'
+    else:
+        fsrc.seek(0)
+        fdst.seek(0)
+        fdst.truncate()
+        shutil.copyfileobj(fsrc, fdst, buffer_size)
+        strategy = 'buffered'
+    logger.debug("copied %s to %s (%d bytes) using %s", fsrc.name, fdst.name, size, strategy)
+    return strategy
+
+
+def copy_file(src, dst, buffer_size=1024 * 1024):
+    """
+    Copy the content and mode of a file, trying the cheapest strategy first: a reflink sharing the data blocks, then
+    os.copy_file_range and os.sendfile copying within the kernel, and a buffered copy as the last resort.
+    :return: the strategy used, 'reflink', 'copy_file_range', 'sendfile' or 'buffered'
+    """
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        strategy = copy_file_obj(fsrc, fdst, buffer_size)
+    shutil.copymode(src, dst)
+    return strategy
+
+
+def copy_xattrs(src, dst):
+    """
+    Copy the user extended attributes of a file or directory (e.g. dead properties, see
+    djangodav.fs.properties), symlinks are not followed. Nothing is copied if the file systems do not support them.
+    """
+    if not hasattr(os, 'listxattr'):
+        return
+    try:
+        names = os.listxattr(src, follow_symlinks=False)
+        for name in names:
+            if name.startswith('user.'):
+                os.setxattr(dst, name, os.getxattr(src, name, follow_symlinks=False), follow_symlinks=False)
+    except OSError as e:
+        if e.errno not in (errno.ENOTSUP, errno.EOPNOTSUPP):
+            raise
@@ -0,0 +1,286 @@
+# Refactoring, Django 1.11 compatibility, cleanups, bugfixes (c) 2018 Christian Kreuzberger <ckreuzberger@anexia-it.com>
+# All rights reserved.
+#
+# Portions (c) 2014, Alexander Klimenko <alex@erix.ru>
+# All rights reserved.
+#
+# Copyright (c) 2011, SmartFile <btimby@smartfile.com>
+# All rights reserved.
+#
+# This file is part of DjangoDav.
+#
+# DjangoDav is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DjangoDav is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with DjangoDav.  If not, see <http://www.gnu.org/licenses/>.
+import errno
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from stat import S_IMODE, S_ISREG
+
+from django.utils.functional import cached_property
+
+from djangodav.fs.copyfile import copy_file_obj
+from djangodav.utils import url_join
+
+
+O_NOFOLLOW = getattr(os, 'O_NOFOLLOW', 0)
+O_DIRECTORY = getattr(os, 'O_DIRECTORY', 0)
+O_CLOEXEC = getattr(os, 'O_CLOEXEC', 0)
+
+
+class CachedFd(object):
+    def __init__(self, fd):
+        self.fd = fd
+        self.refs = 0
+        self.evicted = False
+        st = os.fstat(fd)
+        self.key = (st.st_dev, st.st_ino)
+
+
+class DirFdCache(object):
+    """
+    Open directory file descriptors below a root directory. The root is kept open, other directories are opened
+    relative to it one component at a time with O_NOFOLLOW, so no symlink is ever followed and ".." can not
+    escape the root. Up to maxsize directories are kept open in an LRU, a file descriptor in use is only closed
+    once it is released.
+
+    Cached descriptors follow their directory when it is renamed or replaced, e.g. by another process, so before a
+    cached descriptor is used its device and inode are compared with a stat of the path, and it is opened again if
+    they differ.
+    """
+
+    def __init__(self, root, maxsize=0):
+        self.root = root
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.root_fd = None
+        self.fds = OrderedDict()
+
+    def open_root(self):
+        with self.lock:
+            if self.root_fd is None:
+                self.root_fd = os.open(self.root, os.O_RDONLY | O_DIRECTORY | O_CLOEXEC)
+        return self.root_fd
+
+    @contextmanager
+    def directory(self, parts):
+        """Yields a file descriptor of the directory at the path components parts (the root for an empty list)"""
+        parts = tuple(parts)
+        for part in parts:
+            if part in ('', '.', '..') or '/' in part:
+                raise OSError(errno.ENOENT, 'Invalid path component', part)
+        if not parts:
+            yield self.root_fd if self.root_fd is not None else self.open_root()
+            return
+        entry = self.acquire(parts)
+        try:
+            yield entry.fd
+        finally:
+            self.release(entry)
+
+    def acquire(self, parts):
+        with self.lock:
+            entry = self.fds.get(parts)
+            if entry is not None:
+                self.fds.move_to_end(parts)
+                entry.refs += 1
+        if entry is not None:
+            if self.is_current(entry, parts):
+                return entry
+            # renamed or replaced since it was opened
+            with self.lock:
+                if self.fds.get(parts) is entry:
+                    self.evict(self.fds.pop(parts))
+            self.release(entry)
+        fd = self.open(parts)
+        with self.lock:
+            entry = self.fds.get(parts)
+            if entry is not None:
+                # opened concurrently
+                os.close(fd)
+            else:
+                entry = CachedFd(fd)
+                if self.maxsize > 0:
+                    self.fds[parts] = entry
+                    while len(self.fds) > self.maxsize:
+                        self.evict(self.fds.popitem(last=False)[1])
+                else:
+                    entry.evicted = True
+            entry.refs += 1
+            return entry
+
+    def open(self, parts):
+        fd = self.root_fd if self.root_fd is not None else self.open_root()
+        for i, part in enumerate(parts):
+            try:
+                child = os.open(part, os.O_RDONLY | O_DIRECTORY | O_NOFOLLOW | O_CLOEXEC, dir_fd=fd)
+            finally:
+                if i > 0:
+                    os.close(fd)
+            fd = child
+        return fd
+
+    def is_current(self, entry, parts):
+        """Whether the cached descriptor is still the directory at the path components parts"""
+        try:
+            st = os.stat(os.path.join(self.root, *parts), follow_symlinks=False)
+        except OSError:
+            return False
+        return (st.st_dev, st.st_ino) == entry.key
+
+    def release(self, entry):
+        with self.lock:
+            entry.refs -= 1
+            if entry.evicted and entry.refs == 0:
+                os.close(entry.fd)
+
+    def evict(self, entry):
+        entry.evicted = True
+        if entry.refs == 0:
+            os.close(entry.fd)
+
+    def invalidate(self, parts):
+        """Close the cached descriptors of the directory at parts and all directories below it"""
+        parts = tuple(parts)
+        with self.lock:
+            for key in [key for key in self.fds if key[:len(parts)] == parts]:
+                self.evict(self.fds.pop(key))
+
+
+dir_fd_caches = {}
+dir_fd_caches_lock = threading.Lock()
+
+
+class DirFdFSDavResourceMixIn(object):
+    """
+    Does all file system operations relative to directory file descriptors (openat, fstatat, mkdirat, unlinkat,
+    renameat, ...) instead of absolute paths: the kernel does not walk the whole path for each call and symlinks
+    are never followed (symlinks are not listed and can not be accessed). The root directory and up to
+    dir_fd_cache_size parent directories are kept open, a cached directory is checked with a stat of its path
+    before it is used (see DirFdCache).
+
+    With dir_fd_cache_size 0 each call opens every component of the path again, which costs more system calls than
+    plain paths.
+
+    Mix into a file system resource, e.g. ``class MyResource(DirFdFSDavResourceMixIn, DummyFSDAVResource)``.
+    """
+    dir_fd_cache_size = 256
+
+    @classmethod
+    def get_dir_fd_cache(cls):
+        key = (cls.root, cls.dir_fd_cache_size)
+        with dir_fd_caches_lock:
+            if key not in dir_fd_caches:
+                dir_fd_caches[key] = DirFdCache(cls.root, cls.dir_fd_cache_size)
+            return dir_fd_caches[key]
+
+    def parent_directory(self):
+        return self.get_dir_fd_cache().directory(self.path[:-1])
+
+    @cached_property
+    def stat(self):
+        try:
+            if not self.path:
+                with self.get_dir_fd_cache().directory([]) as fd:
+                    return os.fstat(fd)
+            with self.parent_directory() as fd:
+                return os.stat(self.path[-1], dir_fd=fd, follow_symlinks=False)
+        except OSError:
+            return None
+
+    def get_children(self):
+        if self.is_collection:
+            # listed from a descriptor of its own: the read offset of a directory descriptor is shared by everyone
+            # using it, so the cached descriptor must never be listed
+            with self.get_dir_fd_cache().directory(self.path) as fd:
+                list_fd = os.open('.', os.O_RDONLY | O_DIRECTORY | O_CLOEXEC, dir_fd=fd)
+            try:
+                with os.scandir(list_fd) as entries:
+                    children = []
+                    for entry in entries:
+                        if entry.is_symlink():
+                            continue
+                        child = self.clone(url_join(*(self.path + [entry.name])))
+                        # entries of a file descriptor listing need it to stat, do it while it is open
+                        child.__dict__['stat'] = entry.stat(follow_symlinks=False)
+                        children.append(child)
+            finally:
+                os.close(list_fd)
+            for child in children:
+                yield child
+
+    def get_storage_path(self):
+        """The absolute path for offloading, only if it leads to the file checked without following symlinks: the
+        web server opens it by path and would follow them"""
+        if self.stat is None or not S_ISREG(self.stat.st_mode):
+            return None
+        path = self.get_abs_path()
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if (st.st_dev, st.st_ino) != (self.stat.st_dev, self.stat.st_ino):
+            return None
+        return path
+
+    def open_file(self, flags, mode=0o666):
+        with self.parent_directory() as fd:
+            return os.open(self.path[-1], flags | O_NOFOLLOW | O_CLOEXEC, mode, dir_fd=fd)
+
+    def read(self):
+        return os.fdopen(self.open_file(os.O_RDONLY), 'rb')
+
+    def write(self, request, temp_file=None, range_start=None):
+        if temp_file:
+            return super(DirFdFSDavResourceMixIn, self).write(request, temp_file=temp_file)
+        if range_start is None:
+            dst = os.fdopen(self.open_file(os.O_WRONLY | os.O_CREAT | os.O_TRUNC), 'wb')
+        else:
+            dst = os.fdopen(self.open_file(os.O_WRONLY), 'wb')
+            dst.seek(range_start)
+        with dst:
+            shutil.copyfileobj(request, dst)
+        self.invalidate_stat()
+
+    def delete(self):
+        if self.is_collection:
+            for child in self.get_children():
+                child.delete()
+            with self.parent_directory() as fd:
+                os.rmdir(self.path[-1], dir_fd=fd)
+            self.get_dir_fd_cache().invalidate(self.path)
+        elif self.is_object:
+            with self.parent_directory() as fd:
+                os.unlink(self.path[-1], dir_fd=fd)
+        self.invalidate_stat()
+
+    def create_collection(self):
+        with self.parent_directory() as fd:
+            os.mkdir(self.path[-1], dir_fd=fd)
+        self.invalidate_stat()
+
+    def copy_object(self, destination, depth=0):
+        with os.fdopen(self.open_file(os.O_RDONLY), 'rb') as fsrc:
+            with os.fdopen(destination.open_file(os.O_WRONLY | os.O_CREAT | os.O_TRUNC), 'wb') as fdst:
+                strategy = copy_file_obj(fsrc, fdst)
+                os.fchmod(fdst.fileno(), S_IMODE(os.fstat(fsrc.fileno()).st_mode))
+        destination.invalidate_stat()
+        return strategy
+
+    def rename(self, destination):
+        with self.parent_directory() as src_fd, destination.parent_directory() as dst_fd:
+            os.replace(self.path[-1], destination.path[-1], src_dir_fd=src_fd, dst_dir_fd=dst_fd)
+        self.get_dir_fd_cache().invalidate(self.path)
+        destination.get_dir_fd_cache().invalidate(destination.path)
@@ -0,0 +1,120 @@
+# Refactoring, Django 1.11 compatibility, cleanups, bugfixes (c) 2018 Christian Kreuzberger <ckreuzberger@anexia-it.com>
+# All rights reserved.
+#
+# Portions (c) 2014, Alexander Klimenko <alex@erix.ru>
+# All rights reserved.
+#
+# Copyright (c) 2011, SmartFile <btimby@smartfile.com>
+# All rights reserved.
+#
+# This file is part of DjangoDav.
+#
+# DjangoDav is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DjangoDav is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with DjangoDav.  If not, see <http://www.gnu.org/licenses/>.
+import hashlib
+import os
+import sqlite3
+import threading
+
+from djangodav.utils import LRUCache
+
+
+def stat_key(stat):
+    """Return the fields of a stat result that change whenever the content of a file changes."""
+    return stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class BaseEtagProvider(object):
+    """Computes entity tags for file system resources, see BaseFSDavResource.etag_provider"""
+
+    def get_etag(self, resource):
+        raise NotImplementedError()
+
+
+class StatEtagProvider(BaseEtagProvider):
+    """Formats the device, inode, modification time (in ns) and size of a resource as entity tag. This is the
+    cheapest possible etag, it uses the (cached) stat result of the resource only."""
+
+    def get_etag(self, resource):
+        return '%x-%x-%x-%x' % stat_key(resource.stat)
+
+
+class ContentHashEtagProvider(StatEtagProvider):
+    """Uses a hash of the file content as (strong) entity tag.
+
+    Hashes are kept in an in-process LRU cache and, if cache_path is given, in a sqlite database that can be
+    shared by all worker processes. Both are keyed on the raw stat fields of the file (device, inode, modification
+    time and size), so a hash is computed once and reused until the file changes. Collections use the stat based
+    etag."""
+
+    chunk_size = 1024 * 1024
+
+    def __init__(self, algorithm='sha1', cache_size=10000, cache_path=None):
+        self.algorithm = algorithm
+        self.cache = LRUCache(cache_size)
+        self.disk_cache = SQLiteEtagCache(cache_path) if cache_path else None
+
+    def get_etag(self, resource):
+        if not resource.is_object:
+            return super(ContentHashEtagProvider, self).get_etag(resource)
+        key = stat_key(resource.stat)
+        etag = self.cache.get(key)
+        if etag is None and self.disk_cache is not None:
+            etag = self.disk_cache.get(key)
+        if etag is None:
+            etag = self.compute_etag(resource)
+            if stat_key(os.stat(resource.get_abs_path())) != key:
+                # modified while hashing, don't remember the hash of a mixed content
+                return etag
+            if self.disk_cache is not None:
+                self.disk_cache.set(key, etag)
+        self.cache.set(key, etag)
+        return etag
+
+    def compute_etag(self, resource):
+        hashsum = hashlib.new(self.algorithm)
+        with open(resource.get_abs_path(), 'rb') as f:
+            for chunk in iter(lambda: f.read(self.chunk_size), b''):
+                hashsum.update(chunk)
+        return hashsum.hexdigest()
+
+
+class SQLiteEtagCache(object):
+    """Persists entity tags in a sqlite database, keeping one row per file (device and inode)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+    @property
+    def connection(self):
+        # sqlite connections must not be shared between threads (or forked processes)
+        if getattr(self.local, 'pid', None) != os.getpid():
+            self.local.connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self.local.connection.execute('PRAGMA journal_mode=WAL')
+            self.local.connection.execute(
+                'CREATE TABLE IF NOT EXISTS etags (dev INTEGER, ino INTEGER, mtime_ns INTEGER, size INTEGER, '
+                'etag TEXT, PRIMARY KEY (dev, ino))'
+            )
+            self.local.pid = os.getpid()
+        return self.local.connection
+
+    def get(self, key):
+        dev, ino, mtime_ns, size = key
+        row = self.connection.execute(
+            'SELECT etag FROM etags WHERE dev = ? AND ino = ? AND mtime_ns = ? AND size = ?', (dev, ino, mtime_ns, size)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, etag):
+        self.connection.execute('INSERT OR REPLACE INTO etags VALUES (?, ?, ?, ?, ?)', key + (etag,))
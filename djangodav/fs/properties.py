@@ -0,0 +1,110 @@
+# Refactoring, Django 1.11 compatibility, cleanups, bugfixes (c) 2018 Christian Kreuzberger <ckreuzberger@anexia-it.com>
+# All rights reserved.
+#
+# Portions (c) 2014, Alexander Klimenko <alex@erix.ru>
+# All rights reserved.
+#
+# Copyright (c) 2011, SmartFile <btimby@smartfile.com>
+# All rights reserved.
+#
+# This file is part of DjangoDav.
+#
+# DjangoDav is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DjangoDav is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with DjangoDav.  If not, see <http://www.gnu.org/licenses/>.
+import errno
+import json
+import os
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+from djangodav.base.properties import BaseDeadPropertyStore
+
+
+O_NOFOLLOW = getattr(os, 'O_NOFOLLOW', 0)
+O_CLOEXEC = getattr(os, 'O_CLOEXEC', 0)
+
+
+class XattrDeadPropertyStore(BaseDeadPropertyStore):
+    """
+    Dead property store keeping the properties of a file or directory in one extended attribute (Linux xattrs) as a
+    JSON object, for resources of djangodav.fs. Properties stay with the file when it is moved or renamed, loading
+    the properties of a resource takes a single getxattr call.
+
+    The file system has to support user extended attributes (e.g. ext4, xfs or btrfs), on other file systems
+    resources have no properties and PROPPATCH fails. Updates lock the file (flock), the size of all properties of a
+    resource is limited by the file system (usually 4 KiB to 64 KiB).
+    """
+    attribute = 'user.djangodav.properties'
+
+    def get_xattr_kwargs(self, path):
+        # symlinks are not followed, a file descriptor refers to the opened file itself
+        return {} if isinstance(path, int) else {'follow_symlinks': False}
+
+    def read(self, path):
+        """Returns the properties of the file or directory at path (or of the open file descriptor)"""
+        try:
+            return json.loads(os.getxattr(path, self.attribute, **self.get_xattr_kwargs(path)).decode('utf-8'))
+        except OSError as e:
+            if e.errno in (errno.ENODATA, errno.ENOTSUP, errno.ENOENT):
+                return {}
+            raise
+
+    def write(self, path, props):
+        """Replaces the properties of the file or directory at path (or of the open file descriptor)
+        :raises OSError: E2BIG or ENOSPC if the properties exceed the size of an extended attribute"""
+        if props:
+            os.setxattr(path, self.attribute, json.dumps(props, sort_keys=True).encode('utf-8'),
+                        **self.get_xattr_kwargs(path))
+            return
+        try:
+            os.removexattr(path, self.attribute, **self.get_xattr_kwargs(path))
+        except OSError as e:
+            if e.errno != errno.ENODATA:
+                raise
+
+    def get_many(self, resources):
+        return [self.read(resource.get_abs_path()) for resource in resources]
+
+    def update(self, resource, set_props, remove_props):
+        fd = os.open(resource.get_abs_path(), os.O_RDONLY | O_NOFOLLOW | O_CLOEXEC)
+        try:
+            if fcntl:
+                # concurrent updates of the resource are serialized, so none of them is lost
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            props = self.read(fd)
+            for name in remove_props:
+                props.pop(name, None)
+            props.update(set_props)
+            # a single setxattr replaces all properties at once
+            self.write(fd, props)
+        finally:
+            # releases the lock
+            os.close(fd)
+
+    def copy(self, resource, destination):
+        source_root, destination_root = resource.get_abs_path(), destination.get_abs_path()
+        for source in resource.get_descendants(depth=-1):
+            props = self.read(source.get_abs_path())
+            if props:
+                self.write(destination_root + source.get_abs_path()[len(source_root):], props)
+
+    def move(self, resource, destination):
+        # the extended attributes are moved with the files
+        pass
+
+    def delete(self, resource):
+        # the extended attributes are deleted with the files
+        pass
@@ -22,16 +22,34 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with DjangoDav.  If not, see <http://www.gnu.org/licenses/>.
 import datetime
+import errno
 import os
 import shutil
+import tempfile
+import time
+from stat import S_ISDIR, S_ISREG, S_IMODE
 from sys import getfilesystemencoding
 
+from django.core.exceptions import PermissionDenied
+from django.utils.functional import cached_property
+
 from djangodav.base.resources import BaseDavResource
+from djangodav.fs.copyfile import copy_file, copy_xattrs
+from djangodav.fs.etags import StatEtagProvider
 from djangodav.utils import url_join
 
 fs_encoding = getfilesystemencoding()
 
 
+def get_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+# read once, changing the umask is not thread safe
+default_file_mode = 0o666 & ~get_umask()
+
+
 class BaseFSDavResource(BaseDavResource):
     """Implements an interface to the file system. This can be subclassed to provide
     a virtual file system (like say in MySQL). This default implementation simply uses
@@ -39,6 +57,14 @@ class BaseFSDavResource(BaseDavResource):
 
     root = None
     quote = False
+    dir_entry = None
+    # computes the etag property, see djangodav.fs.etags
+    etag_provider = StatEtagProvider()
+
+    def __init__(self, path, **kwargs):
+        if 'dir_entry' in kwargs:  # Accepting an os.DirEntry from the parent listing to reduce syscalls
+            self.dir_entry = kwargs.pop('dir_entry')
+        super(BaseFSDavResource, self).__init__(path)
 
     def get_abs_path(self):
         """Return the absolute path of the resource. Used internally to interface with
@@ -46,48 +72,87 @@ class BaseFSDavResource(BaseDavResource):
         be used."""
         return os.path.join(self.root, *self.path)
 
+    def get_storage_path(self):
+        return self.get_abs_path()
+
+    @cached_property
+    def stat(self):
+        """Return the os.stat result of the resource, or None if it does not exist. The result is
+        cached for the lifetime of this resource object, so operations that change the resource
+        must call invalidate_stat."""
+        try:
+            if self.dir_entry is not None:
+                # DirEntry caches its own stat result
+                return self.dir_entry.stat()
+            return os.stat(self.get_abs_path())
+        except OSError:
+            return None
+
+    def invalidate_stat(self):
+        """Drop the cached stat result (and directory entry), it is fetched again on next access."""
+        self.__dict__.pop('stat', None)
+        self.dir_entry = None
+
     @property
     def getcontentlength(self):
         """Return the size of the resource in bytes."""
-        return os.path.getsize(self.get_abs_path())
+        return self.stat.st_size
 
     def get_created(self):
         """Return the create time as datetime object."""
-        return datetime.datetime.fromtimestamp(os.stat(self.get_abs_path()).st_ctime)
+        return datetime.datetime.fromtimestamp(self.stat.st_ctime)
 
     def get_modified(self):
         """Return the modified time as datetime object."""
-        return datetime.datetime.fromtimestamp(os.stat(self.get_abs_path()).st_mtime)
+        return datetime.datetime.fromtimestamp(self.stat.st_mtime)
+
+    @property
+    def etag(self):
+        """Return the entity tag of the resource, as computed by etag_provider."""
+        return self.etag_provider.get_etag(self)
 
     @property
     def is_collection(self):
         """Return True if this resource is a directory (collection in WebDAV parlance)."""
-        return os.path.isdir(self.get_abs_path())
+        if self.dir_entry is not None and 'stat' not in self.__dict__:
+            # answered from the file type returned by the directory listing, without a stat call
+            return self.dir_entry.is_dir()
+        return self.stat is not None and S_ISDIR(self.stat.st_mode)
 
     @property
     def is_object(self):
         """Return True if this resource is a file (resource in WebDAV parlance)."""
-        return os.path.isfile(self.get_abs_path())
+        if self.dir_entry is not None and 'stat' not in self.__dict__:
+            return self.dir_entry.is_file()
+        return self.stat is not None and S_ISREG(self.stat.st_mode)
 
     @property
     def exists(self):
         """Return True if this resource exists."""
-        return os.path.exists(self.get_abs_path())
+        if self.dir_entry is not None and not self.dir_entry.is_symlink():
+            # it was just listed, only a symlink may point nowhere
+            return True
+        return self.stat is not None
+
+    def get_listing_token(self):
+        return self.stat.st_dev, self.stat.st_ino, self.stat.st_mtime_ns
+
+    def get_listing_state(self, child):
+        return child.stat
+
+    def restore_listing_child(self, name, state):
+        child = self.clone(url_join(*(self.path + [name])))
+        child.__dict__['stat'] = state
+        return child
 
     def get_children(self):
-        """Return an iterator of all direct children of this resource."""
+        """Return an iterator of all direct children of this resource. Each child is seeded with
+        its os.DirEntry, so the file type and stat result of the listing are reused."""
         # make sure the current object is a directory
-        path = self.get_abs_path()
-
-        if os.path.isdir(path):
-            for child in os.listdir(path):
-                try:
-                    is_unicode = isinstance(child, str)
-                except NameError:  # Python 3 fix
-                    is_unicode = isinstance(child, str)
-                if not is_unicode:
-                    child = child.decode(fs_encoding)
-                yield self.clone(url_join(*(self.path + [child])))
+        if self.is_collection:
+            with os.scandir(self.get_abs_path()) as entries:
+                for entry in entries:
+                    yield self.clone(url_join(*(self.path + [entry.name])), dir_entry=entry)
 
     def write(self, content, temp_file=None, range_start=None):
         raise NotImplementedError
@@ -103,16 +168,66 @@ class BaseFSDavResource(BaseDavResource):
             os.rmdir(self.get_abs_path())
         elif self.is_object:
             os.remove(self.get_abs_path())
+        self.invalidate_stat()
 
     def create_collection(self):
         """Create a directory in the location of this resource."""
         os.mkdir(self.get_abs_path())
+        self.invalidate_stat()
 
     def copy_object(self, destination, depth=0):
-        shutil.copy(self.get_abs_path(), destination.get_abs_path())
+        """Copy the file, using a reflink or an in-kernel copy if possible (see djangodav.fs.copyfile).
+        Returns the copy strategy used."""
+        strategy = copy_file(self.get_abs_path(), destination.get_abs_path())
+        destination.invalidate_stat()
+        return strategy
+
+    def move(self, destination):
+        """Move collections with a single rename if source and destination are on the same device, otherwise
+        by copying and deleting (in parallel with djangodav.fs.tree.ParallelTreeFSDavResourceMixIn)."""
+        if not self.is_collection or (destination.exists and not destination.is_collection):
+            return super(BaseFSDavResource, self).move(destination)
+        parent = destination.get_parent()
+        if parent.stat is not None and parent.stat.st_dev == self.stat.st_dev:
+            try:
+                # replaces an empty destination directory
+                self.rename(destination)
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.ENOTEMPTY, errno.EEXIST):
+                    raise
+            else:
+                self.invalidate_stat()
+                destination.invalidate_stat()
+                return None
+        errors = self.copy(destination)
+        if errors:
+            return errors
+        self.copy_xattrs(destination)
+        return self.delete()
 
     def move_object(self, destination):
-        os.rename(self.get_abs_path(), destination.get_abs_path())
+        try:
+            self.rename(destination)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            self.copy_object(destination)
+            copy_xattrs(self.get_abs_path(), destination.get_abs_path())
+            self.delete()
+        self.invalidate_stat()
+        destination.invalidate_stat()
+
+    def copy_xattrs(self, destination):
+        """Copy the extended attributes of the resource and of everything within it to its copy at destination, so a
+        move across file systems keeps them like a rename"""
+        source_root, destination_root = self.get_abs_path(), destination.get_abs_path()
+        for source in self.get_descendants(depth=-1):
+            source_path = source.get_abs_path()
+            copy_xattrs(source_path, destination_root + source_path[len(source_root):])
+
+    def rename(self, destination):
+        """Rename the file or directory to the destination, replacing a file or an empty directory there"""
+        os.replace(self.get_abs_path(), destination.get_abs_path())
 
 
 class DummyReadFSDavResource(BaseFSDavResource):
@@ -127,6 +242,7 @@ class DummyWriteFSDavResource(BaseFSDavResource):
     def write(self, request, temp_file=None, range_start=None):
         if temp_file:
             # move temp file (e.g., coming from nginx)
+            self.keep_xattrs(temp_file)
             shutil.move(temp_file, self.get_abs_path())
         elif range_start == None:
             # open binary file and write to disk
@@ -137,6 +253,130 @@ class DummyWriteFSDavResource(BaseFSDavResource):
             with open(self.get_abs_path(), 'r+b') as dst:
                 dst.seek(range_start)
                 shutil.copyfileobj(request, dst)
+        self.invalidate_stat()
+
+    def keep_xattrs(self, path):
+        """Copy the extended attributes (e.g. dead properties) of the file about to be replaced by the file at path,
+        they would be lost with its inode"""
+        try:
+            copy_xattrs(self.get_abs_path(), path)
+        except FileNotFoundError:
+            pass
+
+
+class AtomicWriteFSDavResource(DummyWriteFSDavResource):
+    """
+    Writes uploads into a temporary file next to the target and publishes it with an atomic rename, so readers either
+    see the previous or the new version of the file, never a partial one, and a failed upload keeps the previous
+    version. Range writes are still done in place.
+
+    Temporary files are hidden from listings and can not be requested, stale ones (left over by a dead process) are
+    removed when their directory is listed.
+    """
+    # suffix of the temporary files, they are named ".<name>.<random><temp_suffix>"
+    temp_suffix = '.djangodav-tmp'
+    # temporary files older than this many seconds are left over by a dead process and removed
+    temp_max_age = 24 * 3600
+    # buffer size used to copy the request body
+    write_buffer_size = 1024 * 1024
+    # None: no fsync, 'file': fsync the file before it is published, 'full': also fsync the directory afterwards
+    fsync = 'file'
+    # preallocate the file if the length of the upload is known
+    preallocate = True
+
+    def get_content_length(self, request):
+        try:
+            return int(request.META.get('CONTENT_LENGTH') or 0)
+        except (AttributeError, ValueError):
+            return 0
+
+    @classmethod
+    def is_temp_name(cls, name):
+        return name.startswith('.') and name.endswith(cls.temp_suffix)
+
+    def is_temp_path(self):
+        """Whether the path leads to (or into) a temporary file"""
+        return any(self.is_temp_name(part) for part in self.path)
+
+    def check_temp_path(self):
+        if self.is_temp_path():
+            raise PermissionDenied('Temporary files of uploads can not be written')
+
+    @cached_property
+    def stat(self):
+        if self.is_temp_path():
+            return None
+        return super(AtomicWriteFSDavResource, self).stat
+
+    def get_children(self):
+        limit = time.time() - self.temp_max_age
+        for child in super(AtomicWriteFSDavResource, self).get_children():
+            if self.is_temp_name(child.path[-1]):
+                self.remove_stale_temp_file(child.get_abs_path(), limit)
+            else:
+                yield child
+
+    def remove_stale_temp_file(self, path, limit):
+        """Delete the temporary file at path if it was not modified since limit"""
+        try:
+            if os.stat(path, follow_symlinks=False).st_mtime < limit:
+                os.unlink(path)
+        except OSError:
+            pass
+
+    def get_file_mode(self):
+        """Mode of the published file: the mode of the replaced file, else the default mode for new files"""
+        if self.stat is not None:
+            return S_IMODE(self.stat.st_mode)
+        return default_file_mode
+
+    def create_collection(self):
+        self.check_temp_path()
+        super(AtomicWriteFSDavResource, self).create_collection()
+
+    def copy_object(self, destination, depth=0):
+        destination.check_temp_path()
+        return super(AtomicWriteFSDavResource, self).copy_object(destination, depth)
+
+    def rename(self, destination):
+        destination.check_temp_path()
+        super(AtomicWriteFSDavResource, self).rename(destination)
+
+    def write(self, request, temp_file=None, range_start=None):
+        self.check_temp_path()
+        if temp_file or range_start is not None:
+            return super(AtomicWriteFSDavResource, self).write(request, temp_file=temp_file, range_start=range_start)
+        path = self.get_abs_path()
+        directory, name = os.path.split(path)
+        # in the directory of the file, so it is published with a rename on the same file system
+        fd, temp_path = tempfile.mkstemp(prefix='.%s.' % name, suffix=self.temp_suffix, dir=directory)
+        try:
+            with os.fdopen(fd, 'wb', buffering=0) as dst:
+                length = self.get_content_length(request)
+                if self.preallocate and length > 0 and hasattr(os, 'posix_fallocate'):
+                    try:
+                        os.posix_fallocate(dst.fileno(), 0, length)
+                    except OSError:
+                        pass  # not supported by the file system
+                shutil.copyfileobj(request, dst, self.write_buffer_size)
+                # the body may be shorter than the preallocated length
+                dst.truncate()
+                os.fchmod(dst.fileno(), self.get_file_mode())
+                if self.fsync:
+                    os.fsync(dst.fileno())
+            self.keep_xattrs(temp_path)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        if self.fsync == 'full':
+            dir_fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        self.invalidate_stat()
+
 
 class DummyFSDAVResource(DummyReadFSDavResource, DummyWriteFSDavResource, BaseFSDavResource):
     pass
@@ -21,9 +21,28 @@
 #
 # You should have received a copy of the GNU Affero General Public License
 # along with DjangoDav.  If not, see <http://www.gnu.org/licenses/>.
+import errno
+import fcntl
+import os
+import shutil
+import threading
+import time
+from io import BytesIO
+from hashlib import sha1
+from stat import S_IFDIR, S_IFREG
+from tempfile import mkdtemp
+
+from django.core.exceptions import PermissionDenied
 from django.test import TestCase
-from djangodav.fs.resources import BaseFSDavResource
-from mock import patch
+from djangodav.cache import DjangoListingCache, ListingCacheMixIn, LocalListingCache
+from djangodav.fs.copyfile import copy_file
+from djangodav.fs.dirfd import DirFdCache, DirFdFSDavResourceMixIn
+from djangodav.fs.etags import ContentHashEtagProvider
+from djangodav.fs.properties import XattrDeadPropertyStore
+from djangodav.fs.resources import AtomicWriteFSDavResource, BaseFSDavResource, DummyFSDAVResource
+from djangodav.fs.tree import ParallelTreeFSDavResourceMixIn
+from djangodav.fs.usage import SQLiteUsageStore
+from mock import patch, Mock
 
 
 class TestFSDavResource(TestCase):
@@ -34,37 +53,646 @@ class TestFSDavResource(TestCase):
     def setUp(self):
         self.resource = self.FSDavResource("/path/to/name")
 
-    @patch('djangodav.fs.resources.os.path.isdir')
-    def test_is_collection(self, isdir):
-        isdir.return_value = True
+    @patch('djangodav.fs.resources.os.stat')
+    def test_is_collection(self, stat):
+        stat.return_value = os.stat_result((S_IFDIR, 0, 0, 0, 0, 0, 0, 0, 0, 0))
         self.assertTrue(self.resource.is_collection)
-        isdir.assert_called_with('/some/folder/path/to/name')
+        self.assertFalse(self.resource.is_object)
+        stat.assert_called_with('/some/folder/path/to/name')
 
-    @patch('djangodav.fs.resources.os.path.isfile')
-    def test_isfile(self, isfile):
-        isfile.return_value = True
+    @patch('djangodav.fs.resources.os.stat')
+    def test_isfile(self, stat):
+        stat.return_value = os.stat_result((S_IFREG, 0, 0, 0, 0, 0, 0, 0, 0, 0))
         self.assertTrue(self.resource.is_object)
-        isfile.assert_called_with('/some/folder/path/to/name')
+        self.assertFalse(self.resource.is_collection)
+        stat.assert_called_with('/some/folder/path/to/name')
 
-    @patch('djangodav.fs.resources.os.path.exists')
-    def test_isfile(self, exists):
-        exists.return_value = True
+    @patch('djangodav.fs.resources.os.stat')
+    def test_exists(self, stat):
+        stat.return_value = os.stat_result((S_IFREG, 0, 0, 0, 0, 0, 0, 0, 0, 0))
         self.assertTrue(self.resource.exists)
-        exists.assert_called_with('/some/folder/path/to/name')
+        stat.assert_called_with('/some/folder/path/to/name')
+
+    @patch('djangodav.fs.resources.os.stat')
+    def test_missing(self, stat):
+        stat.side_effect = FileNotFoundError()
+        self.assertFalse(self.resource.exists)
+        self.assertFalse(self.resource.is_collection)
+        self.assertFalse(self.resource.is_object)
 
-    @patch('djangodav.fs.resources.os.path.getsize')
-    def test_get_size(self, getsize):
-        getsize.return_value = 42
+    @patch('djangodav.fs.resources.os.stat')
+    def test_get_size(self, stat):
+        stat.return_value = os.stat_result((S_IFREG, 0, 0, 0, 0, 0, 42, 0, 0, 0))
         self.assertEqual(self.resource.getcontentlength, 42)
-        getsize.assert_called_with('/some/folder/path/to/name')
+        stat.assert_called_with('/some/folder/path/to/name')
+
+    @patch('djangodav.fs.resources.os.stat')
+    def test_stat_cached(self, stat):
+        stat.return_value = os.stat_result((S_IFREG, 0, 0, 0, 0, 0, 42, 0, 0, 0))
+        self.assertTrue(self.resource.exists)
+        self.assertTrue(self.resource.is_object)
+        self.assertEqual(self.resource.getcontentlength, 42)
+        self.resource.get_created()
+        self.resource.get_modified()
+        self.assertEqual(stat.call_count, 1)
+        self.resource.invalidate_stat()
+        self.assertTrue(self.resource.exists)
+        self.assertEqual(stat.call_count, 2)
+
+    @patch('djangodav.fs.resources.os.remove')
+    @patch('djangodav.fs.resources.os.stat')
+    def test_delete_invalidates_stat(self, stat, remove):
+        stat.return_value = os.stat_result((S_IFREG, 0, 0, 0, 0, 0, 42, 0, 0, 0))
+        self.assertTrue(self.resource.exists)
+        stat.side_effect = FileNotFoundError()
+        self.resource.delete()
+        remove.assert_called_with('/some/folder/path/to/name')
+        self.assertFalse(self.resource.exists)
 
     def test_get_abs_path(self):
         self.assertEqual(self.resource.get_abs_path(), '/some/folder/path/to/name')
 
-    @patch('djangodav.fs.resources.os.listdir')
-    def test_get_children(self, listdir):
-        listdir.return_value=['child1', 'child2']
+    @patch('djangodav.fs.resources.os.scandir')
+    @patch('djangodav.fs.resources.os.stat')
+    def test_get_children(self, stat, scandir):
+        stat.return_value = os.stat_result((S_IFDIR, 0, 0, 0, 0, 0, 0, 0, 0, 0))
+        entries = [
+            Mock(is_dir=Mock(return_value=True), is_symlink=Mock(return_value=False)),
+            Mock(is_dir=Mock(return_value=False), is_symlink=Mock(return_value=False)),
+        ]
+        entries[0].name, entries[1].name = 'child1', 'child2'
+        scandir.return_value.__enter__.return_value = iter(entries)
         children = list(self.resource.get_children())
         self.assertEqual(children[0].path, ['path', 'to', 'name', 'child1'])
         self.assertEqual(children[1].path, ['path', 'to', 'name', 'child2'])
-        listdir.assert_called_with('/some/folder/path/to/name')
+        scandir.assert_called_with('/some/folder/path/to/name')
+        self.assertTrue(children[0].exists)
+        self.assertTrue(children[0].is_collection)
+        self.assertFalse(children[1].is_collection)
+        # the type comes from the directory entry, only the parent was stat'ed
+        self.assertEqual(stat.call_count, 1)
+
+    def test_get_children_real(self):
+        root = mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        os.mkdir(os.path.join(root, 'dir'))
+        with open(os.path.join(root, 'file'), 'wb') as f:
+            f.write(b'x' * 42)
+
+        class FSDavResource(BaseFSDavResource):
+            pass
+        FSDavResource.root = root
+
+        children = sorted(FSDavResource('/').get_children(), key=lambda c: c.displayname)
+        self.assertEqual([c.get_path() for c in children], ['/dir/', '/file'])
+        self.assertEqual(children[1].getcontentlength, 42)
+        self.assertTrue(children[1].is_object)
+
+
+class TestEtagProviders(TestCase):
+    def setUp(self):
+        self.root = mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.file_path = os.path.join(self.root, 'file')
+        with open(self.file_path, 'wb') as f:
+            f.write(b'content')
+
+        class FSDavResource(BaseFSDavResource):
+            root = self.root
+        self.resource_class = FSDavResource
+
+    def test_stat_etag(self):
+        resource = self.resource_class('/file')
+        st = os.stat(self.file_path)
+        self.assertEqual(resource.etag, '%x-%x-%x-%x' % (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size))
+
+    def test_content_hash_etag(self):
+        self.resource_class.etag_provider = provider = ContentHashEtagProvider(
+            cache_path=os.path.join(self.root, 'etags.sqlite'))
+        self.assertEqual(self.resource_class('/file').etag, sha1(b'content').hexdigest())
+
+        # same stat fields: the hash is reused without reading the file again
+        st = os.stat(self.file_path)
+        with open(self.file_path, 'wb') as f:
+            f.write(b'CONTENT')
+        os.utime(self.file_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+        self.assertEqual(self.resource_class('/file').etag, sha1(b'content').hexdigest())
+
+        # also from the shared cache of another process
+        provider.cache.clear()
+        self.assertEqual(self.resource_class('/file').etag, sha1(b'content').hexdigest())
+
+        # the file changed
+        os.utime(self.file_path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+        self.assertEqual(self.resource_class('/file').etag, sha1(b'CONTENT').hexdigest())
+
+    def test_content_hash_etag_collection(self):
+        self.resource_class.etag_provider = ContentHashEtagProvider()
+        st = os.stat(self.root)
+        self.assertEqual(self.resource_class('/').etag, '%x-%x-%x-%x' % (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size))
+
+
+class TestAtomicWrite(TestCase):
+    def setUp(self):
+        self.root = mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.file_path = os.path.join(self.root, 'file')
+        with open(self.file_path, 'wb') as f:
+            f.write(b'previous content')
+        os.chmod(self.file_path, 0o640)
+
+        class FSDavResource(AtomicWriteFSDavResource):
+            root = self.root
+            write_buffer_size = 4
+        self.resource_class = FSDavResource
+
+    def request(self, content, length=None):
+        request = BytesIO(content)
+        request.META = {'CONTENT_LENGTH': str(len(content) if length is None else length)}
+        return request
+
+    def test_write(self):
+        resource = self.resource_class('/file')
+        self.assertEqual(resource.getcontentlength, 16)
+        resource.write(self.request(b'new content'))
+        with open(self.file_path, 'rb') as f:
+            self.assertEqual(f.read(), b'new content')
+        self.assertEqual(resource.getcontentlength, 11)
+        self.assertEqual(os.stat(self.file_path).st_mode & 0o777, 0o640)
+        self.assertEqual(os.listdir(self.root), ['file'])
+
+    def test_write_new_file(self):
+        self.resource_class.fsync = 'full'
+        self.resource_class('/new').write(self.request(b'content'))
+        with open(os.path.join(self.root, 'new'), 'rb') as f:
+            self.assertEqual(f.read(), b'content')
+
+    def test_write_shorter_than_preallocated(self):
+        self.resource_class('/file').write(self.request(b'abc', length=100))
+        self.assertEqual(os.path.getsize(self.file_path), 3)
+
+    def test_failed_write_keeps_previous_version(self):
+        request = self.request(b'new content')
+        request.read = Mock(side_effect=IOError('connection reset'))
+        with self.assertRaises(IOError):
+            self.resource_class('/file').write(request)
+        with open(self.file_path, 'rb') as f:
+            self.assertEqual(f.read(), b'previous content')
+        self.assertEqual(os.listdir(self.root), ['file'])
+
+    def test_temp_file_hidden(self):
+        os.mkdir(os.path.join(self.root, 'dir'))
+        request = self.request(b'new content')
+        listings = []
+
+        def read(size):
+            temp_name = [name for name in os.listdir(os.path.join(self.root, 'dir')) if name != 'file'][0]
+            temp_file = self.resource_class('/dir/' + temp_name)
+            listings.append(([child.get_path() for child in self.resource_class('/dir/').get_children()],
+                             temp_file.exists))
+            with self.assertRaises(PermissionDenied):
+                temp_file.write(self.request(b'x'))
+            return b''
+        request.read = Mock(side_effect=read)
+        self.resource_class('/dir/file').write(request)
+        # staged next to the file
+        self.assertEqual(listings, [([], False)])
+        self.assertEqual(os.listdir(os.path.join(self.root, 'dir')), ['file'])
+
+    def test_remove_stale_temp_files(self):
+        for name, age in (('.stale.1.djangodav-tmp', 2 * 24 * 3600), ('.current.2.djangodav-tmp', 0)):
+            open(os.path.join(self.root, name), 'wb').close()
+            mtime = time.time() - age
+            os.utime(os.path.join(self.root, name), (mtime, mtime))
+        self.assertEqual([child.get_path() for child in self.resource_class('/').get_children()], ['/file'])
+        self.assertEqual(sorted(os.listdir(self.root)), ['.current.2.djangodav-tmp', 'file'])
+
+    def test_range_write_in_place(self):
+        inode = os.stat(self.file_path).st_ino
+        self.resource_class('/file').write(self.request(b'NEW'), range_start=9)
+        with open(self.file_path, 'rb') as f:
+            self.assertEqual(f.read(), b'previous NEWtent')
+        self.assertEqual(os.stat(self.file_path).st_ino, inode)
+
+
+class TestParallelTree(TestCase):
+    def setUp(self):
+        self.root = mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        for d in ('src', 'src/a', 'src/a/b', 'src/c'):
+            os.mkdir(os.path.join(self.root, d))
+            for i in range(5):
+                with open(os.path.join(self.root, d, 'file%d' % i), 'wb') as f:
+                    f.write(d.encode())
+
+        class FSDavResource(ParallelTreeFSDavResourceMixIn, DummyFSDAVResource):
+            root = self.root
+            tree_workers = 4
+        self.resource_class = FSDavResource
+
+    def tree(self, path):
+        result = []
+        for dirpath, dirnames, filenames in os.walk(os.path.join(self.root, path)):
+            rel = os.path.relpath(dirpath, os.path.join(self.root, path))
+            result.extend(os.path.normpath(os.path.join(rel, name)) for name in dirnames + filenames)
+        return sorted(result)
+
+    def test_copy(self):
+        errors = self.resource_class('/src/').copy(self.resource_class('/dst/'))
+        self.assertEqual(errors, [])
+        self.assertEqual(self.tree('dst'), self.tree('src'))
+        with open(os.path.join(self.root, 'dst/a/b/file3'), 'rb') as f:
+            self.assertEqual(f.read(), b'src/a/b')
+
+    def test_copy_depth(self):
+        self.resource_class('/src/').copy(self.resource_class('/dst/'), depth=1)
+        self.assertEqual(self.tree('dst'), ['a', 'c'] + ['file%d' % i for i in range(5)])
+
+    def test_copy_errors(self):
+        copy_object = self.resource_class.copy_object
+
+        def failing_copy_object(resource, destination):
+            if resource.path[-1] == 'file1':
+                raise PermissionError()
+            return copy_object(resource, destination)
+        with patch.object(self.resource_class, 'copy_object', failing_copy_object):
+            errors = self.resource_class('/src/').copy(self.resource_class('/dst/'))
+        self.assertEqual(sorted(r.get_path() for r, e in errors),
+                         ['/src/a/b/file1', '/src/a/file1', '/src/c/file1', '/src/file1'])
+        self.assertEqual(len(self.tree('dst')), len(self.tree('src')) - 4)
+
+    def test_move_rename(self):
+        tree = self.tree('src')
+        with patch('djangodav.fs.tree.TreeOperation.run') as run:
+            self.assertIsNone(self.resource_class('/src/').move(self.resource_class('/dst/')))
+        self.assertFalse(run.called)
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'src')))
+        self.assertEqual(self.tree('dst'), tree)
+
+    def test_move_across_devices(self):
+        tree = self.tree('src')
+        with patch('djangodav.fs.resources.os.replace', Mock(side_effect=OSError(errno.EXDEV, 'cross-device'))):
+            self.assertEqual(self.resource_class('/src/').move(self.resource_class('/dst/')), [])
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'src')))
+        self.assertEqual(self.tree('dst'), tree)
+
+    def test_move_object_across_devices(self):
+        with patch('djangodav.fs.resources.os.rename', Mock(side_effect=OSError(errno.EXDEV, 'cross-device'))):
+            self.resource_class('/src/file1').move(self.resource_class('/src/moved'))
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'src/file1')))
+        with open(os.path.join(self.root, 'src/moved'), 'rb') as f:
+            self.assertEqual(f.read(), b'src')
+
+    def test_delete(self):
+        resource = self.resource_class('/src/')
+        self.assertEqual(resource.delete(), [])
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'src')))
+        self.assertFalse(resource.exists)
+
+    def test_delete_errors(self):
+        remove = os.remove
+
+        def failing_remove(path):
+            if path.endswith('b/file2'):
+                raise PermissionError()
+            remove(path)
+        with patch('djangodav.fs.tree.os.remove', failing_remove):
+            errors = self.resource_class('/src/').delete()
+        self.assertEqual([r.get_path() for r, e in errors], ['/src/a/b/file2'])
+        # only the ancestors of the failed file are left
+        self.assertEqual(self.tree('src'), ['a', 'a/b', 'a/b/file2'])
+
+
+class TestCopyFile(TestCase):
+    def setUp(self):
+        self.root = mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.src = os.path.join(self.root, 'src')
+        self.dst = os.path.join(self.root, 'dst')
+        self.content = os.urandom(300000)
+        with open(self.src, 'wb') as f:
+            f.write(self.content)
+        os.chmod(self.src, 0o604)
+
+    def assertCopied(self):
+        with open(self.dst, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertEqual(os.stat(self.dst).st_mode & 0o777, 0o604)
+
+    def unsupported(self, *args):
+        raise OSError(errno.EOPNOTSUPP, 'not supported')
+
+    def test_copy_file(self):
+        self.assertIn(copy_file(self.src, self.dst), ('reflink', 'copy_file_range', 'sendfile', 'buffered'))
+        self.assertCopied()
+
+    @patch('djangodav.fs.copyfile.reflink', Mock(return_value=False))
+    def test_copy_file_range(self):
+        self.assertEqual(copy_file(self.src, self.dst), 'copy_file_range')
+        self.assertCopied()
+
+    @patch('djangodav.fs.copyfile.reflink', Mock(return_value=False))
+    def test_sendfile(self):
+        with patch('djangodav.fs.copyfile.os.copy_file_range', self.unsupported):
+            self.assertEqual(copy_file(self.src, self.dst), 'sendfile')
+        self.assertCopied()
+
+    @patch('djangodav.fs.copyfile.reflink', Mock(return_value=False))
+    def test_buffered(self):
+        with patch('djangodav.fs.copyfile.os.copy_file_range', self.unsupported), \
+                patch('djangodav.fs.copyfile.os.sendfile', self.unsupported):
+            self.assertEqual(copy_file(self.src, self.dst, buffer_size=4096), 'buffered')
+        self.assertCopied()
+
+    def test_reflink_unsupported(self):
+        with patch('djangodav.fs.copyfile.fcntl.ioctl', self.unsupported):
+            self.assertNotEqual(copy_file(self.src, self.dst), 'reflink')
+        self.assertCopied()
+
+
+class TestDirFd(TestCase):
+    def setUp(self):
+        self.root = mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.outside = mkdtemp()
+        self.addCleanup(shutil.rmtree, self.outside)
+        os.mkdir(os.path.join(self.root, 'dir'))
+        with open(os.path.join(self.root, 'dir', 'file'), 'wb') as f:
+            f.write(b'content')
+        with open(os.path.join(self.outside, 'secret'), 'wb') as f:
+            f.write(b'secret')
+        os.symlink(self.outside, os.path.join(self.root, 'dir', 'link'))
+        os.symlink(os.path.join(self.outside, 'secret'), os.path.join(self.root, 'dir', 'filelink'))
+
+        class FSDavResource(DirFdFSDavResourceMixIn, DummyFSDAVResource):
+            root = self.root
+            dir_fd_cache_size = 2
+        self.resource_class = FSDavResource
+
+    def read(self, path):
+        with self.resource_class(path).read() as f:
+            return f.read()
+
+    def test_get_children(self):
+        children = list(self.resource_class('/dir/').get_children())
+        self.assertEqual([c.get_path() for c in children], ['/dir/file'])
+        self.assertEqual(children[0].getcontentlength, 7)
+
+    def test_read(self):
+        self.assertEqual(self.read('/dir/file'), b'content')
+
+    def test_no_follow(self):
+        self.assertFalse(self.resource_class('/dir/link/secret').exists)
+        self.assertFalse(self.resource_class('/dir/../dir/file').exists)
+        self.assertFalse(self.resource_class('/dir/filelink').is_object)
+        with self.assertRaises(OSError):
+            self.read('/dir/filelink')
+        with self.assertRaises(OSError):
+            self.read('/dir/link/secret')
+
+    def test_write(self):
+        resource = self.resource_class('/dir/new')
+        resource.write(BytesIO(b'new content'))
+        self.assertEqual(resource.getcontentlength, 11)
+        resource.write(BytesIO(b'NEW'), range_start=4)
+        self.assertEqual(self.read('/dir/new'), b'new NEWtent')
+
+    def test_collection_operations(self):
+        self.resource_class('/other/').create_collection()
+        self.resource_class('/dir/file').copy(self.resource_class('/other/copy'))
+        self.assertEqual(self.read('/other/copy'), b'content')
+        self.resource_class('/other/').move(self.resource_class('/moved/'))
+        self.assertEqual(self.read('/moved/copy'), b'content')
+        self.assertFalse(self.resource_class('/other/copy').exists)
+        self.resource_class('/moved/').delete()
+        self.assertEqual(sorted(os.listdir(self.root)), ['dir'])
+
+    def test_storage_path(self):
+        self.assertEqual(self.resource_class('/dir/file').get_storage_path(), os.path.join(self.root, 'dir', 'file'))
+        self.assertIsNone(self.resource_class('/dir/filelink').get_storage_path())
+        self.assertIsNone(self.resource_class('/dir/').get_storage_path())
+        # the directory is replaced by a symlink after it was opened
+        resource = self.resource_class('/dir/file')
+        resource.stat
+        os.rename(os.path.join(self.root, 'dir'), os.path.join(self.root, 'moved'))
+        os.mkdir(os.path.join(self.outside, 'dir'))
+        with open(os.path.join(self.outside, 'dir', 'file'), 'wb') as f:
+            f.write(b'secret')
+        os.symlink(os.path.join(self.outside, 'dir'), os.path.join(self.root, 'dir'))
+        self.assertIsNone(resource.get_storage_path())
+
+    def test_default_cache(self):
+        class FSDavResource(DirFdFSDavResourceMixIn, DummyFSDAVResource):
+            root = self.root
+        self.assertEqual(FSDavResource('/dir/file').getcontentlength, 7)
+        self.assertIn(('dir',), FSDavResource.get_dir_fd_cache().fds)
+
+    def test_cache(self):
+        cache = DirFdCache(self.root, maxsize=1)
+        os.mkdir(os.path.join(self.root, 'dir', 'sub'))
+        with cache.directory(['dir']) as fd:
+            with cache.directory(['dir', 'sub']):
+                # evicted while in use, closed on release
+                self.assertEqual(list(cache.fds), [('dir', 'sub')])
+            # still open
+            self.assertIn('file', os.listdir(fd))
+        cache.invalidate(['dir'])
+        self.assertEqual(len(cache.fds), 0)
+
+    def test_cache_replaced(self):
+        # another process moves /dir away and creates it again
+        resource = self.resource_class('/dir/file')
+        self.assertTrue(resource.exists)
+        os.rename(os.path.join(self.root, 'dir'), os.path.join(self.root, 'moved'))
+        os.mkdir(os.path.join(self.root, 'dir'))
+        with open(os.path.join(self.root, 'dir', 'other'), 'wb'):
+            pass
+        self.resource_class('/dir/new').write(BytesIO(b'new'))
+        self.assertEqual(sorted(os.listdir(os.path.join(self.root, 'dir'))), ['new', 'other'])
+        self.assertEqual(sorted(c.get_path() for c in self.resource_class('/dir/').get_children()), [
+            '/dir/new', '/dir/other'
+        ])
+
+    def test_get_children_concurrent(self):
+        for i in range(500):
+            with open(os.path.join(self.root, 'dir', 'f%d' % i), 'wb'):
+                pass
+        results = []
+
+        def list_children():
+            results.append(len(list(self.resource_class('/dir/').get_children())))
+        threads = [threading.Thread(target=list_children) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [501] * 8)
+
+
+class TestListingCache(TestCase):
+    def setUp(self):
+        self.root = mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        os.mkdir(os.path.join(self.root, 'dir'))
+        for name in ('a', 'b'):
+            with open(os.path.join(self.root, 'dir', name), 'wb') as f:
+                f.write(name.encode())
+
+        class FSDavResource(ListingCacheMixIn, DummyFSDAVResource):
+            root = self.root
+            listing_cache = LocalListingCache()
+        self.resource_class = FSDavResource
+
+    def listing(self):
+        return sorted((c.get_path(), c.getcontentlength) for c in self.resource_class('/dir/').get_children())
+
+    def test_cached(self):
+        self.assertEqual(self.listing(), [('/dir/a', 1), ('/dir/b', 1)])
+        with patch('djangodav.fs.resources.os.scandir') as scandir, patch('djangodav.fs.resources.os.stat', wraps=os.stat) as stat:
+            self.assertEqual(self.listing(), [('/dir/a', 1), ('/dir/b', 1)])
+        self.assertFalse(scandir.called)
+        # only the collection itself
+        self.assertEqual(stat.call_count, 1)
+
+    def test_collection_changed(self):
+        self.listing()
+        with open(os.path.join(self.root, 'dir', 'c'), 'wb') as f:
+            f.write(b'cc')
+        os.utime(os.path.join(self.root, 'dir'), ns=(0, 0))
+        self.assertEqual(self.listing(), [('/dir/a', 1), ('/dir/b', 1), ('/dir/c', 2)])
+
+    def test_invalidate_listing(self):
+        self.listing()
+        resource = self.resource_class('/dir/a')
+        resource.write(BytesIO(b'longer'))
+        self.assertEqual(self.listing(), [('/dir/a', 1), ('/dir/b', 1)])
+        resource.invalidate_listing()
+        self.assertEqual(self.listing(), [('/dir/a', 6), ('/dir/b', 1)])
+
+    def test_django_cache(self):
+        self.resource_class.listing_cache = DjangoListingCache(timeout=60)
+        self.listing()
+        with patch('djangodav.fs.resources.os.scandir') as scandir:
+            self.assertEqual(self.listing(), [('/dir/a', 1), ('/dir/b', 1)])
+        self.assertFalse(scandir.called)
+        self.resource_class('/dir/b').invalidate_listing()
+        self.assertIsNone(self.resource_class.listing_cache.get(self.resource_class('/dir/').get_listing_cache_key()))
+
+    def test_local_cache_timeout(self):
+        cache = LocalListingCache()
+        cache.set('a', (1, []))
+        self.assertEqual(cache.get('a'), (1, []))
+        with patch('djangodav.cache.time.time', return_value=time.time() + 6):
+            self.assertIsNone(cache.get('a'))
+
+    def test_local_cache_memory_cap(self):
+        cache = LocalListingCache(maxbytes=1000)
+        cache.set('a', (1, ['x' * 400]))
+        cache.set('b', (1, ['x' * 400]))
+        cache.set('c', (1, ['x' * 400]))
+        self.assertIsNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('c'))
+        self.assertLessEqual(cache.size, 1000)
+        cache.set('huge', (1, ['x' * 2000]))
+        self.assertIsNone(cache.get('huge'))
+        cache.delete('c')
+        self.assertEqual(cache.size, sum(cache.sizes.values()))
+
+
+class TestXattrDeadPropertyStore(TestCase):
+    def setUp(self):
+        self.root = mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        try:
+            os.setxattr(self.root, 'user.djangodav.test', b'')
+        except OSError:
+            self.skipTest('user extended attributes are not supported')
+
+        class FSDavResource(DummyFSDAVResource):
+            root = self.root
+        self.resource_class = FSDavResource
+        self.store = XattrDeadPropertyStore()
+        os.makedirs(os.path.join(self.root, 'a', 'b'))
+        with open(os.path.join(self.root, 'a', 'b', 'c'), 'wb'):
+            pass
+
+    def test_update(self):
+        resource = self.resource_class('/a/b/c')
+        self.store.update(resource, {'{urn:x}p': '<p xmlns="urn:x">1</p>', '{}q': '<q/>'}, [])
+        self.store.update(resource, {'{urn:x}p': '<p xmlns="urn:x">2</p>'}, ['{}q', '{}missing'])
+        self.assertEqual(self.store.get_many([resource, self.resource_class('/a/')]), [
+            {'{urn:x}p': '<p xmlns="urn:x">2</p>'}, {}
+        ])
+        self.store.update(resource, {}, ['{urn:x}p'])
+        self.assertEqual(os.listxattr(resource.get_abs_path()), [])
+        self.assertEqual(self.store.get_many([self.resource_class('/missing')]), [{}])
+
+    def test_copy(self):
+        self.store.update(self.resource_class('/a/'), {'{}a': '<a/>'}, [])
+        self.store.update(self.resource_class('/a/b/c'), {'{}c': '<c/>'}, [])
+        source, destination = self.resource_class('/a/'), self.resource_class('/d/')
+        source.copy(destination)
+        self.store.copy(source, destination)
+        self.assertEqual(self.store.get_many([
+            self.resource_class('/d/'), self.resource_class('/d/b/'), self.resource_class('/d/b/c')
+        ]), [{'{}a': '<a/>'}, {}, {'{}c': '<c/>'}])
+
+    def test_atomic_write_keeps_properties(self):
+        class FSDavResource(AtomicWriteFSDavResource):
+            root = self.root
+        resource = FSDavResource('/a/b/c')
+        self.store.update(resource, {'{}p': '<p/>'}, [])
+        request = BytesIO(b'new content')
+        request.META = {}
+        resource.write(request)
+        self.assertEqual(self.store.get_many([FSDavResource('/a/b/c')]), [{'{}p': '<p/>'}])
+        # e.g. the data file of a resumable upload
+        temp_file = os.path.join(self.root, 'upload')
+        with open(temp_file, 'wb') as f:
+            f.write(b'uploaded')
+        FSDavResource('/a/b/c').write(None, temp_file=temp_file)
+        self.assertEqual(self.store.get_many([FSDavResource('/a/b/c')]), [{'{}p': '<p/>'}])
+
+    def test_update_locked(self):
+        resource = self.resource_class('/a/b/c')
+        read = self.store.read
+
+        def locked_read(path):
+            # another update has to wait
+            with open(resource.get_abs_path()) as f:
+                with self.assertRaises(BlockingIOError):
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return read(path)
+        with patch.object(self.store, 'read', locked_read):
+            self.store.update(resource, {'{}p': '<p/>'}, [])
+        self.assertEqual(self.store.get_many([resource]), [{'{}p': '<p/>'}])
+
+    def test_update_too_large(self):
+        with self.assertRaises(OSError) as cm:
+            self.store.update(self.resource_class('/a/b/c'), {'{}p': '<p>%s</p>' % ('x' * 1024 * 1024)}, [])
+        self.assertIn(cm.exception.errno, (errno.E2BIG, errno.ENOSPC))
+
+    def test_move_across_devices(self):
+        self.store.update(self.resource_class('/a/'), {'{}a': '<a/>'}, [])
+        self.store.update(self.resource_class('/a/b/c'), {'{}c': '<c/>'}, [])
+        with patch('djangodav.fs.resources.os.replace', Mock(side_effect=OSError(errno.EXDEV, 'cross-device'))):
+            self.resource_class('/a/').move(self.resource_class('/d/'))
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'a')))
+        self.assertEqual(self.store.get_many([self.resource_class('/d/'), self.resource_class('/d/b/c')]), [
+            {'{}a': '<a/>'}, {'{}c': '<c/>'}
+        ])
+        with patch('djangodav.fs.resources.os.replace', Mock(side_effect=OSError(errno.EXDEV, 'cross-device'))):
+            self.resource_class('/d/b/c').move(self.resource_class('/d/e'))
+        self.assertEqual(self.store.get_many([self.resource_class('/d/e')]), [{'{}c': '<c/>'}])
+
+
+class TestSQLiteUsageStore(TestCase):
+    def test_connection_per_process(self):
+        database = mkdtemp()
+        self.addCleanup(shutil.rmtree, database)
+        store = SQLiteUsageStore(os.path.join(database, 'usage.sqlite3'))
+        connection = store.connection
+        self.assertIs(store.connection, connection)
+        # a forked process opens its own connection
+        with patch('djangodav.fs.usage.os.getpid', return_value=os.getpid() + 1):
+            self.assertIsNot(store.connection, connection)
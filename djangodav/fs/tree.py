@@ -0,0 +1,154 @@
+# Refactoring, Django 1.11 compatibility, cleanups, bugfixes (c) 2018 Christian Kreuzberger <ckreuzberger@anexia-it.com>
+# All rights reserved.
+#
+# Portions (c) 2014, Alexander Klimenko <alex@erix.ru>
+# All rights reserved.
+#
+# Copyright (c) 2011, SmartFile <btimby@smartfile.com>
+# All rights reserved.
+#
+# This file is part of DjangoDav.
+#
+# DjangoDav is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DjangoDav is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with DjangoDav.  If not, see <http://www.gnu.org/licenses/>.
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from django.conf import settings
+
+from djangodav.utils import url_join
+
+
+# number of threads used to copy and delete file system trees
+DJANGODAV_FS_TREE_WORKERS = getattr(settings, 'DJANGODAV_FS_TREE_WORKERS', 16)
+
+
+class TreeOperation(object):
+    """
+    Runs the steps of a tree operation on a bounded thread pool. A step is a (function, resource, args) tuple, the
+    function is called with args and returns the follow-up steps, which are only submitted once it has finished
+    (e.g. copying the children of a directory after the directory was created). A failing step is recorded with its
+    resource and does not abort the operation.
+    """
+
+    def __init__(self, workers=DJANGODAV_FS_TREE_WORKERS):
+        self.workers = workers
+        self.errors = []
+
+    def call(self, func, resource, args):
+        try:
+            return func(*args) or []
+        except Exception as e:
+            return e
+
+    def run(self, steps):
+        """
+        Run the steps and all their follow-up steps
+        :return: list of (resource, exception) tuples of the failed steps
+        """
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = {}
+            for step in steps:
+                pending[executor.submit(self.call, *step)] = step
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    func, resource, args = pending.pop(future)
+                    result = future.result()
+                    if isinstance(result, Exception):
+                        self.errors.append((resource, result))
+                        continue
+                    for step in result:
+                        pending[executor.submit(self.call, *step)] = step
+        return self.errors
+
+
+class ParallelTreeFSDavResourceMixIn(object):
+    """
+    Copies and deletes collections with parallel file system operations, which is a lot faster on network storage
+    where the latency of each operation dominates. Directories are created before their content and removed after
+    it. Errors of single resources are collected and returned (the view reports them in a 207 Multi-Status
+    response) instead of aborting the operation.
+    """
+    tree_workers = DJANGODAV_FS_TREE_WORKERS
+
+    def copy_collection(self, destination, depth=-1):
+        if depth == 0:
+            return []
+        return TreeOperation(self.tree_workers).run([(self.copy_children, self, (destination, depth))])
+
+    def copy_children(self, destination, depth):
+        steps = []
+        for child in self.get_children():
+            child_destination = destination.clone(url_join(*(destination.path + [child.path[-1]])))
+            if child.is_collection:
+                steps.append((child.copy_tree_collection, child, (child_destination, depth - 1)))
+            else:
+                steps.append((child.copy_tree_object, child, (child_destination,)))
+        return steps
+
+    def copy_tree_collection(self, destination, depth):
+        if not destination.exists or not destination.is_collection:
+            if destination.exists:
+                destination.delete()
+            destination.create_collection()
+        if depth == 0:
+            return []
+        return [(self.copy_children, self, (destination, depth))]
+
+    def copy_tree_object(self, destination):
+        if destination.is_object:
+            destination.delete()
+        self.copy_object(destination)
+
+    def delete(self):
+        if not self.is_collection:
+            return super(ParallelTreeFSDavResourceMixIn, self).delete()
+        # delete all objects while collecting the collections, then remove the collections deepest first
+        collections = []
+        operation = TreeOperation(self.tree_workers)
+        operation.run([(self.delete_children, self, (collections,))])
+        for level in sorted(set(len(c.path) for c in collections), reverse=True):
+            failed = [resource.get_abs_path() for resource, e in operation.errors]
+            operation.run([
+                (c.remove_collection, c, ()) for c in collections
+                if len(c.path) == level and not self.contains_failed(c, failed)
+            ])
+        if not self.contains_failed(self, [resource.get_abs_path() for resource, e in operation.errors]):
+            try:
+                self.remove_collection()
+            except OSError as e:
+                operation.errors.append((self, e))
+        return operation.errors
+
+    def contains_failed(self, collection, failed):
+        prefix = collection.get_abs_path().rstrip(os.sep) + os.sep
+        return any(path.startswith(prefix) for path in failed)
+
+    def delete_children(self, collections):
+        steps = []
+        for child in self.get_children():
+            if child.is_collection:
+                collections.append(child)
+                steps.append((child.delete_children, child, (collections,)))
+            else:
+                steps.append((child.delete_object, child, ()))
+        return steps
+
+    def delete_object(self):
+        os.remove(self.get_abs_path())
+        self.invalidate_stat()
+
+    def remove_collection(self):
+        os.rmdir(self.get_abs_path())
+        self.invalidate_stat()
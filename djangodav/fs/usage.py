@@ -0,0 +1,125 @@
+# Refactoring, Django 1.11 compatibility, cleanups, bugfixes (c) 2018 Christian Kreuzberger <ckreuzberger@anexia-it.com>
+# All rights reserved.
+#
+# Portions (c) 2014, Alexander Klimenko <alex@erix.ru>
+# All rights reserved.
+#
+# Copyright (c) 2011, SmartFile <btimby@smartfile.com>
+# All rights reserved.
+#
+# This file is part of DjangoDav.
+#
+# DjangoDav is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DjangoDav is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with DjangoDav.  If not, see <http://www.gnu.org/licenses/>.
+import os
+import sqlite3
+import threading
+
+from djangodav.base.usage import BaseUsageStore
+
+
+class SQLiteUsageStore(BaseUsageStore):
+    """
+    Usage store keeping the counters of collections in an SQLite database next to the file system, for deployments
+    of djangodav.fs without a Django database. Every thread (of every process) uses its own connection, the database
+    is opened in WAL mode so readers do not wait for writers.
+    """
+    timeout = 30
+
+    def __init__(self, database, quota=None):
+        super(SQLiteUsageStore, self).__init__(quota)
+        self.database = database
+        self.local = threading.local()
+        with self.connection as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS usage (path TEXT PRIMARY KEY, bytes INTEGER NOT NULL DEFAULT 0, '
+                'files INTEGER NOT NULL DEFAULT 0, quota INTEGER)'
+            )
+
+    @property
+    def connection(self):
+        # sqlite connections must not be shared between threads (or forked processes)
+        if getattr(self.local, 'pid', None) != os.getpid():
+            self.local.connection = sqlite3.connect(self.database, timeout=self.timeout)
+            self.local.connection.execute('PRAGMA journal_mode=WAL')
+            self.local.pid = os.getpid()
+        return self.local.connection
+
+    def get_tree_lookup(self, path):
+        """Return the where clause and its parameters matching path and all paths within it ('0' follows '/')."""
+        prefix = path.rstrip('/')
+        return '(path = ? OR (path >= ? AND path < ?))', [path, prefix + '/', prefix + '0']
+
+    def get_counters(self, paths):
+        paths = list(paths)
+        counters = {}
+        for i in range(0, len(paths), 500):
+            batch = paths[i:i + 500]
+            counters.update(
+                (path, (nbytes, files, quota)) for path, nbytes, files, quota in self.connection.execute(
+                    'SELECT path, bytes, files, quota FROM usage WHERE path IN (%s)' % ', '.join('?' * len(batch)),
+                    batch
+                )
+            )
+        return counters
+
+    def add_counters(self, paths, nbytes, files):
+        with self.connection as connection:
+            connection.executemany(
+                'INSERT INTO usage (path, bytes, files) VALUES (?, ?, ?) '
+                'ON CONFLICT (path) DO UPDATE SET bytes = bytes + excluded.bytes, files = files + excluded.files',
+                [(path, nbytes, files) for path in paths]
+            )
+
+    def reset_counters(self, path, counters):
+        where, params = self.get_tree_lookup(path)
+        with self.connection as connection:
+            connection.execute('UPDATE usage SET bytes = 0, files = 0 WHERE ' + where, params)
+            connection.executemany(
+                'INSERT INTO usage (path, bytes, files) VALUES (?, ?, ?) '
+                'ON CONFLICT (path) DO UPDATE SET bytes = excluded.bytes, files = excluded.files',
+                [(counter_path, nbytes, files) for counter_path, (nbytes, files) in counters.items()]
+            )
+
+    def set_quota(self, resource, quota):
+        with self.connection as connection:
+            connection.execute(
+                'INSERT INTO usage (path, quota) VALUES (?, ?) ON CONFLICT (path) DO UPDATE SET quota = excluded.quota',
+                [self.get_path(resource), quota]
+            )
+
+    def copy_counters(self, path, destination_path):
+        where, params = self.get_tree_lookup(path)
+        with self.connection as connection:
+            self.delete_counters(destination_path, connection)
+            connection.execute(
+                'INSERT INTO usage (path, bytes, files) SELECT ? || substr(path, ?), bytes, files FROM usage WHERE '
+                + where, [destination_path, len(path) + 1] + params
+            )
+
+    def move_counters(self, path, destination_path):
+        where, params = self.get_tree_lookup(path)
+        with self.connection as connection:
+            self.delete_counters(destination_path, connection)
+            connection.execute(
+                'UPDATE usage SET path = ? || substr(path, ?) WHERE ' + where,
+                [destination_path, len(path) + 1] + params
+            )
+
+    def delete_counters(self, path, connection=None):
+        where, params = self.get_tree_lookup(path)
+        if connection is not None:
+            connection.execute('DELETE FROM usage WHERE ' + where, params)
+            return
+        with self.connection as connection:
+            connection.execute('DELETE FROM usage WHERE ' + where, params)
@@ -21,9 +21,14 @@
 #
 # You should have received a copy of the GNU Affero General Public License
 # along with DjangoDav.  If not, see <http://www.gnu.org/licenses/>.
+from collections import namedtuple
 from uuid import uuid4
 
 from djangodav.base.locks import BaseLock
+from djangodav.utils import strip_lock_token
+
+
+DummyActiveLock = namedtuple('DummyActiveLock', 'token scope type depth owner timeout')
 
 
 class DummyLock(BaseLock):
@@ -36,5 +41,14 @@ class DummyLock(BaseLock):
     def release(self, token):
         return True
 
+    def refresh(self, token, timeout):
+        return DummyActiveLock(strip_lock_token(token), 'exclusive', 'write', -1, None, timeout)
+
+    def has_token(self, token):
+        return True
+
+    def can_write(self, tokens, recursive=False):
+        return True
+
     def del_locks(self):
         pass
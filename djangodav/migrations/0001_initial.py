@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:27
+
+from django.db import migrations, models
+import djangodav.db.fields
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DavLock',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('token', models.CharField(max_length=64, unique=True)),
+                ('path', djangodav.db.fields.MaterializedPathField(db_index=True, max_length=768)),
+                ('depth', models.SmallIntegerField(default=-1)),
+                ('scope', models.CharField(default='exclusive', max_length=16)),
+                ('type', models.CharField(default='write', max_length=16)),
+                ('owner', models.TextField(blank=True, null=True)),
+                ('timeout', models.IntegerField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('expires', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
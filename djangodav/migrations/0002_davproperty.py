@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:43
+
+from django.db import migrations, models
+import djangodav.db.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djangodav', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DavProperty',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('path', djangodav.db.fields.MaterializedPathField(db_index=True, max_length=768)),
+                ('namespace', models.CharField(max_length=255)),
+                ('name', models.CharField(max_length=255)),
+                ('value', models.TextField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:46
+
+from django.db import migrations, models
+import djangodav.db.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djangodav', '0002_davproperty'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DavUsage',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('path', djangodav.db.fields.MaterializedPathField(db_index=True, max_length=768, unique=True)),
+                ('bytes', models.BigIntegerField(default=0)),
+                ('files', models.BigIntegerField(default=0)),
+                ('quota', models.BigIntegerField(blank=True, null=True)),
+            ],
+        ),
+    ]
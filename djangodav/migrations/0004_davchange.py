@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:49
+
+from django.db import migrations, models
+import djangodav.db.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djangodav', '0003_davusage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DavChange',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('path', djangodav.db.fields.MaterializedPathField(db_index=True, max_length=768)),
+                ('parent', djangodav.db.fields.MaterializedPathField(db_index=True, max_length=768)),
+                ('change', models.CharField(max_length=16)),
+                ('collection', models.BooleanField(default=False)),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
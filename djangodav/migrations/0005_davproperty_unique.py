@@ -0,0 +1,49 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:03
+
+import hashlib
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def delete_duplicates(apps, schema_editor):
+    """Keep the last stored value of properties stored more than once"""
+    DavProperty = apps.get_model('djangodav', 'DavProperty')
+    objects = DavProperty.objects.using(schema_editor.connection.alias)
+    duplicates = objects.values('path', 'namespace', 'name').annotate(count=Count('id'), last=Max('id')).filter(
+        count__gt=1)
+    for duplicate in duplicates.iterator():
+        objects.filter(path=duplicate['path'], namespace=duplicate['namespace'], name=duplicate['name']).exclude(
+            id=duplicate['last']).delete()
+
+
+def set_keys(apps, schema_editor):
+    """Set the key of existing properties, see DavProperty.make_key"""
+    DavProperty = apps.get_model('djangodav', 'DavProperty')
+    objects = DavProperty.objects.using(schema_editor.connection.alias)
+    for prop in objects.iterator():
+        prop.key = hashlib.sha1('\0'.join((prop.path, prop.namespace, prop.name)).encode('utf-8')).hexdigest()
+        prop.save(update_fields=['key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djangodav', '0004_davchange'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicates, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='davproperty',
+            name='key',
+            field=models.CharField(default='', max_length=40),
+            preserve_default=False,
+        ),
+        migrations.RunPython(set_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='davproperty',
+            name='key',
+            field=models.CharField(max_length=40, unique=True),
+        ),
+    ]
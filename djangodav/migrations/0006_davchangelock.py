@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djangodav', '0005_davproperty_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DavChangeLock',
+            fields=[
+                ('name', models.CharField(max_length=64, primary_key=True, serialize=False)),
+            ],
+        ),
+    ]
@@ -21,3 +21,109 @@
 #
 # You should have received a copy of the GNU Affero General Public License
 # along with DjangoDav.  If not, see <http://www.gnu.org/licenses/>.
+import hashlib
+
+from django.db import models
+
+from djangodav.db.fields import MaterializedPathField
+
+
+class DavLock(models.Model):
+    """A WebDAV lock, used by djangodav.db.locks.DBLock.
+
+    The path of the locked resource is stored in an indexed column (e.g. "/a/b", "/" for the root), so ancestor
+    locks can be looked up with an ``IN`` query and descendant locks with a prefix query."""
+    DEPTH_INFINITY = -1
+
+    id = models.AutoField(primary_key=True)
+    token = models.CharField(max_length=64, unique=True)
+    path = MaterializedPathField()
+    depth = models.SmallIntegerField(default=DEPTH_INFINITY)
+    scope = models.CharField(max_length=16, default='exclusive')
+    type = models.CharField(max_length=16, default='write')
+    owner = models.TextField(blank=True, null=True)
+    timeout = models.IntegerField()
+    created = models.DateTimeField(auto_now_add=True)
+    expires = models.DateTimeField(db_index=True)
+
+    class Meta:
+        app_label = 'djangodav'
+
+    def __str__(self):
+        return '%s (%s)' % (self.path, self.token)
+
+
+class DavProperty(models.Model):
+    """A dead property of a resource, used by djangodav.db.properties.DBDeadPropertyStore.
+
+    Properties are stored by the path of their resource in an indexed column, so the properties of all children of
+    a collection are loaded with one ``IN`` query. The value is the serialized XML element of the property.
+
+    A property is stored once per resource: key is a hash of path, namespace and name, which are too long for one
+    unique index (see make_key)."""
+    id = models.AutoField(primary_key=True)
+    path = MaterializedPathField()
+    namespace = models.CharField(max_length=255)
+    name = models.CharField(max_length=255)
+    key = models.CharField(max_length=40, unique=True)
+    value = models.TextField()
+
+    class Meta:
+        app_label = 'djangodav'
+
+    def __str__(self):
+        return '%s {%s}%s' % (self.path, self.namespace, self.name)
+
+    @staticmethod
+    def make_key(path, namespace, name):
+        return hashlib.sha1('\0'.join((path, namespace, name)).encode('utf-8')).hexdigest()
+
+    def save(self, *args, **kwargs):
+        self.key = self.make_key(self.path, self.namespace, self.name)
+        super(DavProperty, self).save(*args, **kwargs)
+
+
+class DavUsage(models.Model):
+    """The number of bytes and files within a collection and its quota, used by djangodav.db.usage.DBUsageStore."""
+    id = models.AutoField(primary_key=True)
+    path = MaterializedPathField(unique=True)
+    bytes = models.BigIntegerField(default=0)
+    files = models.BigIntegerField(default=0)
+    quota = models.BigIntegerField(blank=True, null=True)
+
+    class Meta:
+        app_label = 'djangodav'
+
+    def __str__(self):
+        return '%s (%s bytes, %s files)' % (self.path, self.bytes, self.files)
+
+
+class DavChange(models.Model):
+    """An entry of the change journal of djangodav.db.journals.DBChangeJournal, the id is the sequence number.
+
+    Entries are looked up by the path of the changed resource (members of a collection by the indexed parent path)
+    and by sequence number, so the changes since a sync token are found without walking the tree."""
+    id = models.BigAutoField(primary_key=True)
+    path = MaterializedPathField()
+    parent = MaterializedPathField()
+    change = models.CharField(max_length=16)
+    collection = models.BooleanField(default=False)
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        app_label = 'djangodav'
+
+    def __str__(self):
+        return '%s %s %s' % (self.id, self.change, self.path)
+
+
+class DavChangeLock(models.Model):
+    """A row locked by djangodav.db.journals.DBChangeJournal while it records changes, so entries are committed in
+    the order of their ids and no change is committed below a sync token issued before."""
+    name = models.CharField(max_length=64, primary_key=True)
+
+    class Meta:
+        app_label = 'djangodav'
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,152 @@
+# Refactoring, Django 1.11 compatibility, cleanups, bugfixes (c) 2018 Christian Kreuzberger <ckreuzberger@anexia-it.com>
+# All rights reserved.
+#
+# Portions (c) 2014, Alexander Klimenko <alex@erix.ru>
+# All rights reserved.
+#
+# Copyright (c) 2011, SmartFile <btimby@smartfile.com>
+# All rights reserved.
+#
+# This file is part of DjangoDav.
+#
+# DjangoDav is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DjangoDav is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with DjangoDav.  If not, see <http://www.gnu.org/licenses/>.
+import re
+
+from lxml.etree import fromstring, tostring
+
+from djangodav.utils import WEBDAV_NS, D, is_clark_name
+
+# characters lxml refuses in text content (control characters, surrogates and U+FFFE/U+FFFF)
+PATTERN_INVALID_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]')
+# characters that have to be escaped in text content, or make the value invalid
+PATTERN_TEXT_SPECIAL = re.compile('[&<>\r\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]')
+
+STATUS_OK = 'HTTP/1.1 200 OK'
+
+
+def is_supported_encoding(encoding):
+    """Return whether markup encoded with encoding is plain ASCII, which is what MultiStatusWriter relies on."""
+    try:
+        return '<?>'.encode(encoding) == b'<?>'
+    except LookupError:
+        return False
+
+
+class MultiStatusWriter(object):
+    """
+    Encodes PROPFIND multistatus documents straight into bytes from pre-encoded tag templates, instead of building
+    an lxml element per property. The output is byte identical to serializing the equivalent D.multistatus tree with
+    etree.tostring (or, with streaming=True, to writing each response with etree.xmlfile, which repeats the namespace
+    declaration on every response), pretty printing is not supported.
+    """
+
+    def __init__(self, encoding='utf-8', streaming=False):
+        if not is_supported_encoding(encoding):
+            raise ValueError('Unsupported encoding %s' % encoding)
+        self.encoding = encoding
+        self.errors = 'strict' if encoding.lower().replace('_', '-') in ('utf-8', 'utf8') else 'xmlcharrefreplace'
+        self.streaming = streaming
+        self.declaration = ("<?xml version='1.0' encoding='%s'?>\n" % encoding).encode('ascii')
+        self.root_start = ('<D:multistatus xmlns:D="%s">' % WEBDAV_NS).encode('ascii')
+        self.root_empty = ('<D:multistatus xmlns:D="%s"/>' % WEBDAV_NS).encode('ascii')
+        self.root_end = b'</D:multistatus>'
+        if streaming:
+            self.response_start = ('<D:response xmlns:D="%s"><D:href>' % WEBDAV_NS).encode('ascii')
+        else:
+            self.response_start = b'<D:response><D:href>'
+        self.href_end = b'</D:href><D:propstat><D:prop>'
+        self.prop_empty = b'</D:href><D:propstat><D:prop/>'
+        self.response_end = ('</D:prop><D:status>%s</D:status></D:propstat></D:response>' % STATUS_OK).encode('ascii')
+        self.response_end_empty = ('<D:status>%s</D:status></D:propstat></D:response>' % STATUS_OK).encode('ascii')
+        self.resourcetype_collection = b'<D:resourcetype><D:collection/></D:resourcetype>'
+        self.resourcetype_object = b'<D:resourcetype/>'
+        self.dav_declaration = 'xmlns:D="%s"' % WEBDAV_NS
+        self.prop_start = '<D:prop %s>' % self.dav_declaration
+        self.templates = {}
+
+    def get_templates(self, name):
+        """Return the encoded start tag, end tag and empty element of property name."""
+        try:
+            return self.templates[name]
+        except KeyError:
+            pass
+        D(name)  # lets lxml reject invalid tag names
+        templates = tuple(s.encode(self.encoding, self.errors) for s in (
+            '<D:%s>' % name, '</D:%s>' % name, '<D:%s/>' % name
+        ))
+        self.templates[name] = templates
+        return templates
+
+    def escape(self, text):
+        """Return text escaped and encoded like lxml serializes text content."""
+        if PATTERN_TEXT_SPECIAL.search(text) is not None:
+            if PATTERN_INVALID_XML.search(text) is not None:
+                raise ValueError('All strings must be XML compatible: Unicode or ASCII, no NULL bytes or control '
+                                 'characters')
+            text = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('\r', '&#13;')
+        return text.encode(self.encoding, self.errors)
+
+    def encode_property(self, name, value):
+        """Return the encoded element of property name with value (see make_property_tag)."""
+        if is_clark_name(name):
+            return self.encode_dead_property(value)
+        if name == 'resourcetype':
+            return self.resourcetype_collection if value else self.resourcetype_object
+        start, end, empty = self.get_templates(name)
+        return start + self.escape(str(value)) + end
+
+    def encode_dead_property(self, value):
+        """Return the encoded serialized element of a dead property (see serialize_property)."""
+        if self.dav_declaration in value:
+            # lxml drops the declaration of the DAV: namespace, it is declared by the root already
+            value = tostring(D.prop(fromstring(value)), encoding='unicode')[len(self.prop_start):-len('</D:prop>')]
+        return value.encode(self.encoding, self.errors)
+
+    def response(self, href, props):
+        """Return an encoded response element of href with the already encoded property elements props."""
+        if not props:
+            return b''.join((self.response_start, self.escape(href), self.prop_empty, self.response_end_empty))
+        return b''.join((self.response_start, self.escape(href), self.href_end, b''.join(props), self.response_end))
+
+    def prop_response(self, href, props):
+        """Return an encoded response element with the properties props, a list of (name, value) pairs."""
+        encode_property = self.encode_property
+        return self.response(href, [encode_property(name, value) for name, value in props])
+
+    def propname_response(self, href, names):
+        """Return an encoded response element with empty elements of the properties names."""
+        return self.response(href, [self.get_templates(name)[2] for name in names])
+
+    def iter_chunks(self, responses, chunk_size=64 * 1024):
+        """Return the document of the encoded responses in chunks of about chunk_size bytes."""
+        chunk = [self.declaration, self.root_start]
+        size = 0
+        empty = True
+        for response in responses:
+            empty = False
+            chunk.append(response)
+            size += len(response)
+            if size >= chunk_size:
+                yield b''.join(chunk)
+                chunk = []
+                size = 0
+        if empty and not self.streaming:
+            chunk[-1] = self.root_empty
+        else:
+            chunk.append(self.root_end)
+        yield b''.join(chunk)
+
+    def document(self, responses):
+        """Return the whole document of the encoded responses."""
+        return b''.join(self.iter_chunks(responses, chunk_size=float('inf')))
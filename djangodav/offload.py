@@ -0,0 +1,96 @@
+# Refactoring, Django 1.11 compatibility, cleanups, bugfixes (c) 2018 Christian Kreuzberger <ckreuzberger@anexia-it.com>
+# All rights reserved.
+#
+# Portions (c) 2014, Alexander Klimenko <alex@erix.ru>
+# All rights reserved.
+#
+# Copyright (c) 2011, SmartFile <btimby@smartfile.com>
+# All rights reserved.
+#
+# This file is part of DjangoDav.
+#
+# DjangoDav is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DjangoDav is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with DjangoDav.  If not, see <http://www.gnu.org/licenses/>.
+import os
+
+from django.http import HttpResponse
+
+from urllib.parse import quote as urlquote
+from djangodav.utils import url_join, rfc5987_content_disposition
+
+
+class BaseOffloadBackend(object):
+    """
+    Lets the web server send the content of a resource: the response only carries a header with the location of the
+    file, the web server reads the file itself and also handles HEAD and Range requests. The file is never opened
+    by python.
+    """
+    header = None
+
+    def __init__(self, prefix="", root=None):
+        """
+        :param prefix: prefix of the location (e.g. the internal nginx location), joined with the relative path
+        :param root: directory the location is relative to, defaults to the root of the resource
+        """
+        self.prefix = prefix
+        self.root = root
+
+    def get_relative_path(self, resource, storage_path):
+        return os.path.relpath(storage_path, self.root or getattr(resource, 'root', None) or "/")
+
+    def get_location(self, resource, storage_path):
+        # we are not allowed to send utf8 headers, so we need to make sure to quote it
+        return urlquote(url_join(self.prefix, self.get_relative_path(resource, storage_path)))
+
+    def build_response(self, resource, storage_path):
+        """
+        Build the response handing the file over to the web server
+        :param resource: the resource to send
+        :param storage_path: absolute path of the file, see BaseDavResource.get_storage_path
+        """
+        response = HttpResponse()
+        response[self.header] = self.get_location(resource, storage_path)
+        # set the display name as the content disposition header, acting as the download name of the file
+        response['Content-Disposition'] = rfc5987_content_disposition(resource.displayname)
+        response['Content-Type'] = resource.content_type
+        return response
+
+
+class NginxOffloadBackend(BaseOffloadBackend):
+    """X-Accel-Redirect of nginx, the prefix is the path of an internal location"""
+    header = 'X-Accel-Redirect'
+
+    def build_response(self, resource, storage_path):
+        response = super(NginxOffloadBackend, self).build_response(resource, storage_path)
+        # Unfortunately, setting content-length, last-modified and etag does not work with nginx, as those
+        # are overwritten by nginx, see https://forum.nginx.org/read.php?2,205636,205665#msg-205665
+        # Therefore we need to set them with a prefix, e.g., X-Accel-, and handle it with nginx
+        # add_header and $upstream_http_*
+        response['X-Accel-Content-Length'] = resource.getcontentlength
+        response['X-Accel-Last-Modified'] = resource.get_modified().ctime()
+        response['X-Accel-ETag'] = resource.etag
+        return response
+
+
+class ApacheOffloadBackend(BaseOffloadBackend):
+    """X-Sendfile of the Apache mod_xsendfile module (XSendFilePath has to allow the root of the resources)"""
+    header = 'X-Sendfile'
+
+    def get_location(self, resource, storage_path):
+        # mod_xsendfile expects the file system path, url-unescaping it by default (XSendFileUnescape)
+        return urlquote(storage_path)
+
+
+class LiteSpeedOffloadBackend(BaseOffloadBackend):
+    """X-LiteSpeed-Location of the LiteSpeed web server, the prefix is the path of a static context"""
+    header = 'X-LiteSpeed-Location'
@@ -0,0 +1,174 @@
+# Refactoring, Django 1.11 compatibility, cleanups, bugfixes (c) 2018 Christian Kreuzberger <ckreuzberger@anexia-it.com>
+# All rights reserved.
+#
+# Portions (c) 2014, Alexander Klimenko <alex@erix.ru>
+# All rights reserved.
+#
+# Copyright (c) 2011, SmartFile <btimby@smartfile.com>
+# All rights reserved.
+#
+# This file is part of DjangoDav.
+#
+# DjangoDav is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DjangoDav is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with DjangoDav.  If not, see <http://www.gnu.org/licenses/>.
+from collections import OrderedDict
+from itertools import islice
+
+from djangodav.utils import is_clark_name
+
+
+class BasePropertyProvider(object):
+    """
+    Supplies the values of properties for batches of resources, e.g. with one query for all children of a collection.
+    Providers are registered on the view (DavView.property_providers).
+    """
+    # names of the properties supplied by the provider, None for any property
+    properties = ()
+    # whether allprop includes the properties of the provider (see get_all_properties)
+    all_properties = False
+
+    def supplies(self, name):
+        return self.properties is None or name in self.properties
+
+    def get_properties(self, resources, names):
+        """Return a dict for each of the resources, mapping the names of its properties to their values. Properties
+        a resource does not have are left out."""
+        raise NotImplementedError()
+
+    def get_all_properties(self, resources):
+        """Return a dict of all properties supplied by the provider for each of the resources, if all_properties is
+        set."""
+        raise NotImplementedError()
+
+
+class ResourcePropertyProvider(BasePropertyProvider):
+    """Reads properties from the attributes of the resources, resourcetype is whether the resource is a collection."""
+    properties = None
+
+    def get_properties(self, resources, names):
+        results = []
+        for res in resources:
+            values = {}
+            for name in names:
+                if name == 'resourcetype':
+                    values[name] = res.is_collection
+                    continue
+                try:
+                    values[name] = getattr(res, name)
+                except AttributeError:
+                    continue
+            results.append(values)
+        return results
+
+
+class DeadPropertyProvider(BasePropertyProvider):
+    """Supplies the dead properties (named in Clark notation) of the resources from a dead property store (see
+    djangodav.base.properties), loading the properties of a whole batch at once."""
+    all_properties = True
+
+    def __init__(self, store):
+        self.store = store
+
+    def supplies(self, name):
+        return is_clark_name(name)
+
+    def get_properties(self, resources, names):
+        return [
+            dict((name, props[name]) for name in names if name in props)
+            for props in self.store.get_many(resources)
+        ]
+
+    def get_all_properties(self, resources):
+        return self.store.get_many(resources)
+
+
+class UsagePropertyProvider(BasePropertyProvider):
+    """Supplies quota-used-bytes and quota-available-bytes (RFC 4331) of collections from a usage store (see
+    djangodav.base.usage), looked up for a whole batch at once. Collections without a quota have no
+    quota-available-bytes."""
+    properties = ('quota-available-bytes', 'quota-used-bytes')
+
+    def __init__(self, store):
+        self.store = store
+
+    def get_properties(self, resources, names):
+        results = [{} for _ in resources]
+        collections = [(result, res) for result, res in zip(results, resources) if res.is_collection]
+        if 'quota-used-bytes' in names:
+            for (result, res), used in zip(collections, self.store.get_used_bytes([res for _, res in collections])):
+                result['quota-used-bytes'] = used
+        if 'quota-available-bytes' in names:
+            available_bytes = self.store.get_available_bytes([res for _, res in collections])
+            for (result, res), available in zip(collections, available_bytes):
+                if available is not None:
+                    result['quota-available-bytes'] = available
+        return results
+
+
+class PropertyRegistry(object):
+    """
+    Evaluates properties with the first of providers that supplies them, falling back to the attributes of the
+    resources. Every provider is called once per batch of resources, and every property once per resource.
+    """
+
+    def __init__(self, providers=()):
+        self.providers = list(providers) + [ResourcePropertyProvider()]
+
+    def get_provider(self, name):
+        for provider in self.providers:
+            if provider.supplies(name):
+                return provider
+
+    def get_values(self, resources, names):
+        """Return a dict for each of the resources, mapping the names of its properties to their values."""
+        resources = list(resources)
+        values = [{} for _ in resources]
+        groups = OrderedDict()
+        for name in OrderedDict.fromkeys(names):
+            groups.setdefault(self.get_provider(name), []).append(name)
+        for provider, provider_names in groups.items():
+            for result, provider_values in zip(values, provider.get_properties(resources, provider_names)):
+                result.update(provider_values)
+        return values
+
+    def get_properties(self, resources, names):
+        """Return a list of (name, value) pairs in the order of names for each of the resources."""
+        return [
+            [(name, result[name]) for name in names if name in result]
+            for result in self.get_values(resources, names)
+        ]
+
+    def iter_properties(self, resources, names=None, batch_size=500):
+        """
+        Yield each of the resources with its properties (see get_properties), evaluated in batches of batch_size
+        resources
+        :param names: names of the properties, or None for the ALL_PROPS of each resource
+        """
+        resources = iter(resources)
+        while True:
+            batch = list(islice(resources, batch_size))
+            if not batch:
+                return
+            if names is not None:
+                for res, props in zip(batch, self.get_properties(batch, names)):
+                    yield res, props
+                continue
+            all_props = list(OrderedDict.fromkeys(name for res in batch for name in res.ALL_PROPS))
+            values = self.get_values(batch, all_props)
+            for provider in self.providers:
+                if provider.all_properties:
+                    for result, provider_values in zip(values, provider.get_all_properties(batch)):
+                        result.update(provider_values)
+            for res, result in zip(batch, values):
+                props = [(name, result.pop(name)) for name in res.ALL_PROPS if name in result]
+                yield res, props + sorted((name, value) for name, value in result.items() if name not in all_props)
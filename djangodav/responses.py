@@ -26,7 +26,7 @@ try:
     import httplib
 except ImportError:
     from http import client as httplib
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 
 
 # When possible, code returns an HTTPResponse sub-class. In some situations, we want to be able
@@ -56,6 +56,10 @@ class HttpResponseMultiStatus(HttpResponse):
     status_code = httplib.MULTI_STATUS
 
 
+class StreamingHttpResponseMultiStatus(StreamingHttpResponse):
+    status_code = httplib.MULTI_STATUS
+
+
 class HttpResponseNotImplemented(HttpResponse):
     status_code = httplib.NOT_IMPLEMENTED
 
@@ -80,5 +84,13 @@ class HttpResponseLocked(HttpResponse):
     status_code = httplib.LOCKED
 
 
+class HttpResponseRequestedRangeNotSatisfiable(HttpResponse):
+    status_code = httplib.REQUESTED_RANGE_NOT_SATISFIABLE
+
+
 class HttpResponseUnAuthorized(HttpResponse):
     status_code = httplib.UNAUTHORIZED
+
+
+class HttpResponseInsufficientStorage(HttpResponse):
+    status_code = httplib.INSUFFICIENT_STORAGE
@@ -0,0 +1,239 @@
+# Refactoring, Django 1.11 compatibility, cleanups, bugfixes (c) 2018 Christian Kreuzberger <ckreuzberger@anexia-it.com>
+# All rights reserved.
+#
+# Portions (c) 2014, Alexander Klimenko <alex@erix.ru>
+# All rights reserved.
+#
+# Copyright (c) 2011, SmartFile <btimby@smartfile.com>
+# All rights reserved.
+#
+# This file is part of DjangoDav.
+#
+# DjangoDav is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DjangoDav is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with DjangoDav.  If not, see <http://www.gnu.org/licenses/>.
+import json
+import os
+import re
+import tempfile
+import time
+from contextlib import contextmanager
+from uuid import uuid4
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover, no locking between processes on windows
+    fcntl = None
+
+
+PATTERN_CHUNK_RANGE = re.compile(r'^\s*bytes\s+([0-9]+)-([0-9]+)/([0-9]+|\*)\s*$')
+PATTERN_SESSION_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+def add_range(ranges, start, end):
+    """
+    Adds the range [start, end) to a sorted list of disjoint ranges, merging overlapping and adjacent ranges
+    :return: the new list of ranges
+    """
+    merged = []
+    for range_start, range_end in ranges:
+        if range_end < start or range_start > end:
+            merged.append([range_start, range_end])
+        else:
+            start, end = min(start, range_start), max(end, range_end)
+    merged.append([start, end])
+    return sorted(merged)
+
+
+def format_ranges(ranges):
+    """Formats ranges as inclusive byte ranges, e.g. "0-99,200-299" """
+    return ",".join("%d-%d" % (start, end - 1) for start, end in ranges)
+
+
+def parse_chunk_range(header):
+    """
+    Parses the Content-Range header of a chunk, e.g. "bytes 0-99/1000"
+    :return: (start, end, length) with an inclusive end and length None for "*", or None if the header is invalid
+    """
+    m = PATTERN_CHUNK_RANGE.match(header or '')
+    if not m:
+        return None
+    start, end = int(m.group(1)), int(m.group(2))
+    length = None if m.group(3) == '*' else int(m.group(3))
+    if end < start or (length is not None and end >= length):
+        return None
+    return start, end, length
+
+
+class UploadSessionNotFound(Exception):
+    """The upload session does not exist (anymore), it was committed, deleted or expired"""
+
+
+class UploadSession(object):
+    """
+    A resumable upload. The content is written into a sparse data file at the offsets of the chunks, the received
+    ranges are kept in a metadata file next to it, which is locked while it is updated so that chunks can be sent in
+    parallel by several connections (and worker processes).
+    """
+
+    def __init__(self, store, session_id):
+        self.store = store
+        self.session_id = session_id
+        self.data_path = os.path.join(store.directory, session_id + '.data')
+        self.meta_path = os.path.join(store.directory, session_id + '.json')
+
+    def open_meta(self):
+        try:
+            return open(self.meta_path, 'r+')
+        except FileNotFoundError:
+            raise UploadSessionNotFound(self.session_id)
+
+    def lock_meta(self, f, shared=False):
+        """Locks the open metadata file, exclusively unless shared (converting a lock already held)"""
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        if os.fstat(f.fileno()).st_nlink == 0:
+            # committed or deleted while waiting for the lock
+            raise UploadSessionNotFound(self.session_id)
+
+    def save_meta(self, f, meta):
+        f.seek(0)
+        f.truncate()
+        json.dump(meta, f)
+
+    @contextmanager
+    def meta(self):
+        """Yields the locked metadata of the session, changes are saved on exit
+        :raises UploadSessionNotFound: if the session does not exist (anymore)"""
+        with self.open_meta() as f:
+            self.lock_meta(f)
+            meta = json.load(f)
+            original = dict(meta)
+            yield meta
+            if meta != original and os.path.exists(self.meta_path):
+                self.save_meta(f, meta)
+
+    @property
+    def path(self):
+        with self.meta() as meta:
+            return meta['path']
+
+    @property
+    def length(self):
+        with self.meta() as meta:
+            return meta['length']
+
+    @property
+    def ranges(self):
+        with self.meta() as meta:
+            return meta['ranges']
+
+    def write(self, stream, start, end):
+        """
+        Writes a chunk into the data file. The metadata is locked shared while the chunk is written, so chunks are
+        written in parallel, but never into a data file that is being committed or was committed.
+        :param stream: file like object to read the chunk from
+        :param start: offset of the chunk
+        :param end: inclusive end of the chunk, must be within the length of the upload
+        :return: the received ranges
+        :raises UploadSessionNotFound: if the session does not exist (anymore)
+        """
+        with self.open_meta() as meta_file:
+            self.lock_meta(meta_file, shared=True)
+            offset = start
+            with open(self.data_path, 'r+b', buffering=0) as f:
+                while offset <= end:
+                    buf = stream.read(min(self.store.buffer_size, end + 1 - offset))
+                    if not buf:
+                        break
+                    view = memoryview(buf)
+                    while view:
+                        written = os.pwrite(f.fileno(), view, offset)
+                        view = view[written:]
+                        offset += written
+            self.lock_meta(meta_file)
+            meta = json.load(meta_file)
+            if offset > start:
+                meta['ranges'] = add_range(meta['ranges'], start, offset)
+                self.save_meta(meta_file, meta)
+            return meta['ranges']
+
+    def is_complete(self, meta):
+        return meta['ranges'] == [[0, meta['length']]] or meta['length'] == 0
+
+    def commit(self, resource):
+        """
+        Publishes the uploaded content by moving the data file to the resource, if all chunks were received
+        :return: True if the upload was committed
+        :raises UploadSessionNotFound: if the session does not exist (anymore)
+        """
+        with self.meta() as meta:
+            if not self.is_complete(meta):
+                return False
+            resource.write(None, temp_file=self.data_path)
+            os.unlink(self.meta_path)
+        return True
+
+    def delete(self):
+        for path in (self.data_path, self.meta_path):
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+
+class UploadSessionStore(object):
+    """
+    Stores upload sessions in a directory, which should be on the same file system as the resources, so that
+    committing an upload is a rename. Sessions not updated for max_age seconds expire.
+    """
+    session_class = UploadSession
+
+    def __init__(self, directory=None, max_age=24 * 3600, buffer_size=1024 * 1024):
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'djangodav-uploads')
+        self.max_age = max_age
+        self.buffer_size = buffer_size
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory, exist_ok=True)
+
+    def create(self, path, length):
+        """Creates a session for uploading length bytes to the resource at path"""
+        self.expire()
+        session = self.session_class(self, uuid4().hex)
+        with open(session.data_path, 'wb') as f:
+            f.truncate(length)
+        with open(session.meta_path, 'w') as f:
+            json.dump({'path': path, 'length': length, 'ranges': [], 'created': time.time()}, f)
+        return session
+
+    def get(self, session_id):
+        """Returns the session, or None if it does not exist (anymore)"""
+        if not PATTERN_SESSION_ID.match(session_id or ''):
+            return None
+        session = self.session_class(self, session_id)
+        if not os.path.exists(session.meta_path):
+            return None
+        return session
+
+    def expire(self):
+        """Deletes sessions that were not updated within max_age seconds"""
+        limit = time.time() - self.max_age
+        for name in os.listdir(self.directory):
+            session_id, ext = os.path.splitext(name)
+            if ext != '.json' or not PATTERN_SESSION_ID.match(session_id):
+                continue
+            session = self.session_class(self, session_id)
+            try:
+                if os.path.getmtime(session.meta_path) < limit:
+                    session.delete()
+            except OSError:
+                pass
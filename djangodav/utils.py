@@ -24,9 +24,13 @@
 
 
 import datetime
+import errno
+import re
+import threading
 import time
 import calendar
 import unicodedata
+from collections import OrderedDict
 
 from wsgiref.handlers import format_date_time
 
@@ -40,6 +44,7 @@ except ImportError:
 
 # ToDo: do not use lxml, use defusedxml to avoid XML vulnerabilities
 import lxml.builder as lb
+import lxml.etree
 
 # Sun, 06 Nov 1994 08:49:37 GMT  ; RFC 822, updated by RFC 1123
 FORMAT_RFC_822 = '%a, %d %b %Y %H:%M:%S GMT'
@@ -48,6 +53,11 @@ FORMAT_RFC_850 = '%A %d-%b-%y %H:%M:%S GMT'
 # Sun Nov  6 08:49:37 1994       ; ANSI C's asctime() format
 FORMAT_ASC = '%a %b %d %H:%M:%S %Y'
 
+# resource tags (<...>) and lists ((...)) of a WebDAV If header
+PATTERN_IF_DELIMITER = re.compile(r'(<([^>]+)>)|(\(([^\)]+)\))')
+# conditions within a list of a WebDAV If header: Not, state tokens (<...>) and entity tags ([...])
+PATTERN_IF_CONDITION = re.compile(r'\s*(?:(Not)|<([^>]*)>|\[([^\]]*)\])', re.IGNORECASE)
+
 WEBDAV_NS = "DAV:"
 
 WEBDAV_NSMAP = {'D': WEBDAV_NS}
@@ -65,16 +75,113 @@ def get_property_tag_list(res, *names):
     return props
 
 
+def is_clark_name(name):
+    return name.startswith('{')
+
+
+def get_property_name(element):
+    """Return the name of a property element of a request: the local name of DAV: properties, Clark notation
+    ("{namespace}name") for other properties."""
+    namespace = lxml.etree.QName(element).namespace
+    if namespace == WEBDAV_NS:
+        return lxml.etree.QName(element).localname
+    return '{%s}%s' % (namespace or '', lxml.etree.QName(element).localname)
+
+
+def parse_clark_name(name):
+    """Return the namespace and local name of a property name in Clark notation."""
+    namespace, _, localname = name[1:].partition('}')
+    return namespace, localname
+
+
+def serialize_property(element):
+    """Return the serialized property element, declaring only the namespaces it uses."""
+    element = lxml.etree.fromstring(lxml.etree.tostring(element, method='c14n', exclusive=True))
+    return lxml.etree.tostring(element, encoding='unicode')
+
+
 def get_property_tag(res, name):
     if name == 'resourcetype':
-        if res.is_collection:
-            return D(name, D.collection)
-        return D(name)
+        return make_property_tag(name, res.is_collection)
     try:
-        if hasattr(res, name):
-            return D(name, str(getattr(res, name)))
+        value = getattr(res, name)
     except AttributeError:
         return
+    return make_property_tag(name, value)
+
+
+def make_property_tag(name, value):
+    """Return the element of property name with value (see djangodav.properties). Properties named in Clark notation
+    are dead properties, their value is the serialized element."""
+    if is_clark_name(name):
+        return lxml.etree.fromstring(value)
+    if name == 'resourcetype':
+        if value:
+            return D(name, D.collection)
+        return D(name)
+    return D(name, str(value))
+
+
+class LRUCache(object):
+    """A thread safe mapping holding at most maxsize entries, the least recently used entries are discarded
+    first."""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                self.data.move_to_end(key)
+            except KeyError:
+                return default
+            return self.data[key]
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self.lock:
+            return self.data.pop(key, default)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __len__(self):
+        return len(self.data)
+
+
+class QuotaLimitedReader(object):
+    """Reads a request body (or file like object) of unknown length, raising OSError(EDQUOT) once more than limit
+    bytes were read. Anything but read is passed on to the wrapped stream."""
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, stream, limit):
+        self.stream = stream
+        self.remaining = limit
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return b''.join(iter(lambda: self.read(self.chunk_size), b''))
+        data = self.stream.read(size)
+        self.remaining -= len(data)
+        if self.remaining < 0:
+            raise OSError(errno.EDQUOT, 'Quota exceeded')
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
 
 
 def safe_join(root, *paths):
@@ -143,6 +250,101 @@ def parse_time(timestring):
     return calendar.timegm(value)
 
 
+def parse_range_header(header, size):
+    """
+    Parses a HTTP Range header (RFC 7233) for a resource of the given size
+    :param header: value of the Range header, e.g. "bytes=0-499,-500"
+    :param size: size of the resource in bytes
+    :return: list of (start, end) tuples with inclusive end offsets, an empty list if none of the ranges is
+             satisfiable, or None if the header is malformed or not a byte range (it must be ignored then)
+    """
+    unit, _, specs = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not specs:
+        return None
+    ranges = []
+    for spec in specs.split(','):
+        start, sep, end = spec.strip().partition('-')
+        start, end = start.strip(), end.strip()
+        if not sep or not (start.isdigit() or start == '') or not (end.isdigit() or end == ''):
+            return None
+        if start == '':
+            # suffix range, the last N bytes
+            if end == '':
+                return None
+            length = int(end)
+            if length == 0 or size == 0:
+                continue
+            ranges.append((max(size - length, 0), size - 1))
+            continue
+        start = int(start)
+        if end and int(end) < start:
+            return None
+        if start >= size:
+            continue
+        end = min(int(end), size - 1) if end else size - 1
+        ranges.append((start, end))
+    return ranges
+
+
+def parse_if_header(header):
+    """
+    Parses a WebDAV If header (RFC 4918 section 10.4)
+    :param header: value of the If header, e.g. '</a/b> (<opaquelocktoken:1234> ["etag"]) (Not <DAV:no-lock>)'
+    :return: list of (resource tag, conditions) tuples, one per list. The resource tag is None for untagged lists,
+             conditions is a list of (negated, kind, value) tuples where kind is either 'token' or 'etag'
+    :raises ValueError: if the header is malformed
+    """
+    lists = []
+    tag = None
+    position = 0
+    header = header.strip()
+    for match in PATTERN_IF_DELIMITER.finditer(header):
+        if header[position:match.start()].strip():
+            raise ValueError('Invalid If header: %s' % header)
+        position = match.end()
+        if match.group(2) is not None:
+            tag = match.group(2)
+            continue
+        conditions = []
+        negated = False
+        body = match.group(4)
+        condition_position = 0
+        for condition in PATTERN_IF_CONDITION.finditer(body):
+            if condition.start() != condition_position:
+                raise ValueError('Invalid If header: %s' % header)
+            condition_position = condition.end()
+            if condition.group(1):
+                negated = True
+                continue
+            if condition.group(2) is not None:
+                conditions.append((negated, 'token', condition.group(2)))
+            else:
+                conditions.append((negated, 'etag', condition.group(3)))
+            negated = False
+        if body[condition_position:].strip() or negated or not conditions:
+            raise ValueError('Invalid If header: %s' % header)
+        lists.append((tag, conditions))
+    if header[position:].strip() or not lists:
+        raise ValueError('Invalid If header: %s' % header)
+    return lists
+
+
+def strip_etag(etag):
+    """Strips the weakness indicator and quotes of an entity tag"""
+    etag = etag.strip()
+    if etag.startswith('W/'):
+        etag = etag[2:]
+    return etag.strip('"')
+
+
+def strip_lock_token(token):
+    """Strips the angle brackets and the opaquelocktoken scheme of a lock token"""
+    token = token.strip().strip('<>')
+    if token.startswith('opaquelocktoken:'):
+        token = token[len('opaquelocktoken:'):]
+    return token
+
+
 def rfc5987_content_disposition(file_name, disposition_type="attachment"):
     """
     Proccesses a filename that might contain unicode data, and returns it as a proper rfc 5987 compatible header
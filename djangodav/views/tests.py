@@ -21,19 +21,39 @@
 #
 # You should have received a copy of the GNU Affero General Public License
 # along with DjangoDav.  If not, see <http://www.gnu.org/licenses/>.
+import asyncio
+import errno
+import fcntl
+import os
+import shutil
+from io import BytesIO
+from tempfile import mkdtemp
+
+from lxml.builder import ElementMaker
 from lxml.etree import ElementTree
-from django.http import HttpResponse, HttpRequest, Http404
-from djangodav.acls import FullAcl
-from djangodav.locks import DummyLock
+from django.core.files import File
+from django.http import HttpResponse, HttpRequest, Http404, FileResponse
+from django.test import RequestFactory
+from djangodav.acls import DavAcl, FullAcl, ReadOnlyAcl
+from djangodav.base.properties import BaseDeadPropertyStore
+from djangodav.db.journals import DBChangeJournal
+from djangodav.aio import AsyncDavResourceMixIn, run_in_executor
+from djangodav.locks import DummyActiveLock, DummyLock
+from djangodav.multistatus import MultiStatusWriter
+from djangodav.offload import ApacheOffloadBackend, LiteSpeedOffloadBackend, NginxOffloadBackend
+from djangodav.properties import BasePropertyProvider, PropertyRegistry
 from djangodav.responses import ResponseException
 # ToDo: do not use lxml, use defusedxml to avoid XML vulnerabilities
 from lxml import etree
 
 from djangodav.base.tests.resources import MockCollection, MockObject, MissingMockCollection, MissingMockObject
+from djangodav.fs.resources import AtomicWriteFSDavResource, DummyFSDAVResource, DummyReadFSDavResource
+from djangodav.fs.usage import SQLiteUsageStore
 from djangodav.fs.tests import *
 from djangodav.utils import D, WEBDAV_NSMAP, rfc1123_date
-from djangodav.views import DavView
-from mock import Mock
+from djangodav.uploads import UploadSessionNotFound, UploadSessionStore, add_range
+from djangodav.views import AsyncDavView, DavView
+from mock import Mock, PropertyMock, call, patch
 
 
 class TestView(TestCase):
@@ -246,6 +266,251 @@ class TestView(TestCase):
             ), pretty_print=True, xml_declaration=True, encoding='utf-8')
         )
 
+    def test_propfind_streaming(self):
+        self.top_collection.get_descendants.return_value += [self.top_collection]
+        request = Mock(META={})
+        path = '/collection/'
+        v = DavView(base_url='/base/', path=path, request=request, acl_class=FullAcl)
+        v.__dict__['resource'] = self.top_collection
+        expected = v.propfind(request, path, None)
+        v.xml_streaming = True
+        v.xml_stream_chunk_size = 1
+        resp = v.propfind(request, path, None)
+        self.assertEqual(resp.status_code, 207)
+        self.assertTrue(resp.streaming)
+        chunks = list(resp.streaming_content)
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(
+            etree.tostring(etree.fromstring(b''.join(chunks)), method='c14n'),
+            etree.tostring(etree.fromstring(expected.content), method='c14n')
+        )
+
+    def assertFastMultistatus(self, resource, xbody=None, **kwargs):
+        request = Mock(META={})
+        path = resource.get_path()
+        v = DavView(base_url='/base/', path=path, request=request, acl_class=FullAcl, **kwargs)
+        v.__dict__['resource'] = resource
+        v.xml_fast_multistatus = False
+        expected = v.propfind(request, path, xbody)
+        v.xml_fast_multistatus = True
+        resp = v.propfind(request, path, xbody)
+        self.assertEqual(resp.status_code, 207)
+        if resp.streaming:
+            self.assertEqual(b''.join(resp.streaming_content), b''.join(expected.streaming_content))
+        else:
+            self.assertEqual(resp.content, expected.content)
+
+    def test_propfind_fast_multistatus(self):
+        special_object = MockObject(
+            path='/collection/a & <b>\r\n\u00e4\u20ac\U0001f600',
+            getcontentlength=1,
+            get_parent=lambda: self.top_collection
+        )
+        self.top_collection.get_descendants.return_value += [special_object, self.top_collection]
+        self.assertFastMultistatus(self.top_collection)
+        self.assertFastMultistatus(self.top_collection, xml_encoding='ascii')
+        self.assertFastMultistatus(self.top_collection, xml_encoding='iso-8859-1')
+        self.assertFastMultistatus(self.top_collection, xml_streaming=True, xml_stream_chunk_size=1)
+        self.assertFastMultistatus(self.blank_collection)
+        self.assertFastMultistatus(self.blank_collection, xml_streaming=True)
+        for body in (D.prop(D.displayname(), D.resourcetype()), D.propname()):
+            self.assertFastMultistatus(self.top_collection, etree.XPathDocumentEvaluator(
+                ElementTree(D.propfind(body)), namespaces=WEBDAV_NSMAP
+            ))
+
+    def test_multistatus_writer_empty_prop(self):
+        writer = MultiStatusWriter()
+        self.assertEqual(
+            writer.document([writer.response('/a', [])]),
+            etree.tostring(D.multistatus(D.response(
+                D.href('/a'), D.propstat(D.prop(), D.status('HTTP/1.1 200 OK'))
+            )), xml_declaration=True, encoding='utf-8')
+        )
+
+    def test_propfind_property_providers(self):
+        class SizeProvider(BasePropertyProvider):
+            properties = ('getcontentlength', 'quota')
+            get_properties = Mock(side_effect=lambda resources, names: [
+                {'getcontentlength': 7} if res.is_object else {} for res in resources
+            ])
+        provider = SizeProvider()
+        self.top_collection.get_descendants.return_value += [self.top_collection]
+        request = Mock(META={})
+        path = '/collection/'
+        v = DavView(base_url='/base/', path=path, request=request, acl_class=FullAcl, property_batch_size=2,
+                    property_providers=[provider])
+        v.__dict__['resource'] = self.top_collection
+        resp = v.propfind(request, path, etree.XPathDocumentEvaluator(ElementTree(
+            D.propfind(D.prop(D.getcontentlength(), D.displayname()))
+        ), namespaces=WEBDAV_NSMAP))
+        self.assertEqual(resp.status_code, 207)
+        self.assertEqual(resp.content, etree.tostring(D.multistatus(*[
+            D.response(
+                D.href(href),
+                D.propstat(D.prop(*props), D.status("HTTP/1.1 200 OK"))
+            ) for href, props in [
+                ('/base/collection/sub_object', [D.getcontentlength('7'), D.displayname('sub_object')]),
+                ('/base/collection/sub_colection/', [D.displayname('sub_colection')]),
+                ('/base/collection/', [D.displayname('collection')]),
+            ]
+        ]), xml_declaration=True, encoding='utf-8'))
+        # one call per batch of property_batch_size resources
+        self.assertEqual(
+            provider.get_properties.call_args_list,
+            [call([self.sub_object, self.sub_collection], ['getcontentlength']),
+             call([self.top_collection], ['getcontentlength'])]
+        )
+
+    def test_property_registry(self):
+        resource = Mock(spec=['is_collection', 'ALL_PROPS', 'displayname', 'getcontentlength'], is_collection=False,
+                        ALL_PROPS=['getcontentlength', 'resourcetype', 'displayname'], getcontentlength=1)
+        displayname = type(resource).displayname = PropertyMock(return_value='name')
+        registry = PropertyRegistry()
+        self.assertEqual(
+            registry.get_properties([resource], ['displayname', 'getetag', 'resourcetype', 'displayname']),
+            [[('displayname', 'name'), ('resourcetype', False), ('displayname', 'name')]]
+        )
+        self.assertEqual(displayname.call_count, 1)
+        self.assertEqual(
+            list(registry.iter_properties([resource])),
+            [(resource, [('getcontentlength', 1), ('resourcetype', False), ('displayname', 'name')])]
+        )
+
+    def get_property_store(self):
+        class MemoryDeadPropertyStore(BaseDeadPropertyStore):
+            props = {}
+            get_many = Mock(side_effect=lambda resources: [
+                dict(MemoryDeadPropertyStore.props.get(res.get_path(), {})) for res in resources
+            ])
+
+            def update(self, resource, set_props, remove_props):
+                props = self.props.setdefault(resource.get_path(), {})
+                for name in remove_props:
+                    props.pop(name, None)
+                props.update(set_props)
+        return MemoryDeadPropertyStore()
+
+    def proppatch(self, store, *instructions):
+        request = Mock(META={})
+        v = DavView(base_url='/base/', path=self.sub_object.get_path(), request=request, acl_class=FullAcl,
+                    property_store=store)
+        v.__dict__['resource'] = self.sub_object
+        resp = v.proppatch(request, self.sub_object.get_path(), etree.XPathDocumentEvaluator(ElementTree(
+            D.propertyupdate(*instructions)
+        ), namespaces=WEBDAV_NSMAP))
+        self.assertEqual(resp.status_code, 207)
+        return [
+            (el.find('{DAV:}prop')[0].tag, el.findtext('{DAV:}status'))
+            for el in etree.fromstring(resp.content).iter('{DAV:}propstat')
+        ]
+
+    def test_proppatch_dead_properties(self):
+        store = self.get_property_store()
+        Z = ElementMaker(namespace='urn:schemas-microsoft-com:', nsmap={'Z': 'urn:schemas-microsoft-com:'})
+        self.assertEqual(self.proppatch(
+            store,
+            D.set(D.prop(Z.Win32FileAttributes('00000020'), Z.Win32LastModifiedTime('Wed, 24 Dec 2014'))),
+            D.remove(D.prop(Z.Win32LastModifiedTime())),
+        ), [
+            ('{urn:schemas-microsoft-com:}Win32FileAttributes', 'HTTP/1.1 200 OK'),
+            ('{urn:schemas-microsoft-com:}Win32LastModifiedTime', 'HTTP/1.1 200 OK'),
+            ('{urn:schemas-microsoft-com:}Win32LastModifiedTime', 'HTTP/1.1 200 OK'),
+        ])
+        self.assertEqual(store.props, {'/collection/sub_object': {
+            '{urn:schemas-microsoft-com:}Win32FileAttributes':
+                '<Z:Win32FileAttributes xmlns:Z="urn:schemas-microsoft-com:">00000020</Z:Win32FileAttributes>'
+        }})
+        # live properties are protected, nothing is changed
+        self.assertEqual(self.proppatch(store, D.set(D.prop(D.displayname('x'), Z.Win32FileAttributes('1')))), [
+            ('{DAV:}displayname', 'HTTP/1.1 403 Forbidden'),
+            ('{urn:schemas-microsoft-com:}Win32FileAttributes', 'HTTP/1.1 424 Failed Dependency'),
+        ])
+        self.assertIn('00000020', store.props['/collection/sub_object']['{urn:schemas-microsoft-com:}Win32FileAttributes'])
+
+    def test_proppatch_insufficient_storage(self):
+        store = self.get_property_store()
+        store.update = Mock(side_effect=OSError(errno.E2BIG, 'Argument list too long'))
+        self.assertEqual(self.proppatch(store, D.set(D.prop(etree.Element('{urn:x}big'))),
+                                        D.remove(D.prop(etree.Element('{urn:x}old')))), [
+            ('{urn:x}big', 'HTTP/1.1 507 Insufficient Storage'),
+            ('{urn:x}old', 'HTTP/1.1 424 Failed Dependency'),
+        ])
+
+    def test_proppatch_without_store(self):
+        self.assertEqual(self.proppatch(None, D.set(D.prop(D.displayname('x')))), [
+            ('{DAV:}displayname', 'HTTP/1.1 200 OK'),
+        ])
+
+    def test_propfind_dead_properties(self):
+        store = self.get_property_store()
+        store.props.update({
+            '/collection/sub_object': {'{urn:x}tags': '<tags xmlns="urn:x"><tag>red &amp; blue</tag></tags>'},
+            '/collection/': {'{urn:y}p': '<y:p xmlns:y="urn:y" xmlns:D="DAV:"><D:href>/a</D:href></y:p>'},
+        })
+        self.top_collection.get_descendants.return_value += [self.top_collection]
+        self.assertFastMultistatus(self.top_collection, property_store=store)
+        self.assertFastMultistatus(self.top_collection, property_store=store, xml_streaming=True)
+        self.assertFastMultistatus(self.top_collection, etree.XPathDocumentEvaluator(ElementTree(
+            D.propfind(D.prop(D.displayname(), etree.Element('{urn:x}tags'), etree.Element('{urn:y}missing')))
+        ), namespaces=WEBDAV_NSMAP), property_store=store)
+        store.get_many.reset_mock()
+        request = Mock(META={})
+        v = DavView(base_url='/base/', path='/collection/', request=request, acl_class=FullAcl,
+                    property_store=store)
+        v.__dict__['resource'] = self.top_collection
+        resp = v.propfind(request, '/collection/', None)
+        # all dead properties of the listing are loaded at once
+        self.assertEqual(store.get_many.call_count, 1)
+        responses = etree.fromstring(resp.content).findall('{DAV:}response')
+        self.assertEqual(responses[0].find('.//{urn:x}tags/{urn:x}tag').text, 'red & blue')
+        self.assertEqual(responses[2].find('.//{urn:y}p/{DAV:}href').text, '/a')
+        self.assertEqual(len(responses[1].find('.//{DAV:}prop')), 5)
+
+    def test_has_access_memoized(self):
+        v = DavView(path='/collection/', acl_class=FullAcl)
+        v.get_access = Mock(return_value=FullAcl())
+        self.assertTrue(v.has_access(self.sub_object, 'read'))
+        self.assertTrue(v.has_access(self.sub_object, 'write'))
+        self.assertTrue(v.has_access(MockObject(path='/collection/sub_object'), 'delete'))
+        self.assertEqual(v.get_access.call_count, 1)
+
+    def test_propfind_filters_unreadable(self):
+        hidden_object = MockObject(path='/collection/sub_colection/hidden', get_parent=lambda: self.sub_collection)
+        self.top_collection.get_descendants.return_value = [
+            self.top_collection, self.sub_object, self.sub_collection, hidden_object, self.blank_collection
+        ]
+        request = Mock(META={})
+        v = DavView(base_url='/base/', path='/collection/', request=request, acl_class=FullAcl,
+                    property_batch_size=3)
+        v.__dict__['resource'] = self.top_collection
+        v.get_access_many = Mock(side_effect=lambda resources: [
+            ReadOnlyAcl(read=res.get_path() not in ('/collection/sub_colection/', '/blank_collection/'))
+            for res in resources
+        ])
+        v.get_access = Mock()
+        resp = v.propfind(request, '/collection/', None)
+        self.assertEqual(resp.status_code, 207)
+        # every check goes through get_acls
+        self.assertFalse(v.get_access.called)
+        self.assertEqual(
+            [el.text for el in etree.fromstring(resp.content).iter('{DAV:}href')],
+            ['/base/collection/', '/base/collection/sub_object']
+        )
+        # the permissions of the resource itself, then one call per batch
+        self.assertEqual([len(c[0][0]) for c in v.get_access_many.call_args_list], [1, 2, 2])
+
+    def test_propfind_fast_multistatus_invalid(self):
+        invalid_object = MockObject(
+            path='/collection/invalid\x01',
+            get_descendants=Mock(return_value=[]),
+            get_parent=lambda: self.top_collection
+        )
+        invalid_object.get_descendants.return_value += [invalid_object]
+        request = Mock(META={})
+        v = DavView(base_url='/base/', path=invalid_object.get_path(), request=request, acl_class=FullAcl)
+        v.__dict__['resource'] = invalid_object
+        self.assertRaises(ValueError, v.propfind, request, invalid_object.get_path(), None)
+
     def test_dispatch(self):
         request = Mock(
             spec=HttpRequest,
@@ -331,6 +596,274 @@ class TestView(TestCase):
         self.assertEqual(resp['Last-Modified'], "Wed, 24 Dec 2014 06:00:00 +0000")
         self.assertEqual(resp.content, "C" * 42)
 
+    def offload(self, backend, head=False, **meta):
+        path = '/dir/obj.txt'
+        resource = MockObject(path, read=Mock(), get_storage_path=Mock(return_value='/root/dir/obj.txt'), root='/root')
+        v = DavView(path=path, acl_class=FullAcl, offload_backend=backend)
+        v.__dict__['resource'] = resource
+        request = HttpRequest()
+        request.META.update(meta)
+        resp = v.get(request, path, head=head)
+        self.assertFalse(resource.read.called)
+        self.assertEqual(resp['ETag'], "0" * 40)
+        self.assertEqual(resp['Content-Type'], "text/plain")
+        return resp
+
+    def test_get_offload_nginx(self):
+        resp = self.offload(NginxOffloadBackend(prefix='/protected'))
+        self.assertEqual(resp['X-Accel-Redirect'], '/protected/dir/obj.txt')
+        self.assertEqual(resp['X-Accel-ETag'], "0" * 40)
+
+    def test_get_offload_apache(self):
+        resp = self.offload(ApacheOffloadBackend(), HTTP_RANGE='bytes=0-1')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['X-Sendfile'], '/root/dir/obj.txt')
+
+    def test_get_offload_litespeed(self):
+        resp = self.offload(LiteSpeedOffloadBackend(prefix='/files', root='/root/dir'), head=True)
+        self.assertEqual(resp['X-LiteSpeed-Location'], '/files/obj.txt')
+
+    def test_get_offload_file_name(self):
+        path = '/dir/obj.txt'
+        for name in ('/root/dir/obj.txt', 'dir/obj.txt'):
+            content = File(None, name=name)
+            resource = MockObject(path, read=Mock(return_value=content), root='/root')
+            v = DavView(path=path, acl_class=FullAcl, offload_backend=NginxOffloadBackend(prefix='/protected'))
+            v.__dict__['resource'] = resource
+            resp = v.get(HttpRequest(), path)
+            self.assertEqual(resp['X-Accel-Redirect'], '/protected/dir/obj.txt')
+        # not stored in a file, streamed
+        v.__dict__['resource'] = MockObject(path, read=Mock(side_effect=lambda: BytesIO(b'content')))
+        resp = v.get(HttpRequest(), path)
+        self.assertNotIn('X-Accel-Redirect', resp)
+        self.assertEqual(b''.join(resp.streaming_content), b'content')
+
+    def get_range(self, range, if_range=None):
+        path = '/obj.txt'
+        v = DavView(path=path, _allowed_methods=Mock(return_value=['ALL']), acl_class=FullAcl)
+        v.__dict__['resource'] = MockObject(path, getcontentlength=10, read=Mock(return_value=BytesIO(b'0123456789')))
+        request = HttpRequest()
+        request.META['HTTP_RANGE'] = range
+        if if_range:
+            request.META['HTTP_IF_RANGE'] = if_range
+        return v.get(request, path)
+
+    def test_get_range(self):
+        resp = self.get_range('bytes=2-4')
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(resp['Content-Range'], 'bytes 2-4/10')
+        self.assertEqual(resp['Content-Length'], '3')
+        self.assertEqual(resp['ETag'], "0" * 40)
+        self.assertEqual(b''.join(resp.streaming_content), b'234')
+
+    def test_get_range_to_end(self):
+        resp = self.get_range('bytes=7-')
+        self.assertEqual(resp.status_code, 206)
+        # served from the file itself, so the server's file wrapper can be used
+        self.assertIsInstance(resp, FileResponse)
+        self.assertEqual(resp['Content-Range'], 'bytes 7-9/10')
+        self.assertEqual(resp['Content-Length'], '3')
+        self.assertEqual(b''.join(resp.streaming_content), b'789')
+
+    def test_get_range_suffix(self):
+        resp = self.get_range('bytes=-3')
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(resp['Content-Range'], 'bytes 7-9/10')
+        self.assertEqual(b''.join(resp.streaming_content), b'789')
+
+    def test_get_multiple_ranges(self):
+        resp = self.get_range('bytes=0-1,5-6')
+        self.assertEqual(resp.status_code, 206)
+        content_type, boundary = resp['Content-Type'].split('; boundary=')
+        self.assertEqual(content_type, 'multipart/byteranges')
+        body = b''.join(resp.streaming_content)
+        self.assertEqual(int(resp['Content-Length']), len(body))
+        self.assertEqual(body, (
+            '\r\n--{0}\r\nContent-Type: text/plain\r\nContent-Range: bytes 0-1/10\r\n\r\n01'
+            '\r\n--{0}\r\nContent-Type: text/plain\r\nContent-Range: bytes 5-6/10\r\n\r\n56'
+            '\r\n--{0}--\r\n'
+        ).format(boundary).encode())
+
+    def test_get_range_not_satisfiable(self):
+        resp = self.get_range('bytes=20-')
+        self.assertEqual(resp.status_code, 416)
+        self.assertEqual(resp['Content-Range'], 'bytes */10')
+
+    def test_get_range_malformed(self):
+        resp = self.get_range('bytes=5-2')
+        self.assertEqual(resp.status_code, 200)
+
+    def test_get_if_range(self):
+        resp = self.get_range('bytes=2-4', if_range='"%s"' % ("0" * 40))
+        self.assertEqual(resp.status_code, 206)
+        resp = self.get_range('bytes=2-4', if_range='"changed"')
+        self.assertEqual(resp.status_code, 200)
+        resp = self.get_range('bytes=2-4', if_range='Wed, 24 Dec 2014 06:00:00 GMT')
+        self.assertEqual(resp.status_code, 206)
+        resp = self.get_range('bytes=2-4', if_range='Thu, 25 Dec 2014 06:00:00 GMT')
+        self.assertEqual(resp.status_code, 200)
+
+    def check_preconditions(self, resource, method='GET', **meta):
+        v = DavView(path=resource.get_path(), base_url='/base', acl_class=FullAcl, lock_class=DummyLock,
+                    resource_class=Mock(return_value=self.sub_object))
+        v.__dict__['resource'] = resource
+        request = HttpRequest()
+        request.method = method
+        request.META.update(meta)
+        try:
+            v.check_preconditions(request)
+        except ResponseException as e:
+            return e.response.status_code
+
+    def test_if_none_match(self):
+        etag = '"%s"' % ("0" * 40)
+        self.assertEqual(self.check_preconditions(self.sub_object, HTTP_IF_NONE_MATCH=etag), 304)
+        self.assertEqual(self.check_preconditions(self.sub_object, HTTP_IF_NONE_MATCH='"a", W/%s' % etag), 304)
+        self.assertEqual(self.check_preconditions(self.sub_object, 'PUT', HTTP_IF_NONE_MATCH=etag), 412)
+        self.assertIsNone(self.check_preconditions(self.sub_object, HTTP_IF_NONE_MATCH='"other"'))
+        # create-only PUT
+        self.assertEqual(self.check_preconditions(self.sub_object, 'PUT', HTTP_IF_NONE_MATCH='*'), 412)
+        self.assertIsNone(self.check_preconditions(self.missing_sub_object, 'PUT', HTTP_IF_NONE_MATCH='*'))
+
+    def test_if_match(self):
+        etag = '"%s"' % ("0" * 40)
+        self.assertIsNone(self.check_preconditions(self.sub_object, 'PUT', HTTP_IF_MATCH=etag))
+        self.assertIsNone(self.check_preconditions(self.sub_object, 'PUT', HTTP_IF_MATCH='*'))
+        self.assertEqual(self.check_preconditions(self.sub_object, 'PUT', HTTP_IF_MATCH='"other"'), 412)
+        self.assertEqual(self.check_preconditions(self.sub_object, 'PUT', HTTP_IF_MATCH='W/%s' % etag), 412)
+        self.assertEqual(self.check_preconditions(self.missing_sub_object, 'PUT', HTTP_IF_MATCH='*'), 412)
+
+    def test_if_modified_since(self):
+        self.assertEqual(self.check_preconditions(
+            self.sub_object, HTTP_IF_MODIFIED_SINCE='Wed, 24 Dec 2014 06:00:00 GMT'), 304)
+        self.assertIsNone(self.check_preconditions(
+            self.sub_object, HTTP_IF_MODIFIED_SINCE='Tue, 23 Dec 2014 06:00:00 GMT'))
+        # only applies to GET and HEAD
+        self.assertIsNone(self.check_preconditions(
+            self.sub_object, 'PUT', HTTP_IF_MODIFIED_SINCE='Wed, 24 Dec 2014 06:00:00 GMT'))
+
+    def test_if_unmodified_since(self):
+        self.assertEqual(self.check_preconditions(
+            self.sub_object, 'DELETE', HTTP_IF_UNMODIFIED_SINCE='Tue, 23 Dec 2014 06:00:00 GMT'), 412)
+        self.assertIsNone(self.check_preconditions(
+            self.sub_object, 'DELETE', HTTP_IF_UNMODIFIED_SINCE='Wed, 24 Dec 2014 06:00:00 GMT'))
+
+    def test_if_header(self):
+        etag = "0" * 40
+        self.assertIsNone(self.check_preconditions(self.sub_object, 'PUT', HTTP_IF='(["%s"])' % etag))
+        self.assertEqual(self.check_preconditions(self.sub_object, 'PUT', HTTP_IF='(["other"])'), 412)
+        self.assertIsNone(self.check_preconditions(self.sub_object, 'PUT', HTTP_IF='(<DAV:no-lock>) (Not <DAV:no-lock>)'))
+        self.assertEqual(self.check_preconditions(self.sub_object, 'PUT', HTTP_IF='(<DAV:no-lock>)'), 412)
+        self.assertIsNone(self.check_preconditions(
+            self.sub_collection, 'MOVE', HTTP_IF='</base/collection/sub_object> (<opaquelocktoken:1234> ["%s"])' % etag))
+        self.assertEqual(self.check_preconditions(
+            self.sub_collection, 'MOVE', HTTP_IF='<http://other/collection/sub_object> (<opaquelocktoken:1234>)'), 412)
+        self.assertEqual(self.check_preconditions(self.sub_object, 'PUT', HTTP_IF='(Not)'), 400)
+
+    def test_dispatch_not_modified(self):
+        request = HttpRequest()
+        request.method = 'GET'
+        request.META['PATH_INFO'] = '/base/collection/sub_object'
+        request.META['HTTP_IF_NONE_MATCH'] = '"%s"' % ("0" * 40)
+        v = DavView(request=request, acl_class=FullAcl, get=Mock())
+        v.__dict__['resource'] = self.sub_object
+        resp = v.dispatch(request, '/collection/sub_object')
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp['ETag'], "0" * 40)
+        self.assertFalse(v.get.called)
+
+    def test_dispatch_preconditions_without_access(self):
+        for meta, resource in (
+                ({'HTTP_IF_NONE_MATCH': '"%s"' % ("0" * 40)}, self.sub_object),
+                ({'HTTP_IF_MATCH': '*'}, self.sub_object),
+                ({'HTTP_IF_MATCH': '*'}, self.missing_sub_object)):
+            request = HttpRequest()
+            request.method = 'GET'
+            request.META['PATH_INFO'] = '/base' + resource.get_path()
+            request.META.update(meta)
+            v = DavView(request=request, acl_class=DavAcl, get_access=Mock(return_value=DavAcl()), get=Mock())
+            v.__dict__['resource'] = resource
+            resp = v.dispatch(request, resource.get_path())
+            self.assertEqual(resp.status_code, 403)
+            self.assertNotIn('ETag', resp)
+            self.assertFalse(v.get.called)
+
+    def check_locks(self, method, lock_class, **meta):
+        v = DavView(path='/collection/sub_object', base_url='/base', acl_class=FullAcl, lock_class=lock_class,
+                    resource_class=Mock(return_value=self.sub_object))
+        v.__dict__['resource'] = self.sub_object
+        request = HttpRequest()
+        request.method = method
+        request.META.update(meta)
+        try:
+            v.check_locks(request)
+        except ResponseException as e:
+            return e.response.status_code
+
+    def test_check_locks(self):
+        lock_class = Mock()
+        lock_class.return_value.can_write.return_value = True
+        self.assertIsNone(self.check_locks('PUT', lock_class, HTTP_IF='(<opaquelocktoken:1234>) (Not <opaquelocktoken:5678>)'))
+        lock_class.return_value.can_write.assert_called_once_with(['1234'], recursive=False)
+        lock_class.return_value.can_write.return_value = False
+        self.assertEqual(self.check_locks('DELETE', lock_class), 423)
+        lock_class.return_value.can_write.assert_called_with([], recursive=True)
+
+    def test_check_locks_destination(self):
+        lock_class = Mock()
+        lock_class.return_value.can_write.return_value = True
+        self.check_locks('COPY', lock_class, HTTP_DESTINATION='http://testserver/base/other')
+        self.assertEqual(lock_class.return_value.can_write.call_count, 1)
+        self.check_locks('MOVE', lock_class, HTTP_DESTINATION='http://testserver/base/other')
+        self.assertEqual(lock_class.return_value.can_write.call_count, 3)
+
+    def test_check_locks_without_access(self):
+        lock_class = Mock()
+        lock_class.return_value.can_write.return_value = False
+        with patch.object(DavView, 'get_access', Mock(return_value=ReadOnlyAcl())):
+            self.assertEqual(self.check_locks('DELETE', lock_class), 403)
+        self.assertFalse(lock_class.return_value.can_write.called)
+
+    def test_check_locks_dummy(self):
+        self.assertIsNone(self.check_locks('PUT', DummyLock))
+
+    def test_get_lock_timeout(self):
+        v = DavView()
+        request = HttpRequest()
+        self.assertEqual(v.get_lock_timeout(request), 600)
+        request.META['HTTP_TIMEOUT'] = 'Second-3600'
+        self.assertEqual(v.get_lock_timeout(request), 3600)
+        request.META['HTTP_TIMEOUT'] = 'Infinite, Second-4100000000'
+        self.assertEqual(v.get_lock_timeout(request), v.max_lock_timeout)
+        request.META['HTTP_TIMEOUT'] = 'Seconds-60'
+        self.assertEqual(v.get_lock_timeout(request), 60)
+        request.META['HTTP_TIMEOUT'] = 'Minute-1'
+        with self.assertRaises(ResponseException):
+            v.get_lock_timeout(request)
+
+    def test_lock_refresh(self):
+        lock_class = Mock()
+        lock_class.return_value.refresh.side_effect = lambda token, timeout: (
+            DummyActiveLock('1234', 'shared', 'write', 0, 'me', timeout) if token == '1234' else None
+        )
+        v = DavView(path='/collection/sub_object', base_url='/base', acl_class=FullAcl, lock_class=lock_class)
+        v.__dict__['resource'] = self.sub_object
+        request = HttpRequest()
+        request.META.update(HTTP_IF='(<opaquelocktoken:5678>) (<opaquelocktoken:1234>)', HTTP_TIMEOUT='Second-60')
+        resp = v.lock(request, '/collection/sub_object')
+        self.assertEqual(resp.status_code, 200)
+        tree = etree.fromstring(resp.content)
+        self.assertEqual(tree.findtext('{DAV:}timeout'), 'Second-60')
+        self.assertEqual(tree.findtext('{DAV:}locktoken/{DAV:}href'), 'opaquelocktoken:1234')
+        self.assertIsNotNone(tree.find('{DAV:}lockscope/{DAV:}shared'))
+        self.assertEqual(tree.findtext('{DAV:}owner'), 'me')
+        self.assertEqual(lock_class.return_value.refresh.call_args_list, [call('5678', 60), call('1234', 60)])
+
+        request.META['HTTP_IF'] = '(<opaquelocktoken:5678>)'
+        self.assertEqual(v.lock(request, '/collection/sub_object').status_code, 412)
+        del request.META['HTTP_IF']
+        self.assertEqual(v.lock(request, '/collection/sub_object').status_code, 400)
+
     @patch('django.views.generic.TemplateView.get', Mock(return_value=HttpResponse('listing')))
     def test_head_object(self):
         path = '/object.txt'
@@ -380,6 +913,426 @@ class TestView(TestCase):
         self.sub_object.write.assert_called_with(request)
         self.assertEqual(204, resp.status_code)
 
+    def upload_request(self, method, session_id=None, body=b'', **meta):
+        request = HttpRequest()
+        request.method = method
+        request._stream = BytesIO(body)
+        request.META.update(meta)
+        if session_id:
+            request.META['HTTP_X_UPLOAD_SESSION'] = session_id
+        return request
+
+    def upload_view(self, path):
+        root = mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        os.mkdir(os.path.join(root, 'uploads'))
+
+        class FSDavResource(DummyFSDAVResource):
+            pass
+        FSDavResource.root = root
+        v = DavView(path=path, acl_class=FullAcl, lock_class=DummyLock, resource_class=FSDavResource,
+                    upload_session_store=UploadSessionStore(os.path.join(root, 'uploads')))
+        return v, root
+
+    def test_upload_session(self):
+        v, root = self.upload_view('/file')
+        resp = v.post(self.upload_request('POST', HTTP_X_UPLOAD_LENGTH='10'), '/file')
+        self.assertEqual(resp.status_code, 201)
+        session_id = resp['X-Upload-Session']
+
+        # chunks out of order
+        resp = v.put(self.upload_request('PUT', session_id, b'6789', HTTP_CONTENT_RANGE='bytes 6-9/10'), '/file')
+        self.assertEqual(resp.status_code, 204)
+        self.assertEqual(resp['X-Upload-Ranges'], '6-9')
+        resp = v.put(self.upload_request('PUT', session_id, b'012', HTTP_CONTENT_RANGE='bytes 0-2/10'), '/file')
+        self.assertEqual(resp['X-Upload-Ranges'], '0-2,6-9')
+
+        resp = v.post(self.upload_request('POST', session_id), '/file')
+        self.assertEqual(resp.status_code, 409)
+        self.assertEqual(resp['X-Upload-Ranges'], '0-2,6-9')
+        self.assertFalse(os.path.exists(os.path.join(root, 'file')))
+
+        v.put(self.upload_request('PUT', session_id, b'345', HTTP_CONTENT_RANGE='bytes 3-5/*'), '/file')
+        resp = v.post(self.upload_request('POST', session_id), '/file')
+        self.assertEqual(resp.status_code, 201)
+        with open(os.path.join(root, 'file'), 'rb') as f:
+            self.assertEqual(f.read(), b'0123456789')
+        self.assertEqual(os.listdir(os.path.join(root, 'uploads')), [])
+        with self.assertRaises(Http404):
+            v.post(self.upload_request('POST', session_id), '/file')
+
+    def quota_view(self, quota):
+        root, database = mkdtemp(), mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        self.addCleanup(shutil.rmtree, database)
+        os.mkdir(os.path.join(root, 'dir'))
+
+        class FSDavResource(DummyFSDAVResource):
+            pass
+        FSDavResource.root = root
+        store = SQLiteUsageStore(os.path.join(database, 'usage.sqlite3'), quota=quota)
+        view = DavView.as_view(resource_class=FSDavResource, acl_class=FullAcl, lock_class=DummyLock,
+                               usage_store=store)
+
+        def request(method, path, body=b'', **meta):
+            return view(RequestFactory().generic(method, '/base' + path, body, **meta), path=path)
+        return request, store, FSDavResource
+
+    def test_quota(self):
+        request, store, resource_class = self.quota_view(100)
+        self.assertEqual(request('PUT', '/dir/a', b'x' * 60).status_code, 201)
+        self.assertEqual(store.get_counters(['/', '/dir']), {'/': (60, 1, None), '/dir': (60, 1, None)})
+
+        # rejected before the content is written
+        with patch.object(resource_class, 'write') as write:
+            self.assertEqual(request('PUT', '/dir/b', b'x' * 50).status_code, 507)
+        self.assertFalse(write.called)
+        self.assertEqual(request('PUT', '/dir/a', b'x' * 90).status_code, 204)
+        self.assertEqual(request('PUT', '/dir/a', b'x' * 30).status_code, 204)
+        self.assertEqual(store.get_counters(['/']), {'/': (30, 1, None)})
+
+        self.assertEqual(request('COPY', '/dir/', HTTP_DESTINATION='http://testserver/base/copy/').status_code, 201)
+        self.assertEqual(request('MOVE', '/copy/', HTTP_DESTINATION='http://testserver/base/moved/').status_code, 201)
+        self.assertEqual(store.get_counters(['/', '/dir', '/copy', '/moved']), {
+            '/': (60, 2, None), '/dir': (30, 1, None), '/moved': (30, 1, None)
+        })
+        self.assertEqual(request('COPY', '/dir/', HTTP_DESTINATION='http://testserver/base/copy/').status_code, 201)
+        self.assertEqual(request('COPY', '/dir/', HTTP_DESTINATION='http://testserver/base/copy2/').status_code, 507)
+
+        resp = request('PROPFIND', '/', etree.tostring(D.propfind(D.prop(
+            D('quota-used-bytes'), D('quota-available-bytes')
+        ))), content_type='text/xml', HTTP_DEPTH='1')
+        self.assertEqual(resp.status_code, 207)
+        props = dict(
+            (el.findtext('{DAV:}href'), (el.findtext('.//{DAV:}quota-used-bytes'),
+                                         el.findtext('.//{DAV:}quota-available-bytes')))
+            for el in etree.fromstring(resp.content).iter('{DAV:}response')
+        )
+        self.assertEqual(props['/base/'], ('90', '10'))
+        self.assertEqual(props['/base/moved/'], ('30', '10'))
+
+        self.assertEqual(request('DELETE', '/moved/').status_code, 204)
+        self.assertEqual(request('DELETE', '/copy/a').status_code, 204)
+        self.assertEqual(store.get_counters(['/', '/copy', '/moved']), {'/': (30, 1, None), '/copy': (0, 0, None)})
+
+        store.set_quota(resource_class('/dir/'), 35)
+        self.assertEqual(request('PUT', '/dir/b', b'x' * 10).status_code, 507)
+        self.assertEqual(request('PUT', '/copy/b', b'x' * 10).status_code, 201)
+        # moving or copying into the collection counts against its quota, moving within it does not
+        self.assertEqual(request('MOVE', '/copy/b', HTTP_DESTINATION='http://testserver/base/dir/b').status_code, 507)
+        self.assertEqual(request('COPY', '/copy/b', HTTP_DESTINATION='http://testserver/base/dir/b').status_code, 507)
+        self.assertEqual(request('MOVE', '/dir/a', HTTP_DESTINATION='http://testserver/base/dir/c').status_code, 201)
+        self.assertEqual(store.get_counters(['/', '/copy', '/dir']), {
+            '/': (40, 2, None), '/copy': (10, 1, None), '/dir': (30, 1, 35)
+        })
+
+    def test_atomic_write_temp_files_refused(self):
+        root = mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        with open(os.path.join(root, '.file.x.djangodav-tmp'), 'wb') as f:
+            f.write(b'upload in progress')
+
+        class FSDavResource(DummyReadFSDavResource, AtomicWriteFSDavResource):
+            pass
+        FSDavResource.root = root
+        view = DavView.as_view(resource_class=FSDavResource, acl_class=FullAcl, lock_class=DummyLock)
+
+        def request(method, path, body=b''):
+            return view(RequestFactory().generic(method, '/base' + path, body), path=path)
+        for method in ('GET', 'PROPFIND', 'DELETE'):
+            with self.assertRaises(Http404):
+                request(method, '/.file.x.djangodav-tmp')
+        self.assertEqual(request('PUT', '/.file.x.djangodav-tmp', b'x').status_code, 403)
+        self.assertEqual(request('MKCOL', '/.dir.djangodav-tmp/').status_code, 403)
+        self.assertEqual(request('PUT', '/file', b'content').status_code, 201)
+        self.assertEqual(sorted(os.listdir(root)), ['.file.x.djangodav-tmp', 'file'])
+
+    def test_quota_chunked(self):
+        request, store, resource_class = self.quota_view(100)
+        view = DavView.as_view(resource_class=resource_class, acl_class=FullAcl, lock_class=DummyLock,
+                               usage_store=store)
+
+        def put_chunked(path, body):
+            # no Content-Length, the body is read until it ends
+            req = RequestFactory().put('/base' + path, CONTENT_LENGTH='')
+            req._stream = BytesIO(body)
+            return view(req, path=path)
+
+        self.assertEqual(request('PUT', '/dir/a', b'x' * 60).status_code, 201)
+        self.assertEqual(put_chunked('/dir/b', b'x' * 50).status_code, 507)
+        self.assertEqual(os.path.getsize(os.path.join(resource_class.root, 'dir', 'b')), 0)
+        self.assertEqual(store.get_counters(['/', '/dir']), {'/': (60, 2, None), '/dir': (60, 2, None)})
+        self.assertEqual(put_chunked('/dir/b', b'x' * 40).status_code, 204)
+        self.assertEqual(put_chunked('/dir/a', b'x' * 60).status_code, 204)
+        self.assertEqual(store.get_counters(['/']), {'/': (100, 2, None)})
+
+    def test_quota_rebuild(self):
+        request, store, resource_class = self.quota_view(None)
+        request('PUT', '/dir/a', b'x' * 10)
+        os.makedirs(os.path.join(resource_class.root, 'dir', 'sub'))
+        with open(os.path.join(resource_class.root, 'dir', 'sub', 'b'), 'wb') as f:
+            f.write(b'x' * 5)
+        store.rebuild(resource_class('/dir/'))
+        self.assertEqual(store.get_counters(['/', '/dir', '/dir/sub']), {
+            '/': (15, 2, None), '/dir': (15, 2, None), '/dir/sub': (5, 1, None)
+        })
+        self.assertEqual(store.get_available_bytes([resource_class('/dir/')]), [None])
+
+    def sync_view(self, **initkwargs):
+        root = mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        os.mkdir(os.path.join(root, 'dir'))
+        with open(os.path.join(root, 'old'), 'wb') as f:
+            f.write(b'old')
+
+        class FSDavResource(DummyFSDAVResource):
+            pass
+        FSDavResource.root = root
+        view = DavView.as_view(resource_class=FSDavResource, acl_class=FullAcl, lock_class=DummyLock, **initkwargs)
+
+        def request(method, path, body=b'', **meta):
+            return view(RequestFactory().generic(method, '/base' + path, body, **meta), path=path)
+
+        def sync(token='', level='1', limit=None):
+            body = D('sync-collection', D('sync-token', token), D('sync-level', level), D.prop(D.getcontentlength()))
+            if limit is not None:
+                body.append(D.limit(D.nresults(str(limit))))
+            resp = request('REPORT', '/', etree.tostring(body), content_type='text/xml')
+            if resp.status_code != 207:
+                return resp.status_code, resp.content, None
+            tree = etree.fromstring(resp.content)
+            return sorted(
+                (el.findtext('{DAV:}href'), el.findtext('{DAV:}status') or el.findtext('.//{DAV:}status'))
+                for el in tree.iter('{DAV:}response')
+            ), tree.findtext('{DAV:}sync-token'), resp
+        return request, sync
+
+    def test_sync_collection(self):
+        journal = DBChangeJournal()
+        initial_token = journal.get_token(journal.get_sequence())
+        request, sync = self.sync_view(change_journal=journal)
+        responses, token, resp = sync()
+        self.assertEqual(responses, [
+            ('/base/dir/', 'HTTP/1.1 200 OK'), ('/base/old', 'HTTP/1.1 200 OK')
+        ])
+        self.assertEqual(token, initial_token)
+        self.assertIn(b'<D:getcontentlength>3</D:getcontentlength>', resp.content)
+
+        request('PUT', '/dir/a', b'a')
+        request('MKCOL', '/new/')
+        request('DELETE', '/old')
+        request('PROPFIND', '/')
+        responses, token, resp = sync(token)
+        self.assertEqual(responses, [('/base/new/', 'HTTP/1.1 200 OK'), ('/base/old', 'HTTP/1.1 404 Not Found')])
+        self.assertEqual(token, journal.get_token(journal.get_sequence()))
+        self.assertEqual(sync(token)[0], [])
+
+        request('MOVE', '/new/', HTTP_DESTINATION='http://testserver/base/moved/')
+        self.assertEqual(sync(token)[0], [
+            ('/base/moved/', 'HTTP/1.1 200 OK'), ('/base/new/', 'HTTP/1.1 404 Not Found')
+        ])
+        self.assertEqual(sync(initial_token, level='infinite')[0], [
+            ('/base/dir/a', 'HTTP/1.1 200 OK'), ('/base/moved/', 'HTTP/1.1 200 OK'),
+            ('/base/new/', 'HTTP/1.1 404 Not Found'), ('/base/old', 'HTTP/1.1 404 Not Found'),
+        ])
+
+    def test_sync_collection_removed(self):
+        request, sync = self.sync_view(change_journal=DBChangeJournal())
+        request('PUT', '/dir/x', b'x')
+        request('MKCOL', '/dir/sub/')
+        request('PUT', '/dir/sub/y', b'y')
+        request('MKCOL', '/other/')
+        request('PUT', '/other/z', b'z')
+        token = sync(level='infinite')[1]
+
+        def delete(resource):
+            # everything but /dir/sub/y is removed
+            os.remove(os.path.join(resource.get_abs_path(), 'x'))
+            return [(resource.__class__('/dir/sub/y'), PermissionError())]
+        with patch.object(DummyFSDAVResource, 'delete', autospec=True, side_effect=delete):
+            self.assertEqual(request('DELETE', '/dir/').status_code, 207)
+        self.assertEqual(sync(token, level='infinite')[0], [('/base/dir/x', 'HTTP/1.1 404 Not Found')])
+
+        # the members of a replaced destination missing from the copy are deleted
+        token = sync(token, level='infinite')[1]
+        self.assertEqual(request('COPY', '/dir/', HTTP_DESTINATION='http://testserver/base/other/',
+                                 HTTP_DEPTH='infinity').status_code, 204)
+        self.assertEqual(sync(token, level='infinite')[0], [
+            ('/base/other/', 'HTTP/1.1 200 OK'), ('/base/other/sub/', 'HTTP/1.1 200 OK'),
+            ('/base/other/sub/y', 'HTTP/1.1 200 OK'), ('/base/other/z', 'HTTP/1.1 404 Not Found')
+        ])
+
+    def test_sync_collection_limit(self):
+        request, sync = self.sync_view(change_journal=DBChangeJournal())
+        token = sync()[1]
+        for name in ('a', 'b', 'c'):
+            request('PUT', '/' + name, b'x')
+        responses, token, resp = sync(token, limit=2)
+        self.assertEqual(responses, [
+            ('/base/', 'HTTP/1.1 507 Insufficient Storage'), ('/base/a', 'HTTP/1.1 200 OK'),
+            ('/base/b', 'HTTP/1.1 200 OK')
+        ])
+        # nothing fits, the token is kept
+        responses, zero_token, resp = sync(token, limit=0)
+        self.assertEqual(responses, [('/base/', 'HTTP/1.1 507 Insufficient Storage')])
+        self.assertEqual(zero_token, token)
+        self.assertEqual(sync(token, limit=2)[0], [('/base/c', 'HTTP/1.1 200 OK')])
+
+    def test_sync_collection_initial_limit(self):
+        request, sync = self.sync_view(change_journal=DBChangeJournal())
+        responses, token, resp = sync(limit=0)
+        self.assertEqual(responses, [('/base/', 'HTTP/1.1 507 Insufficient Storage')])
+        responses, token, resp = sync(token, limit=1)
+        self.assertEqual(responses, [
+            ('/base/', 'HTTP/1.1 507 Insufficient Storage'), ('/base/dir/', 'HTTP/1.1 200 OK')
+        ])
+        request('PUT', '/a', b'x')
+        # the listing continues after the last member reported, the new member is reported by the next sync
+        responses, token, resp = sync(token, limit=1)
+        self.assertEqual(responses, [('/base/old', 'HTTP/1.1 200 OK')])
+        self.assertEqual(sync(token)[0], [('/base/a', 'HTTP/1.1 200 OK')])
+
+    def test_sync_collection_invalid(self):
+        journal = DBChangeJournal()
+        request, sync = self.sync_view(change_journal=journal)
+        status, content, _ = sync(journal.get_token(journal.get_sequence() + 1))
+        self.assertEqual(status, 403)
+        self.assertIn(b'valid-sync-token', content)
+        self.assertEqual(sync(level='2')[0], 400)
+        request, sync = self.sync_view()
+        self.assertEqual(sync()[0], 405)
+
+    def test_upload_session_invalid_chunk(self):
+        v, root = self.upload_view('/file')
+        session_id = v.post(self.upload_request('POST', HTTP_X_UPLOAD_LENGTH='10'), '/file')['X-Upload-Session']
+        resp = v.put(self.upload_request('PUT', session_id, b'x', HTTP_CONTENT_RANGE='bytes 10-10/11'), '/file')
+        self.assertEqual(resp.status_code, 416)
+        resp = v.put(self.upload_request('PUT', session_id, b'x', HTTP_CONTENT_RANGE='bytes 1-0/10'), '/file')
+        self.assertEqual(resp.status_code, 400)
+        with self.assertRaises(Http404):
+            v.put(self.upload_request('PUT', '../../etc', b'x', HTTP_CONTENT_RANGE='bytes 0-0/10'), '/file')
+
+    def test_upload_session_committed(self):
+        v, root = self.upload_view('/file')
+        session_id = v.post(self.upload_request('POST', HTTP_X_UPLOAD_LENGTH='2'), '/file')['X-Upload-Session']
+        session = v.upload_session_store.get(session_id)
+        chunks = [b'01']
+
+        def read(size):
+            # the chunk is written under a shared lock, a commit has to wait for it
+            with open(session.meta_path) as f:
+                with self.assertRaises(BlockingIOError):
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return chunks.pop() if chunks else b''
+        stream = Mock(read=Mock(side_effect=read))
+        self.assertEqual(session.write(stream, 0, 1), [[0, 2]])
+        self.assertEqual(v.post(self.upload_request('POST', session_id), '/file').status_code, 201)
+
+        # a late chunk of the committed session
+        with patch.object(DavView, 'get_upload_session', Mock(return_value=session)):
+            resp = v.put(self.upload_request('PUT', session_id, b'x', HTTP_CONTENT_RANGE='bytes 0-0/2'), '/file')
+            self.assertEqual(resp.status_code, 409)
+            self.assertEqual(v.post(self.upload_request('POST', session_id), '/file').status_code, 409)
+        self.assertRaises(UploadSessionNotFound, session.write, BytesIO(b'x'), 0, 0)
+        with open(os.path.join(root, 'file'), 'rb') as f:
+            self.assertEqual(f.read(), b'01')
+
+    def test_upload_session_disabled(self):
+        v = DavView(path='/file', acl_class=FullAcl)
+        self.assertNotIn('POST', v._allowed_methods())
+        v.upload_session_store = Mock()
+        self.assertIn('POST', v._allowed_methods())
+
+    def test_upload_session_expire(self):
+        root = mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        store = UploadSessionStore(root, max_age=60)
+        old = store.create('/old', 10)
+        os.utime(old.meta_path, (0, 0))
+        new = store.create('/new', 10)
+        self.assertIsNone(store.get(old.session_id))
+        self.assertEqual(store.get(new.session_id).path, '/new')
+        self.assertEqual(sorted(os.listdir(root)), sorted([new.session_id + '.data', new.session_id + '.json']))
+
+    def test_add_range(self):
+        self.assertEqual(add_range([], 5, 10), [[5, 10]])
+        self.assertEqual(add_range([[0, 2], [8, 10]], 2, 4), [[0, 4], [8, 10]])
+        self.assertEqual(add_range([[0, 2], [8, 10]], 3, 8), [[0, 2], [3, 10]])
+        self.assertEqual(add_range([[0, 2], [4, 6], [8, 10]], 1, 9), [[0, 10]])
+
+    def async_request(self, request, **initkwargs):
+        root = mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        with open(os.path.join(root, 'file'), 'wb') as f:
+            f.write(b'x' * 100000)
+
+        class FSDavResource(AsyncDavResourceMixIn, DummyFSDAVResource):
+            pass
+        FSDavResource.root = root
+        view = AsyncDavView.as_view(resource_class=FSDavResource, acl_class=FullAcl, lock_class=DummyLock,
+                                    **initkwargs)
+
+        async def run():
+            response = await view(request, path=request.path[len('/base'):])
+            if response.streaming:
+                return response, b''.join([chunk async for chunk in response.streaming_content])
+            return response, response.content
+        return asyncio.run(run())
+
+    def test_async_get(self):
+        resp, content = self.async_request(RequestFactory().get('/base/file'), async_chunk_size=4096)
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.is_async)
+        self.assertEqual(content, b'x' * 100000)
+
+    def test_async_propfind(self):
+        resp, content = self.async_request(
+            RequestFactory().generic('PROPFIND', '/base/', HTTP_DEPTH='1'), xml_streaming=True)
+        self.assertEqual(resp.status_code, 207)
+        self.assertIn(b'<D:href>/base/file</D:href>', content)
+
+    def test_async_not_allowed(self):
+        resp, content = self.async_request(RequestFactory().post('/base/file'))
+        self.assertEqual(resp.status_code, 405)
+
+    def test_async_resource(self):
+        root = mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+
+        class FSDavResource(AsyncDavResourceMixIn, DummyFSDAVResource):
+            pass
+        FSDavResource.root = root
+
+        async def run():
+            resource = FSDavResource('/file')
+            self.assertFalse(await resource.aexists())
+            await resource.awrite(BytesIO(b'content'))
+            content = b''.join([chunk async for chunk in await resource.aread()])
+            children = await FSDavResource('/').aget_children()
+            return content, [child.get_path() for child in children]
+        self.assertEqual(asyncio.run(run()), (b'content', ['/file']))
+
+    def test_async_closes_old_connections(self):
+        with patch('djangodav.aio.close_old_connections') as close_old_connections:
+            self.assertEqual(asyncio.run(run_in_executor(lambda: close_old_connections.call_count)), 1)
+            self.assertEqual(close_old_connections.call_count, 2)
+            with self.assertRaises(ValueError):
+                asyncio.run(run_in_executor(int, 'x'))
+            self.assertEqual(close_old_connections.call_count, 4)
+
+    def test_delete_errors(self):
+        v = DavView(path='/collection/', base_url='/base', acl_class=FullAcl, lock_class=DummyLock)
+        self.sub_collection.delete = Mock(return_value=[
+            (self.sub_object, PermissionError()), (self.sub_collection, OSError(errno.ENOSPC, 'full'))])
+        v.__dict__['resource'] = self.sub_collection
+        resp = v.delete(HttpRequest(), '/collection/')
+        self.assertEqual(resp.status_code, 207)
+        tree = etree.fromstring(resp.content)
+        self.assertEqual(
+            [(r.findtext('{DAV:}href'), r.findtext('{DAV:}status')) for r in tree],
+            [('/base/collection/sub_object', 'HTTP/1.1 403 Forbidden'),
+             ('/base/collection/sub_colection/', 'HTTP/1.1 507 Insufficient Storage')])
+
     def test_put_collection(self):
         path = '/collection/missing_sub_object'
         v = DavView(path=path, acl_class=FullAcl, resource_class=Mock())
@@ -425,7 +1378,7 @@ class TestView(TestCase):
         v = DavView(path=target.get_path(), acl_class=FullAcl, resource_class=Mock(), lock_class=DummyLock)
         v.__dict__['resource'] = target
         request = HttpRequest()
-        target.delete = Mock()
+        target.delete = Mock(return_value=None)
         resp = v.delete(request, target.get_path())
         self.assertTrue(target.delete.called)
         self.assertEqual(204, resp.status_code)
@@ -490,6 +1443,41 @@ class TestView(TestCase):
         self.assertTrue(src.move.called)
         self.assertFalse(dst.delete.called)
 
+    def test_copy_overwrite_delete_errors(self):
+        src = self.sub_object
+        src.copy = Mock(return_value=None)
+        dst = self.blank_collection
+        dst.delete = Mock(return_value=[(self.sub_collection, PermissionError())])
+        request = HttpRequest()
+        request.META['HTTP_DESTINATION'] = "http://testserver%s" % dst.get_escaped_path()
+        request.META['SERVER_NAME'] = 'testserver'
+        request.META['SERVER_PORT'] = '80'
+        property_store = Mock(spec=BaseDeadPropertyStore)
+        v = DavView(base_url='http://testserver', request=request, path=src.get_path(), acl_class=FullAcl,
+                    lock_class=DummyLock, property_store=property_store)
+        v.resource_class = Mock(return_value=dst)
+        v.__dict__['resource'] = src
+        resp = v.copy(request, src.get_path(), None)
+        self.assertEqual(207, resp.status_code)
+        self.assertFalse(src.copy.called)
+        self.assertFalse(property_store.delete.called)
+        self.assertFalse(property_store.copy.called)
+
+    def test_move_without_lock_class(self):
+        src = self.sub_object
+        src.move = Mock(return_value=None)
+        dst = self.missing_sub_object
+        request = HttpRequest()
+        request.META['HTTP_DESTINATION'] = "http://testserver%s" % dst.get_escaped_path()
+        request.META['SERVER_NAME'] = 'testserver'
+        request.META['SERVER_PORT'] = '80'
+        v = DavView(base_url='http://testserver', request=request, path=src.get_path(), acl_class=FullAcl)
+        v.resource_class = Mock(return_value=dst)
+        v.__dict__['resource'] = src
+        resp = v.move(request, src.get_path(), None)
+        self.assertEqual(201, resp.status_code)
+        self.assertTrue(src.move.called)
+
     def test_move_overwrite(self):
         src = self.sub_object
         src.move = Mock(return_value=None)
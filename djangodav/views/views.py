@@ -1,5 +1,9 @@
-import os
+import errno
 import re
+from collections import OrderedDict
+from io import BytesIO
+from itertools import islice
+from uuid import uuid4
 
 # import urllib.parse
 from django.core.exceptions import PermissionDenied, ValidationError
@@ -18,22 +22,33 @@ from defusedxml.lxml import parse
 
 from django.conf import settings
 from django.http import HttpResponseForbidden, HttpResponseNotAllowed, HttpResponseBadRequest, \
-    HttpResponseRedirect, Http404, HttpResponse, FileResponse
+    HttpResponseRedirect, Http404, HttpResponse, FileResponse, StreamingHttpResponse
 from django.utils.decorators import method_decorator
 from django.utils.functional import cached_property
-from urllib.parse import quote as urlquote
 from django.utils.timezone import now
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import TemplateView
 
+from djangodav.aio import AsyncFileIterator, AsyncIterator, run_in_executor
+from djangodav.base.journals import BaseChangeJournal, InvalidSyncToken
+from djangodav.multistatus import MultiStatusWriter, is_supported_encoding
+from djangodav.offload import NginxOffloadBackend
+from djangodav.properties import DeadPropertyProvider, PropertyRegistry, UsagePropertyProvider
 from djangodav.responses import HttpResponsePreconditionFailed, HttpResponseCreated, HttpResponseNoContent, \
     HttpResponseConflict, HttpResponseMediatypeNotSupported, HttpResponseBadGateway, HttpResponseMultiStatus, \
-    HttpResponseLocked, ResponseException
-from djangodav.utils import WEBDAV_NSMAP, D, url_join, get_property_tag_list, rfc1123_date, rfc5987_content_disposition
+    HttpResponseLocked, ResponseException, StreamingHttpResponseMultiStatus, HttpResponseRequestedRangeNotSatisfiable, \
+    HttpResponseInsufficientStorage
+from djangodav.uploads import UploadSessionNotFound, format_ranges, parse_chunk_range
+from djangodav.utils import WEBDAV_NS, WEBDAV_NSMAP, D, url_join, make_property_tag, rfc1123_date, \
+    get_property_name, is_clark_name, serialize_property, \
+    parse_range_header, parse_time, parse_if_header, strip_etag, strip_lock_token, \
+    QuotaLimitedReader
 
 
-PATTERN_IF_DELIMITER = re.compile(r'(<([^>]+)>)|(\(([^\)]+)\))')
 PATTERN_CONTENT_RANGE=re.compile('^\s*bytes\s*([0-9]*)-.*$')
+PATTERN_LOCK_TIMEOUT = re.compile(r'^seconds?-([0-9]+)$', re.IGNORECASE)
+CONDITIONAL_HEADERS = ('HTTP_IF_MATCH', 'HTTP_IF_NONE_MATCH', 'HTTP_IF_MODIFIED_SINCE', 'HTTP_IF_UNMODIFIED_SINCE',
+                       'HTTP_IF')
 # get settings
 DJANGODAV_X_REDIRECT = getattr(settings, 'DJANGODAV_X_REDIRECT', None)
 DJANGODAV_X_REDIRECT_PREFIX = getattr(settings, 'DJANGODAV_X_REDIRECT_PREFIX', "")
@@ -47,11 +62,49 @@ class DavView(TemplateView):
     lock_class = None
     acl_class = None
     template_name = 'djangodav/index.html'
-    http_method_names = ['options', 'put', 'mkcol', 'head', 'get', 'delete', 'propfind', 'proppatch', 'copy', 'move', 'lock', 'unlock']
+    http_method_names = ['options', 'put', 'mkcol', 'head', 'get', 'delete', 'propfind', 'proppatch', 'copy', 'move', 'lock', 'unlock', 'post', 'report']
     server_header = 'DjangoDav'
 
     xml_pretty_print = False
     xml_encoding = 'utf-8'
+    # stream multistatus bodies (PROPFIND) instead of building the whole tree in memory
+    xml_streaming = False
+    xml_stream_chunk_size = 64 * 1024
+    # encode PROPFIND responses with djangodav.multistatus instead of lxml elements (not with xml_pretty_print)
+    xml_fast_multistatus = True
+    # djangodav.properties.BasePropertyProvider instances evaluating properties for batches of property_batch_size
+    # resources, properties no provider supplies are read from the resources
+    property_providers = ()
+    property_batch_size = 500
+    # dead property store (see djangodav.base.properties), PROPPATCH accepts but does not store properties without
+    property_store = None
+    # usage store (see djangodav.base.usage) counting the bytes and files within collections, enforcing quotas and
+    # serving quota-used-bytes and quota-available-bytes
+    usage_store = None
+    # change journal (see djangodav.base.journals) recording the changes of write requests, enables the
+    # sync-collection REPORT
+    change_journal = None
+    # maximum number of ranges served for a single GET, a larger Range header is ignored
+    max_ranges = 64
+    range_chunk_size = 64 * 1024
+    # methods whose preconditions (If-Match, If-None-Match, If-(Un)Modified-Since, If) are evaluated before the
+    # handler is called
+    conditional_methods = ('GET', 'HEAD', 'PUT', 'DELETE', 'COPY', 'MOVE', 'PROPPATCH')
+    # ACL flags required on the resource (on its parent for PUT and POST of a new resource) before preconditions and
+    # locks are evaluated, so that 304, 412 and 423 responses do not disclose resources to clients without access
+    required_access = {
+        'GET': ('read',), 'HEAD': ('read',), 'COPY': ('read',), 'MOVE': ('read', 'delete'), 'DELETE': ('delete',),
+        'PUT': ('write',), 'POST': ('write',), 'MKCOL': ('write',), 'PROPPATCH': ('write',),
+    }
+    # methods refused with 423 Locked if they modify a resource locked by a lock whose token is not submitted
+    locked_methods = ('PUT', 'DELETE', 'COPY', 'MOVE', 'PROPPATCH', 'MKCOL', 'POST')
+    # lock timeout in seconds if the client requests none, and the maximum granted
+    lock_timeout = 600
+    max_lock_timeout = 7 * 24 * 3600
+    # resumable chunked uploads, e.g. djangodav.uploads.UploadSessionStore('/var/tmp/dav-uploads'), see post
+    upload_session_store = None
+    # let the web server send files, see djangodav.offload (DJANGODAV_X_REDIRECT enables nginx X-Accel-Redirect)
+    offload_backend = NginxOffloadBackend(prefix=DJANGODAV_X_REDIRECT_PREFIX) if DJANGODAV_X_REDIRECT else None
 
     def no_access(self):
         return HttpResponseForbidden()
@@ -91,6 +144,10 @@ class DavView(TemplateView):
         else:
             handler = self.http_method_not_allowed
         try:
+            if request.method.upper() in self.conditional_methods:
+                self.check_preconditions(request)
+            if request.method.upper() in self.locked_methods:
+                self.check_locks(request)
             resp = handler(request, self.path, *args, **kwargs)
         except ResponseException as e:
             print(e)
@@ -130,6 +187,10 @@ class DavView(TemplateView):
             'HEAD', 'OPTIONS', 'PROPFIND', 'LOCK', 'UNLOCK',
             'GET', 'DELETE', 'PROPPATCH', 'COPY', 'MOVE', 'PUT', 'MKCOL',
         ]
+        if self.upload_session_store is not None:
+            allowed.append('POST')
+        if self.change_journal is not None:
+            allowed.append('REPORT')
 
         return allowed
 
@@ -139,8 +200,49 @@ class DavView(TemplateView):
         system."""
         return self.acl_class(read=True, full=False)
 
+    def get_access_many(self, resources):
+        """Return the DavAcl of each of the resources. Override to evaluate the permissions of a whole batch of
+        resources at once, e.g. with one query for the rules of all children of a collection."""
+        return [self.get_access(resource) for resource in resources]
+
+    @cached_property
+    def acl_cache(self):
+        return {}
+
+    def get_acls(self, resources):
+        """Return the DavAcl of each of the resources, evaluated once per path for the request."""
+        resources = list(resources)
+        missing = OrderedDict()
+        for resource in resources:
+            if resource.get_path() not in self.acl_cache:
+                missing.setdefault(resource.get_path(), resource)
+        if missing:
+            self.acl_cache.update(zip(missing, self.get_access_many(list(missing.values()))))
+        return [self.acl_cache[resource.get_path()] for resource in resources]
+
     def has_access(self, resource, method):
-        return getattr(self.get_access(resource), method)
+        return getattr(self.get_acls([resource])[0], method)
+
+    def filter_readable(self, resources):
+        """
+        Yield the resources that may be read, evaluating the permissions in batches of property_batch_size. The
+        resources within a collection that may not be read are dropped as well.
+        :param resources: resources in the order of get_descendants (collections before their members)
+        """
+        resources = iter(resources)
+        hidden = set()
+        while True:
+            batch = list(islice(resources, self.property_batch_size))
+            if not batch:
+                return
+            for resource, acl in zip(batch, self.get_acls(batch)):
+                if any('/'.join(resource.path[:i]) in hidden for i in range(len(resource.path))):
+                    continue
+                if not acl.read:
+                    if resource.is_collection:
+                        hidden.add('/'.join(resource.path))
+                    continue
+                yield resource
 
     def get_resource_kwargs(self, **kwargs):
         return kwargs
@@ -162,6 +264,223 @@ class DavView(TemplateView):
             depth = int(depth)
         return depth
 
+    def get_etag(self, resource):
+        """
+        Get the entity tag of a resource, without quotes
+        :return: the entity tag, or None if the resource does not provide one
+        """
+        try:
+            return resource.etag
+        except NotImplementedError:
+            return None
+
+    def check_access(self, request):
+        """
+        Refuse a request if the client lacks the required_access, before anything about the resource is disclosed.
+        Handlers check their permissions again.
+        :raises ResponseException: with the no_access response
+        """
+        method = request.method.upper()
+        resource = self.resource
+        if method in ('PUT', 'POST') and not resource.exists:
+            resource = resource.get_parent()
+        if not all(self.has_access(resource, flag) for flag in self.required_access.get(method, ())):
+            raise ResponseException(self.no_access())
+
+    def check_preconditions(self, request):
+        """
+        Evaluate the conditional request headers of RFC 7232 (If-Match, If-Unmodified-Since, If-None-Match,
+        If-Modified-Since) and the WebDAV If header (RFC 4918) against the current resource.
+
+        Only metadata (existence, entity tag and modification date) is used, the content is never read. Clients
+        without the required_access are refused first.
+        :param request:
+        :raises ResponseException: with a 304 Not Modified or 412 Precondition Failed response if a precondition
+                                   fails, or a 400 Bad Request response if the If header is malformed
+        """
+        meta = request.META.get
+        if not any(meta(header) for header in CONDITIONAL_HEADERS):
+            return
+        self.check_access(request)
+        safe = request.method.upper() in ('GET', 'HEAD')
+        resource = self.resource
+        exists = resource.exists
+
+        if_match = meta('HTTP_IF_MATCH')
+        if if_match:
+            if not self.etag_matches(if_match, resource, exists, weak=False):
+                raise ResponseException(HttpResponsePreconditionFailed('If-Match failed'))
+        elif exists and meta('HTTP_IF_UNMODIFIED_SINCE'):
+            timestamp = parse_time(meta('HTTP_IF_UNMODIFIED_SINCE'))
+            if timestamp is not None and parse_time(resource.getlastmodified) > timestamp:
+                raise ResponseException(HttpResponsePreconditionFailed('If-Unmodified-Since failed'))
+
+        if_none_match = meta('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            if self.etag_matches(if_none_match, resource, exists, weak=True):
+                if safe:
+                    raise ResponseException(self.build_not_modified_response())
+                raise ResponseException(HttpResponsePreconditionFailed('If-None-Match failed'))
+        elif safe and exists and meta('HTTP_IF_MODIFIED_SINCE'):
+            timestamp = parse_time(meta('HTTP_IF_MODIFIED_SINCE'))
+            if timestamp is not None and parse_time(resource.getlastmodified) <= timestamp:
+                raise ResponseException(self.build_not_modified_response())
+
+        if_header = meta('HTTP_IF')
+        if if_header:
+            try:
+                if_lists = parse_if_header(if_header)
+            except ValueError:
+                raise ResponseException(HttpResponseBadRequest('Invalid If header'))
+            if not self.evaluate_if_lists(if_lists):
+                raise ResponseException(HttpResponsePreconditionFailed('If header failed'))
+
+    def etag_matches(self, header, resource, exists, weak):
+        """
+        Check whether an If-Match or If-None-Match header matches the resource
+        :param header: list of entity tags, or *
+        :param weak: use the weak comparison function (If-None-Match), otherwise weak entity tags never match
+        :return:
+        """
+        if header.strip() == '*':
+            return exists
+        etag = self.get_etag(resource) if exists else None
+        if etag is None:
+            return False
+        for candidate in header.split(','):
+            candidate = candidate.strip()
+            if not weak and candidate.startswith('W/'):
+                continue
+            if strip_etag(candidate) == etag:
+                return True
+        return False
+
+    def build_not_modified_response(self):
+        response = HttpResponse(status=304)
+        etag = self.get_etag(self.resource)
+        if etag is not None:
+            response['ETag'] = etag
+        response['Last-Modified'] = self.resource.getlastmodified
+        return response
+
+    def evaluate_if_lists(self, if_lists):
+        """
+        Evaluate the lists of a parsed If header. The header is true if any of its lists is true, a list is true if
+        all of its conditions are.
+        :param if_lists: see djangodav.utils.parse_if_header
+        :return:
+        """
+        resources = {}
+        for tag, conditions in if_lists:
+            if tag not in resources:
+                resources[tag] = self.resource if tag is None else self.get_tagged_resource(tag)
+            resource = resources[tag]
+            if resource is None:
+                continue
+            if all(self.evaluate_if_condition(resource, *condition) for condition in conditions):
+                return True
+        return False
+
+    def get_tagged_resource(self, tag):
+        """
+        Get the resource a resource tag of the If header refers to
+        :param tag: absolute URL or path
+        :return: the resource, or None if the tag is outside of this view
+        """
+        path = urlparse.unquote(urlparse.urlparse(tag).path)
+        if not path.startswith(self.base_url):
+            return None
+        return self.get_resource(path=path[len(self.base_url):])
+
+    def evaluate_if_condition(self, resource, negated, kind, value):
+        if kind == 'etag':
+            result = resource.exists and self.get_etag(resource) == strip_etag(value)
+        elif value == 'DAV:no-lock':
+            # a state token that never represents a current lock
+            result = False
+        else:
+            result = self.lock_class is not None and self.lock_class(resource).has_token(value)
+        return result != negated
+
+    def get_submitted_tokens(self, request):
+        """
+        Get the lock tokens submitted by the client in the If header
+        :return: list of lock tokens, without the opaquelocktoken scheme
+        """
+        try:
+            if_lists = parse_if_header(request.META.get('HTTP_IF', ''))
+        except ValueError:
+            return []
+        return [
+            strip_lock_token(value)
+            for tag, conditions in if_lists
+            for negated, kind, value in conditions
+            if kind == 'token' and not negated and value != 'DAV:no-lock'
+        ]
+
+    def get_destination(self, request):
+        """
+        Get the resource the Destination header of a COPY or MOVE request refers to
+        :return: the resource, or None if the header is missing or outside of this view
+        """
+        dst = urlparse.unquote(urlparse.unquote(request.META.get('HTTP_DESTINATION', '')))
+        if not dst:
+            return None
+        return self.get_tagged_resource(dst)
+
+    def check_locks(self, request):
+        """
+        Refuse requests modifying locked resources without submitting a token of the lock in the If header.
+        Collections deleted or overwritten by a request must not contain any such locked resource either.
+        :param request:
+        :raises ResponseException: with a 423 Locked response, or the no_access response if the client lacks the
+                                   required_access
+        """
+        if self.lock_class is None:
+            return
+        self.check_access(request)
+        method = request.method.upper()
+        resources = []
+        if method in ('DELETE', 'MOVE'):
+            resources.append((self.resource, True))
+        elif method != 'COPY':
+            resources.append((self.resource, False))
+        if method in ('COPY', 'MOVE'):
+            dst = self.get_destination(request)
+            if dst is not None:
+                resources.append((dst, True))
+        tokens = self.get_submitted_tokens(request)
+        for resource, recursive in resources:
+            try:
+                allowed = self.lock_class(resource).can_write(tokens, recursive=recursive)
+            except NotImplementedError:
+                return
+            if not allowed:
+                raise ResponseException(HttpResponseLocked('Resource is locked'))
+
+    def del_locks(self, resource):
+        if self.lock_class is not None:
+            self.lock_class(resource).del_locks()
+
+    def get_lock_timeout(self, request):
+        """
+        Get the timeout of a new (or refreshed) lock from the Timeout header, e.g. "Second-600" or
+        "Infinite, Second-4100000000".
+        The first value is used and capped to max_lock_timeout.
+        :raises ResponseException: with a 400 Bad Request response if the header is malformed
+        """
+        header = request.META.get('HTTP_TIMEOUT', request.META.get('HTTP_LOCK_TIMEOUT'))
+        if not header:
+            return self.lock_timeout
+        value = header.split(',')[0].strip()
+        if value.lower() == 'infinite':
+            return self.max_lock_timeout
+        # "Seconds-600" is sent by clients following drafts of RFC 2518
+        m = PATTERN_LOCK_TIMEOUT.match(value)
+        if not m:
+            raise ResponseException(HttpResponseBadRequest('Wrong timeout'))
+        return min(int(m.group(1)), self.max_lock_timeout)
+
     def get_context_data(self, **kwargs):
         context = super(DavView, self).get_context_data(**kwargs)
         context['resource'] = self.resource
@@ -176,7 +495,7 @@ class DavView(TemplateView):
 
         If head=True, only the headers are returned
 
-        This method also handles X-Accel-Redirect headers
+        Objects are sent by the web server if an offload_backend is configured (e.g. X-Accel-Redirect of nginx)
 
         :param request:
         :param path:
@@ -215,51 +534,26 @@ class DavView(TemplateView):
             response['Content-Length'] = self.resource.getcontentlength
             response['Accept-Ranges'] = 'bytes'
             response['Cache-Control'] = 'must-revalidate'
-            
-            etags = request.META.get('HTTP_IF_NONE_MATCH',None)
-            if etags \
-                and (self.resource.etag in (e.strip(' ').strip('"') for e in etags.split(','))):
-                     response.status_code=304
-                     return response
-            if not head:
-                # not a head request, so we can actually return a response
-                if DJANGODAV_X_REDIRECT:
-                    # Using X-Accel-Redirect
-                    # create a new response that handles x-accel-redirect
-                    response = HttpResponse()
-
-                    # get the path to the requested file
-                    current_path_to_file = self.resource.read().name
-
-                    # make sure the path is relative
-                    if current_path_to_file.startswith("/"):
-                        # absolute path - convert it into a path relative to the resources root path
-                        relpath = os.path.relpath(self.resource.read().name, self.resource.root)
-                    else:
-                        # it's already a relative path, everything is fine
-                        relpath = self.resource.read().name
-
-                    # we are not allowed to send utf8 headers, so we need to make sure to quote it
-                    response['X-Accel-Redirect'] = urlquote(
-                        # join url with the DAV prefix
-                        url_join(DJANGODAV_X_REDIRECT_PREFIX, relpath)
-                    )
-                    # set the display name as the content disposition header, acting as the download name of the file
-                    response['Content-Disposition'] = rfc5987_content_disposition(self.resource.displayname)
-                    response['Content-Type'] = self.resource.content_type
-
-                    # Unfortunately, setting content-length, last-modified and etag does not work with nginx, as those
-                    # are overwritten by nginx, see https://forum.nginx.org/read.php?2,205636,205665#msg-205665
-                    # Therefore we need to set them with a prefix, e.g., X-Accel-, and handle it with nginx
-                    # add_header and $upstream_http_*
-                    response['X-Accel-Content-Length'] = self.resource.getcontentlength
-                    response['X-Accel-Last-Modified'] = self.resource.get_modified().ctime()
-                    response['X-Accel-ETag'] = self.resource.etag
-
-                    return response
+
+            storage_path = self.resource.get_storage_path() if self.offload_backend is not None else None
+            if storage_path:
+                # let the web server send the file, it also handles HEAD and Range requests
+                offload_response = self.offload_backend.build_response(self.resource, storage_path)
+                for header in ('ETag', 'Cache-Control'):
+                    offload_response[header] = response[header]
+                response = offload_response
+            elif not head:
+                # not a head request, so try to read the resource and return it in response
+                content = self.resource.read()
+                # byte ranges can only be served from content we can seek in
+                ranges = self.get_ranges(request) if hasattr(content, 'seek') else None
+                if ranges is None:
+                    response.streaming_content = content
                 else:
-                    # try to read the resource and return it in response
-                    response.streaming_content = self.resource.read()
+                    range_response = self.build_range_response(content, ranges)
+                    for header in ('ETag', 'Accept-Ranges', 'Cache-Control'):
+                        range_response[header] = response[header]
+                    response = range_response
         elif not head:
             # not a head request, and not an object -> render index.html
             response = super(DavView, self).get(request, *args, **kwargs)
@@ -269,6 +563,118 @@ class DavView(TemplateView):
 
         return response
 
+    def get_ranges(self, request):
+        """
+        Get the byte ranges requested by the Range header, honouring If-Range
+        :param request:
+        :return: list of (start, end) tuples (empty if none is satisfiable), or None if the whole resource
+                 should be sent
+        """
+        header = request.META.get('HTTP_RANGE')
+        if not header:
+            return None
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if if_range and not self.if_range_matches(if_range):
+            return None
+        ranges = parse_range_header(header, self.resource.getcontentlength)
+        if ranges is not None and len(ranges) > self.max_ranges:
+            # do not let clients make us seek around a file for too many tiny ranges
+            return None
+        return ranges
+
+    def if_range_matches(self, if_range):
+        """
+        Check whether the If-Range header (an entity tag or a HTTP date) matches the current resource
+        :param if_range:
+        :return:
+        """
+        if_range = if_range.strip()
+        if if_range.startswith('W/'):
+            # weak entity tags never match (RFC 7233 section 3.2)
+            return False
+        if if_range.startswith('"'):
+            return if_range.strip('"') == self.resource.etag
+        timestamp = parse_time(if_range)
+        return timestamp is not None and timestamp == parse_time(self.resource.getlastmodified)
+
+    def build_range_response(self, content, ranges):
+        """
+        Build a 206 Partial Content response for the given ranges of a seekable file-like content, or a 416
+        response if no range is satisfiable.
+
+        A single range is sent by seeking into the file. If it extends to the end of the file, the file itself is
+        handed to FileResponse, so that the server's file wrapper (e.g. sendfile) can still be used.
+        Multiple ranges are sent as multipart/byteranges.
+        :param content: file-like object as returned by resource.read()
+        :param ranges: list of (start, end) tuples, see get_ranges
+        :return:
+        """
+        size = self.resource.getcontentlength
+        content_type = self.resource.content_type or 'application/octet-stream'
+
+        if not ranges:
+            content.close()
+            response = HttpResponseRequestedRangeNotSatisfiable()
+            response['Content-Range'] = 'bytes */%d' % size
+            return response
+
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            content.seek(start)
+            if end == size - 1:
+                response = FileResponse(content, status=206)
+            else:
+                response = StreamingHttpResponse(self.iter_content_range(content, start, end), status=206)
+            response['Content-Type'] = content_type
+            response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, size)
+            response['Content-Length'] = end - start + 1
+            return response
+
+        boundary = uuid4().hex
+        parts = [(
+            ('\r\n--%s\r\nContent-Type: %s\r\nContent-Range: bytes %d-%d/%d\r\n\r\n' % (
+                boundary, content_type, start, end, size)).encode('ascii'),
+            start, end
+        ) for start, end in ranges]
+        closing = ('\r\n--%s--\r\n' % boundary).encode('ascii')
+        response = StreamingHttpResponse(self.iter_multipart_ranges(content, parts, closing), status=206)
+        response['Content-Type'] = 'multipart/byteranges; boundary=%s' % boundary
+        response['Content-Length'] = sum(len(head) + end - start + 1 for head, start, end in parts) + len(closing)
+        return response
+
+    def iter_content_range(self, content, start, end, close=True):
+        """
+        Yield the bytes start..end (inclusive) of a seekable file-like content in chunks
+        """
+        try:
+            content.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = content.read(min(remaining, self.range_chunk_size))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            if close:
+                content.close()
+
+    def iter_multipart_ranges(self, content, parts, closing):
+        """
+        Yield a multipart/byteranges body
+        :param content: seekable file-like object
+        :param parts: list of (part header, start, end) tuples
+        :param closing: closing boundary
+        """
+        try:
+            for head, start, end in parts:
+                yield head
+                for chunk in self.iter_content_range(content, start, end, close=False):
+                    yield chunk
+            yield closing
+        finally:
+            content.close()
+
     def head(self, request, path, *args, **kwargs):
         """
         Return just the headers
@@ -302,6 +708,10 @@ class DavView(TemplateView):
             return self.no_access()
         created = not self.resource.exists
 
+        session_id = request.META.get('HTTP_X_UPLOAD_SESSION')
+        if session_id and self.upload_session_store is not None:
+            return self.put_chunk(request, session_id)
+
         # check headers for X-File-Name
         range = request.META.get('HTTP_CONTENT_RANGE', None)
         if range == None:
@@ -310,8 +720,34 @@ class DavView(TemplateView):
             m=PATTERN_CONTENT_RANGE.match(range)
             if not m: return HttpResponseBadRequest("Invalid Content-Range")
             range_start=int(m[1])
-            
-        self.resource.write(request, range_start=range_start)
+
+        size = self.resource.getcontentlength if self.usage_store is not None and not created else 0
+        content = request
+        if self.usage_store is not None:
+            length = self.get_content_length(request)
+            if length is not None:
+                # rejected before the body is read
+                self.check_quota(self.resource, max(size, (range_start or 0) + length) - size)
+            else:
+                # the length of a chunked body is unknown, it is rejected once it no longer fits
+                available = self.usage_store.get_available_bytes([parent])[0]
+                if available is not None:
+                    content = QuotaLimitedReader(request, size + available - (range_start or 0))
+
+        try:
+            self.resource.write(content, range_start=range_start)
+        except OSError as e:
+            if content is request or e.errno != errno.EDQUOT:
+                raise
+            # whatever was written before (e.g. in place) is accounted nonetheless
+            self.resource.invalidate_listing()
+            if self.get_resource(path=self.resource.get_path()).exists:
+                self.account_write(size, created)
+                self.record_changes([self.resource], BaseChangeJournal.MODIFIED)
+            return HttpResponseInsufficientStorage('Quota exceeded')
+        self.resource.invalidate_listing()
+        self.account_write(size, created)
+        self.record_changes([self.resource], BaseChangeJournal.MODIFIED)
 
         if created:
             self.__dict__['resource'] = self.get_resource(path=self.resource.get_path())
@@ -319,6 +755,113 @@ class DavView(TemplateView):
         else:
             return HttpResponseNoContent()
 
+    def get_upload_session(self, session_id):
+        session = self.upload_session_store.get(session_id)
+        try:
+            if session is None or session.path != self.resource.get_path():
+                raise Http404("Upload session doesn't exists")
+        except UploadSessionNotFound:
+            raise Http404("Upload session doesn't exists")
+        return session
+
+    def build_upload_response(self, response_class, session_id, ranges):
+        response = response_class()
+        response['X-Upload-Session'] = session_id
+        response['X-Upload-Ranges'] = format_ranges(ranges)
+        return response
+
+    def put_chunk(self, request, session_id):
+        """
+        Write a chunk of a resumable upload, at the offset given by the Content-Range header
+        (e.g. "bytes 0-1048575/10000000"). Chunks can be sent in any order and in parallel.
+        :return: 204 No Content with the ranges received so far in the X-Upload-Ranges header, 409 Conflict if the
+                 upload was committed meanwhile
+        """
+        session = self.get_upload_session(session_id)
+        chunk_range = parse_chunk_range(request.META.get('HTTP_CONTENT_RANGE'))
+        if chunk_range is None:
+            return HttpResponseBadRequest("Invalid Content-Range")
+        start, end, length = chunk_range
+        try:
+            if end >= session.length or length not in (None, session.length):
+                return HttpResponseRequestedRangeNotSatisfiable()
+            ranges = session.write(request, start, end)
+        except UploadSessionNotFound:
+            return HttpResponseConflict("Upload session was committed")
+        return self.build_upload_response(HttpResponseNoContent, session_id, ranges)
+
+    def post(self, request, path, *args, **kwargs):
+        """
+        Resumable uploads, if an upload_session_store is configured:
+
+        * POST with an X-Upload-Length header creates an upload session for the resource, its id is returned in the
+          X-Upload-Session header
+        * PUT with the X-Upload-Session and Content-Range headers uploads a chunk, see put_chunk
+        * POST with the X-Upload-Session header commits the upload once all chunks were received, otherwise
+          409 Conflict is returned with the ranges received so far in the X-Upload-Ranges header
+        """
+        if self.upload_session_store is None:
+            return self.http_method_not_allowed(request)
+        parent = self.resource.get_parent()
+        if not parent.exists:
+            return HttpResponseConflict("Resource doesn't exists")
+        if self.resource.is_collection:
+            return HttpResponseNotAllowed(list(set(self._allowed_methods()) - set(['MKCOL', 'PUT', 'POST'])))
+        if not self.has_access(self.resource if self.resource.exists else parent, 'write'):
+            return self.no_access()
+
+        session_id = request.META.get('HTTP_X_UPLOAD_SESSION')
+        if not session_id:
+            try:
+                length = int(request.META.get('HTTP_X_UPLOAD_LENGTH', ''))
+            except ValueError:
+                return HttpResponseBadRequest("X-Upload-Length or X-Upload-Session required")
+            if length < 0:
+                return HttpResponseBadRequest("Invalid X-Upload-Length")
+            if self.usage_store is not None:
+                self.check_quota(self.resource, length - (self.resource.getcontentlength if self.resource.exists else 0))
+            session = self.upload_session_store.create(self.resource.get_path(), length)
+            return self.build_upload_response(HttpResponseCreated, session.session_id, [])
+
+        session = self.get_upload_session(session_id)
+        created = not self.resource.exists
+        size = self.resource.getcontentlength if self.usage_store is not None and not created else 0
+        try:
+            if not session.commit(self.resource):
+                return self.build_upload_response(HttpResponseConflict, session_id, session.ranges)
+        except UploadSessionNotFound:
+            return HttpResponseConflict("Upload session was committed")
+        self.resource.invalidate_listing()
+        self.account_write(size, created)
+        self.record_changes([self.resource], BaseChangeJournal.MODIFIED)
+        if created:
+            self.__dict__['resource'] = self.get_resource(path=self.resource.get_path())
+            return HttpResponseCreated()
+        return HttpResponseNoContent()
+
+    def get_content_length(self, request):
+        try:
+            return int(request.META.get('CONTENT_LENGTH', ''))
+        except ValueError:
+            return None
+
+    def check_quota(self, resource, length, source=None):
+        """
+        Check that length more bytes can be stored in resource without exceeding a quota of the usage_store, source
+        is the resource they are moved from
+        :raises ResponseException: with a 507 Insufficient Storage response otherwise
+        """
+        if not self.usage_store.can_store(resource, length, source):
+            raise ResponseException(HttpResponseInsufficientStorage('Quota exceeded'))
+
+    def account_write(self, size, created):
+        """Account the content written to the resource in the usage_store, size is its size before"""
+        if self.usage_store is None:
+            return
+        self.usage_store.add(
+            self.resource, self.get_resource(path=self.resource.get_path()).getcontentlength - size, int(created)
+        )
+
     def delete(self, request, path, *args, **kwargs):
         """
         Delete an element
@@ -332,12 +875,86 @@ class DavView(TemplateView):
             raise Http404("Resource doesn't exists")
         if not self.has_access(self.resource, 'delete'):
             return self.no_access()
-        self.lock_class(self.resource).del_locks()
-        self.resource.delete()
+        self.del_locks(self.resource)
+        usage = self.usage_store.get_usage(self.resource) if self.usage_store is not None else None
+        collection = self.resource.is_collection
+        members = self.list_members(self.resource)
+        errors = self.resource.delete()
+        self.resource.invalidate_listing()
+        if usage is not None:
+            if errors:
+                self.usage_store.rebuild(self.get_resource(path=self.resource.get_path()))
+            else:
+                self.usage_store.deleted(self.resource, usage, collection)
+        self.record_removed(self.resource, members)
+        if errors:
+            return self.build_errors_response(errors)
+        if self.property_store is not None:
+            self.property_store.delete(self.resource)
         response = HttpResponseNoContent()
         self.__dict__['resource'] = self.get_resource(path=self.resource.get_path())
         return response
 
+    def list_members(self, resource):
+        """
+        List the resource and its descendants before they are deleted or moved, for record_removed
+        :return: list of (resource, is_collection) tuples, empty without a change_journal
+        """
+        if self.change_journal is None:
+            return []
+        return [
+            (member, member.is_collection)
+            for member in resource.get_descendants(depth=-1 if resource.is_collection else 0)
+        ]
+
+    def record_removed(self, resource, members):
+        """
+        Record the deletion of the members (see list_members) of resource that no longer exist, so a delete or move
+        that failed for some of them records the paths actually removed only. A removed collection stands for its
+        members.
+        """
+        if not members:
+            return
+        current = self.get_resource(path=resource.get_path())
+        remaining = set(
+            member.get_path() for member in current.get_descendants(depth=-1)
+        ) if current.exists else set()
+        removed = [
+            (member, collection) for member, collection in members
+            if member.get_path() not in remaining and (
+                member.get_path() == resource.get_path() or member.get_parent().get_path() in remaining
+            )
+        ]
+        for collection in (False, True):
+            resources = [member for member, is_collection in removed if is_collection == collection]
+            if resources:
+                self.record_changes(resources, BaseChangeJournal.DELETED, collection)
+
+    def get_error_status(self, exception):
+        """Status line reported for a resource a COPY, MOVE or DELETE failed on"""
+        if isinstance(exception, PermissionError):
+            return 'HTTP/1.1 403 Forbidden'
+        if isinstance(exception, FileNotFoundError):
+            return 'HTTP/1.1 404 Not Found'
+        if isinstance(exception, (FileExistsError, IsADirectoryError, NotADirectoryError)):
+            return 'HTTP/1.1 409 Conflict'
+        if isinstance(exception, OSError) and exception.errno == errno.ENOSPC:
+            return 'HTTP/1.1 507 Insufficient Storage'
+        return 'HTTP/1.1 500 Internal Server Error'
+
+    def build_errors_response(self, errors):
+        """
+        Build the 207 Multi-Status response of a COPY, MOVE or DELETE that failed for some resources
+        :param errors: list of (resource, exception) tuples
+        """
+        return self.build_xml_response(D.multistatus(*[
+            D.response(
+                D.href(url_join(self.base_url, resource.get_escaped_path())),
+                D.status(self.get_error_status(exception)),
+            )
+            for resource, exception in errors
+        ]), HttpResponseMultiStatus)
+
     def mkcol(self, request, path, *args, **kwargs):
         """
         Create a new collection (a directory)
@@ -357,7 +974,9 @@ class DavView(TemplateView):
         if not self.has_access(self.resource, 'write'):
             return self.no_access()
         self.resource.create_collection()
+        self.resource.invalidate_listing()
         self.__dict__['resource'] = self.get_resource(path=self.resource.get_path())
+        self.record_changes([self.resource], BaseChangeJournal.MODIFIED)
         return HttpResponseCreated()
 
     def relocate(self, request, path, method, *args, **kwargs):
@@ -400,14 +1019,55 @@ class DavView(TemplateView):
         if not overwrite and dst.exists:
             return HttpResponsePreconditionFailed('Destination exists and overwrite False.')
         dst_exists = dst.exists
+        usage = dst_usage = None
+        collection, dst_collection = self.resource.is_collection, dst.is_collection
+        if self.usage_store is not None:
+            usage = self.usage_store.get_usage(self.resource)
+            dst_usage = self.usage_store.get_usage(dst) if dst_exists else (0, 0)
+            self.check_quota(dst, usage[0] - dst_usage[0], self.resource if method == 'move' else None)
+        members = self.list_members(self.resource) if method == 'move' else []
+        dst_members = self.list_members(dst) if dst_exists else []
         if dst_exists:
-            self.lock_class(self.resource).del_locks()
-            self.lock_class(dst).del_locks()
-            dst.delete()
+            self.del_locks(self.resource)
+            self.del_locks(dst)
+            errors = dst.delete()
+            if errors:
+                # the destination is partially deleted, the resource is not copied or moved onto it
+                dst.invalidate_listing()
+                if self.usage_store is not None:
+                    self.usage_store.rebuild(self.get_resource(path=dst.get_path()))
+                self.record_removed(dst, dst_members)
+                return self.build_errors_response(errors)
+            if self.property_store is not None:
+                self.property_store.delete(dst)
+            if self.usage_store is not None:
+                self.usage_store.deleted(dst, dst_usage, dst_collection)
         errors = getattr(self.resource, method)(dst, *args, **kwargs)
+        self.resource.invalidate_listing()
+        dst.invalidate_listing()
+        if usage is not None:
+            if errors:
+                self.usage_store.rebuild(self.get_resource(path=dst.get_path()))
+                if method == 'move':
+                    self.usage_store.rebuild(self.get_resource(path=self.resource.get_path()))
+            elif method == 'move':
+                self.usage_store.moved(self.resource, dst, usage, collection)
+            else:
+                self.usage_store.copied(self.resource, dst, usage, collection)
+        if self.change_journal is not None:
+            # the members of the replaced destination missing from the copy, and the source if it was moved
+            self.record_removed(dst, dst_members)
+            self.record_removed(self.resource, members)
+            self.record_changes(
+                self.get_resource(path=dst.get_path()).get_descendants(depth=-1), BaseChangeJournal.MODIFIED
+            )
+        if self.property_store is not None and not errors:
+            getattr(self.property_store, method)(self.resource, dst)
+        if method == 'move':
+            # locks are not moved with the resource
+            self.del_locks(self.resource)
         if errors:
-            print(errors)
-            return self.build_xml_response(response_class=HttpResponseMultiStatus) # WAT?
+            return self.build_errors_response(errors)
         if dst_exists:
             return HttpResponseNoContent()
 
@@ -446,22 +1106,17 @@ class DavView(TemplateView):
         return self.relocate(request, path, 'move')
 
     def lock(self, request, path, xbody=None, *args, **kwargs):
-        # TODO Lock refreshing
         if not self.has_access(self.resource, 'write'):
             return self.no_access()
 
         if not xbody:
-            return HttpResponseBadRequest('Lockinfo required')
+            return self.refresh_lock(request)
 
-        try:
-            depth = int(request.META.get('HTTP_DEPTH', '0'))
-        except ValueError:
+        depth = self.get_depth(default='infinity')
+        if depth == 1:
             return HttpResponseBadRequest('Wrong depth')
 
-        try:
-            timeout = int(request.META.get('HTTP_LOCK_TIMEOUT', 'Seconds-600')[len('Seconds-'):])
-        except ValueError:
-            return HttpResponseBadRequest('Wrong timeout')
+        timeout = self.get_lock_timeout(request)
 
         owner = None
         try:
@@ -492,17 +1147,46 @@ class DavView(TemplateView):
         if not token:
             return HttpResponseLocked('Already locked')
 
-        body = D.activelock(*([
-            D.locktype(locktype_obj),
-            D.lockscope(lockscope_obj),
-            D.depth(str(depth)),
+        body = self.build_activelock(locktype_obj, lockscope_obj, depth, timeout, token, owner_obj)
+        response = self.build_xml_response(body)
+        response['Lock-Token'] = '<opaquelocktoken:%s>' % token
+        return response
+
+    def refresh_lock(self, request):
+        """
+        A LOCK without body refreshes the lock whose token is submitted in the If header (RFC 4918 9.10.2), its
+        timeout starts again with the value of the Timeout header
+        :return: the activelock of the refreshed lock, 412 Precondition Failed if no submitted token refers to a lock
+                 of the resource
+        """
+        tokens = self.get_submitted_tokens(request)
+        if not tokens:
+            return HttpResponseBadRequest('Lockinfo or lock token required')
+        timeout = self.get_lock_timeout(request)
+        lock_manager = self.lock_class(self.resource)
+        for token in tokens:
+            lock = lock_manager.refresh(token, timeout)
+            if lock is not None:
+                break
+        else:
+            return self.build_xml_response(D.error(D('lock-token-matches-request-uri')),
+                                           HttpResponsePreconditionFailed)
+        return self.build_xml_response(self.build_activelock(
+            D(lock.type), D(lock.scope), lock.depth, lock.timeout, lock.token,
+            D.owner(lock.owner) if lock.owner is not None else None
+        ))
+
+    def build_activelock(self, locktype, lockscope, depth, timeout, token, owner=None):
+        """The activelock element of a lock, locktype, lockscope and owner are elements"""
+        return D.activelock(*([
+            D.locktype(locktype),
+            D.lockscope(lockscope),
+            D.depth('infinity' if depth == -1 else str(depth)),
             D.timeout("Second-%s" % timeout),
             D.locktoken(D.href('opaquelocktoken:%s' % token))]
-            + ([owner_obj] if owner_obj is not None else [])
+            + ([owner] if owner is not None else [])
         ))
 
-        return self.build_xml_response(body)
-
     def unlock(self, request, path, xbody=None, *args, **kwargss):
         if not self.has_access(self.resource, 'write'):
             return self.no_access()
@@ -521,21 +1205,36 @@ class DavView(TemplateView):
         if not self.resource.exists:
             raise Http404("Resource doesn't exists")
 
-        if not self.get_access(self.resource):
-            return self.no_access()
-
         get_all_props, get_prop, get_prop_names = True, False, False
         if xbody:
-            get_prop = [p.xpath('local-name()') for p in xbody('/D:propfind/D:prop/*')]
+            get_prop = [get_property_name(p) for p in xbody('/D:propfind/D:prop/*')]
             get_all_props = xbody('/D:propfind/D:allprop')
             get_prop_names = xbody('/D:propfind/D:propname')
             if int(bool(get_prop)) + int(bool(get_all_props)) + int(bool(get_prop_names)) != 1:
                 return HttpResponseBadRequest()
 
-        children = self.resource.get_descendants(depth=self.get_depth())
+        children = self.filter_readable(self.resource.get_descendants(depth=self.get_depth()))
+        if not get_prop_names:
+            children = self.property_registry.iter_properties(
+                children, get_prop or None, batch_size=self.property_batch_size
+            )
+
+        if self.xml_fast_multistatus and not self.xml_pretty_print and is_supported_encoding(self.xml_encoding):
+            writer = MultiStatusWriter(self.xml_encoding, streaming=self.xml_streaming)
+            if get_prop_names:
+                responses = (
+                    writer.propname_response(url_join(self.base_url, child.get_escaped_path()), child.ALL_PROPS)
+                    for child in children
+                )
+            else:
+                responses = (
+                    writer.prop_response(url_join(self.base_url, child.get_escaped_path()), props)
+                    for child, props in children
+                )
+            return self.build_multistatus_response(writer, responses)
 
         if get_prop_names:
-            responses = [
+            responses = (
                 D.response(
                     D.href(url_join(self.base_url, child.get_escaped_path())),
                     D.propstat(
@@ -546,24 +1245,38 @@ class DavView(TemplateView):
                     ),
                 )
                 for child in children
-            ]
+            )
         else:
-            responses = [
+            responses = (
                 D.response(
                     D.href(url_join(self.base_url, child.get_escaped_path())),
                     D.propstat(
-                        D.prop(
-                            *get_property_tag_list(child, *(get_prop if get_prop else child.ALL_PROPS))
-                        ),
+                        D.prop(*[
+                            make_property_tag(name, value) for name, value in props
+                        ]),
                         D.status('HTTP/1.1 200 OK'),
                     ),
                 )
-                for child in children
-            ]
+                for child, props in children
+            )
+
+        if self.xml_streaming:
+            # responses are generated lazily, so each one is serialized and sent as soon as
+            # get_descendants yields its resource
+            return self.build_xml_stream_response(D.multistatus, responses, StreamingHttpResponseMultiStatus)
 
         body = D.multistatus(*responses)
         return self.build_xml_response(body, HttpResponseMultiStatus)
 
+    @cached_property
+    def property_registry(self):
+        providers = list(self.property_providers)
+        if self.property_store is not None:
+            providers.append(DeadPropertyProvider(self.property_store))
+        if self.usage_store is not None:
+            providers.append(UsagePropertyProvider(self.usage_store))
+        return PropertyRegistry(providers)
+
     def proppatch(self, request, path, xbody, *args, **kwargs):
         if not self.resource.exists:
             raise Http404("Resource doesn't exists")
@@ -572,16 +1285,161 @@ class DavView(TemplateView):
         depth = self.get_depth(default="0")
         if depth != 0:
             return HttpResponseBadRequest('Invalid depth header value %s' % depth)
-        props = xbody('/D:propertyupdate/D:set/D:prop/*')
+        if self.property_store is None:
+            # properties are accepted, but not stored
+            statuses = [(el, 'HTTP/1.1 200 OK') for el in xbody('/D:propertyupdate/D:set/D:prop/*')]
+        else:
+            statuses = self.update_dead_properties(xbody)
         body = D.multistatus(
             D.response(
                 D.href(url_join(self.base_url, self.resource.get_escaped_path())),
                 *[D.propstat(
+                    D.status(status),
+                    D.prop(etree.Element(el.tag))
+                ) for el, status in statuses]
+            )
+        )
+        return self.build_xml_response(body, HttpResponseMultiStatus)
+
+    def update_dead_properties(self, xbody):
+        """
+        Apply the set and remove instructions of a PROPPATCH to the dead properties of the resource, all or none of
+        them: properties in the DAV: namespace are protected, if any are set or removed nothing is changed. Properties
+        exceeding the space of the store are answered with 507 Insufficient Storage
+        :return: list of (property element, status) tuples
+        """
+        set_props, remove_props, elements = OrderedDict(), [], []
+        for instruction in xbody('/D:propertyupdate/*'):
+            for el in instruction.iterfind('{%s}prop/*' % WEBDAV_NS):
+                name = get_property_name(el)
+                elements.append((el, is_clark_name(name)))
+                if instruction.tag == '{%s}set' % WEBDAV_NS:
+                    set_props[name] = serialize_property(el)
+                elif instruction.tag == '{%s}remove' % WEBDAV_NS:
+                    set_props.pop(name, None)
+                    remove_props.append(name)
+        if not all(dead for el, dead in elements):
+            return [
+                (el, 'HTTP/1.1 424 Failed Dependency' if dead else 'HTTP/1.1 403 Forbidden')
+                for el, dead in elements
+            ]
+        try:
+            self.property_store.update(self.resource, set_props, remove_props)
+        except OSError as e:
+            if e.errno not in (errno.E2BIG, errno.ENOSPC, errno.EDQUOT):
+                raise
+            # the properties do not fit (e.g. into an extended attribute)
+            return [
+                (el, 'HTTP/1.1 507 Insufficient Storage' if get_property_name(el) in set_props
+                 else 'HTTP/1.1 424 Failed Dependency')
+                for el, dead in elements
+            ]
+        self.record_changes([self.resource], BaseChangeJournal.MODIFIED)
+        return [(el, 'HTTP/1.1 200 OK') for el, dead in elements]
+
+    def record_changes(self, resources, change, collection=None):
+        """Record the change of the resources in the change_journal, collection overrides their is_collection (e.g.
+        of deleted resources)"""
+        if self.change_journal is not None:
+            self.change_journal.record(resources, change, collection)
+
+    def report(self, request, path, xbody=None, *args, **kwargs):
+        """
+        sync-collection REPORT (RFC 6578), if a change_journal is configured: without a sync token all members of the
+        collection are reported, with a token the members changed since, deleted members with 404 Not Found. The
+        changes are read from the journal, so an incremental sync does not walk the tree.
+        """
+        if self.change_journal is None:
+            return self.http_method_not_allowed(request)
+        if not self.resource.exists:
+            raise Http404("Resource doesn't exists")
+        if not self.has_access(self.resource, 'read'):
+            return self.no_access()
+        if xbody is None or not xbody('/D:sync-collection') or not self.resource.is_collection:
+            return self.build_xml_response(D.error(D('supported-report')), HttpResponseForbidden)
+        level = xbody('string(/D:sync-collection/D:sync-level)').strip()
+        if level not in ('1', 'infinite'):
+            return HttpResponseBadRequest('Invalid sync-level %s' % level)
+        infinite = level == 'infinite'
+        limit = xbody('string(/D:sync-collection/D:limit/D:nresults)').strip()
+        try:
+            limit = int(limit) if limit else None
+        except ValueError:
+            return HttpResponseBadRequest('Invalid nresults %s' % limit)
+        names = [get_property_name(p) for p in xbody('/D:sync-collection/D:prop/*')] or None
+        token = xbody('string(/D:sync-collection/D:sync-token)').strip()
+
+        truncated = False
+        deleted = []
+        try:
+            sequence, after = self.change_journal.split_token(token) if token else (None, None)
+            if sequence is not None and after is None:
+                # read before the changes, the changes recorded meanwhile are reported by the next sync
+                latest = self.change_journal.get_sequence()
+                changes = self.change_journal.get_changes(
+                    self.resource, sequence, infinite, limit + 1 if limit is not None else None
+                )
+        except InvalidSyncToken:
+            return self.build_xml_response(D.error(D('valid-sync-token')), HttpResponseForbidden)
+        if sequence is not None and after is None:
+            if limit is not None and len(changes) > limit:
+                # the token of the last change reported, the following ones are reported with it
+                changes, truncated = changes[:limit], True
+                sequence = changes[-1][3] if changes else sequence
+            else:
+                sequence = max(latest, changes[-1][3]) if changes else latest
+            members = []
+            for change_path, change, collection, change_sequence in changes:
+                member = self.get_resource(path=change_path)
+                if change == BaseChangeJournal.MODIFIED and member.exists:
+                    members.append(member)
+                else:
+                    deleted.append((change_path, collection))
+        else:
+            if sequence is None:
+                sequence = self.change_journal.get_sequence()
+            members = self.resource.get_descendants(depth=-1 if infinite else 1, include_self=False)
+            if limit is not None or after is not None:
+                # listed in the order of their paths, a truncated listing continues after the last member reported.
+                # Members changed meanwhile are reported by the following incremental syncs.
+                members = sorted(
+                    (member for member in members if after is None or member.get_path() > after),
+                    key=lambda member: member.get_path()
+                )
+                if limit is not None and len(members) > limit:
+                    members, truncated = members[:limit], True
+                    after = members[-1].get_path() if members else after or ''
+                else:
+                    after = None
+
+        responses = [
+            D.response(
+                D.href(url_join(self.base_url, member.get_escaped_path())),
+                D.propstat(
+                    D.prop(*[make_property_tag(name, value) for name, value in props]),
                     D.status('HTTP/1.1 200 OK'),
-                    D.prop(el.tag)
-                ) for el in props]
+                ),
+            )
+            for member, props in self.property_registry.iter_properties(
+                self.filter_readable(members), names, batch_size=self.property_batch_size
+            )
+        ]
+        responses.extend(
+            D.response(
+                D.href(url_join(self.base_url, *[urlparse.quote(part) for part in deleted_path.strip('/').split('/')])
+                       + ('/' if collection else '')),
+                D.status('HTTP/1.1 404 Not Found'),
             )
+            for deleted_path, collection in deleted
         )
+        if truncated:
+            responses.append(D.response(
+                D.href(url_join(self.base_url, self.resource.get_escaped_path())),
+                D.status('HTTP/1.1 507 Insufficient Storage'),
+                D.error(D('number-of-matches-within-limits')),
+            ))
+        body = D.multistatus(*responses)
+        body.append(D('sync-token', self.change_journal.get_token(sequence, after)))
         return self.build_xml_response(body, HttpResponseMultiStatus)
 
     def build_xml_response(self, tree=None, response_class=HttpResponse, **kwargs):
@@ -599,3 +1457,80 @@ class DavView(TemplateView):
             content_type='text/xml; charset="%s"' % self.xml_encoding,
             **kwargs
         )
+
+    def build_multistatus_response(self, writer, responses):
+        """
+        Build a multistatus response of responses encoded by writer (see djangodav.multistatus), streamed if
+        xml_streaming is set
+        """
+        content_type = 'text/xml; charset="%s"' % self.xml_encoding
+        if self.xml_streaming:
+            return StreamingHttpResponseMultiStatus(
+                writer.iter_chunks(responses, self.xml_stream_chunk_size), content_type=content_type
+            )
+        return HttpResponseMultiStatus(writer.document(responses), content_type=content_type)
+
+    def build_xml_stream_response(self, root, elements, response_class=StreamingHttpResponse, **kwargs):
+        """
+        Build a streaming xml response, serializing each of the given elements as a child of an
+        (empty) root element incrementally, so that only one child is held in memory at a time
+        :param root: element (or ElementMaker tag) used as the document root, e.g. D.multistatus
+        :param elements: iterable of lxml elements
+        :param response_class: a StreamingHttpResponse subclass
+        :return:
+        """
+        if callable(root):
+            root = root()
+        return response_class(
+            self.iter_xml_stream(root, elements),
+            content_type='text/xml; charset="%s"' % self.xml_encoding,
+            **kwargs
+        )
+
+    def iter_xml_stream(self, root, elements):
+        """
+        Serialize elements within root incrementally, yielding chunks of about xml_stream_chunk_size bytes
+        """
+        buf = BytesIO()
+        with etree.xmlfile(buf, encoding=self.xml_encoding) as xf:
+            xf.write_declaration()
+            with xf.element(root.tag, root.attrib, nsmap=root.nsmap):
+                for element in elements:
+                    xf.write(element, pretty_print=self.xml_pretty_print)
+                    xf.flush()
+                    if buf.tell() >= self.xml_stream_chunk_size:
+                        yield buf.getvalue()
+                        buf.seek(0)
+                        buf.truncate()
+        yield buf.getvalue()
+
+
+class AsyncDavView(DavView):
+    """
+    Async variant of DavView for ASGI deployments. The request is handled by the (blocking) DavView handlers in the
+    bounded executor of djangodav.aio, response bodies are streamed by the event loop, reading each chunk in the
+    executor. Slow file systems and slow clients therefore do not hold a worker, only short executor jobs.
+    """
+    view_is_async = True
+    # chunk size used to stream files
+    async_chunk_size = 64 * 1024
+
+    @method_decorator(csrf_exempt)
+    async def dispatch(self, request, path, *args, **kwargs):
+        response = await run_in_executor(super(AsyncDavView, self).dispatch, request, path, *args, **kwargs)
+        # async streaming content needs Django 4.2 (is_async), older versions iterate the blocking content themselves
+        if response.streaming and getattr(response, 'is_async', None) is False:
+            self.make_async_streaming(response)
+        return response
+
+    def make_async_streaming(self, response):
+        """Replace the blocking iterator of a streaming response by an async iterator running in the executor"""
+        file = getattr(response, 'file_to_stream', None)
+        if file is not None:
+            response.streaming_content = AsyncFileIterator(file, self.async_chunk_size)
+        else:
+            response.streaming_content = AsyncIterator(response.streaming_content)
+
+    def http_method_not_allowed(self, request, *args, **kwargs):
+        # handlers run synchronously in the executor, see dispatch
+        return HttpResponseNotAllowed(self._allowed_methods())
@@ -40,21 +40,21 @@ setup(
         'Development Status :: 4 - Beta',
         'Environment :: Web Environment',
         'Framework :: Django',
-        'Framework :: Django :: 1.11',
-        'Framework :: Django :: 2.0',
+        'Framework :: Django :: 2.2',
         'License :: OSI Approved :: GNU Affero General Public License v3',
         'Operating System :: OS Independent',
         'Programming Language :: Python',
-        "Programming Language :: Python :: 2.7",
-        "Programming Language :: Python :: 3.4",
-        "Programming Language :: Python :: 3.5",
-        "Programming Language :: Python :: 3.6",
+        "Programming Language :: Python :: 3",
+        "Programming Language :: Python :: 3 :: Only",
         "Programming Language :: Python :: 3.7",
+        "Programming Language :: Python :: 3.8",
+        "Programming Language :: Python :: 3.9",
         'Topic :: Software Development :: Libraries :: Python Modules'
     ],
     # ToDo: remove lxml, replace with defusedxml for security reasons!!!
-    install_requires=["lxml", "Django>=1.11.0", "defusedxml"],
-    tests_require=["Django>=1.11.0", "mock==1.0.1"],
+    python_requires=">=3.7",
+    install_requires=["lxml", "Django>=2.2", "defusedxml"],
+    tests_require=["Django>=2.2", "mock==1.0.1"],
     include_package_data=True,
     zip_safe=False,
     test_suite='runtests.runtests'